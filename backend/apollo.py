@@ -0,0 +1,183 @@
+import os
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+import metrics
+import resilience
+from cache import make_cache
+from clients import get_http_session
+from search_planner import canonical_profile_url
+
+load_dotenv()
+APOLLO_API_KEY = os.environ.get("APOLLO_API_KEY")
+APOLLO_BASE_URL = "https://api.apollo.io/api/v1"
+APOLLO_TIMEOUT = float(os.environ.get("APOLLO_TIMEOUT", 15))
+# Apollo's bulk match accepts at most 10 people per call
+APOLLO_BULK_SIZE = int(os.environ.get("APOLLO_BULK_SIZE", 10))
+
+# Found emails are kept for a long time; "not found" is re-checked sooner in case Apollo learns it
+APOLLO_CACHE_BACKEND = os.environ.get("APOLLO_CACHE_BACKEND", "sqlite")
+APOLLO_CACHE_TTL = float(os.environ.get("APOLLO_CACHE_TTL", 30 * 24 * 60 * 60))
+APOLLO_NEGATIVE_TTL = float(os.environ.get("APOLLO_NEGATIVE_TTL", 7 * 24 * 60 * 60))
+APOLLO_CACHE_SIZE = int(os.environ.get("APOLLO_CACHE_SIZE", 50000))
+APOLLO_CACHE_PATH = os.environ.get("APOLLO_CACHE_PATH", "./.cache/apollo_cache.sqlite3")
+
+logger = logging.getLogger(__name__)
+
+match_cache = make_cache(APOLLO_CACHE_BACKEND, APOLLO_CACHE_TTL, APOLLO_CACHE_SIZE,
+                         path=APOLLO_CACHE_PATH, table="apollo_matches")
+miss_cache = make_cache(APOLLO_CACHE_BACKEND, APOLLO_NEGATIVE_TTL, APOLLO_CACHE_SIZE,
+                        path=APOLLO_CACHE_PATH, table="apollo_misses")
+
+
+class ApolloError(Exception):
+    def __init__(self, status_code: int, details: str):
+        super().__init__(f"Apollo API returned {status_code}")
+        self.status_code = status_code
+        self.details = details
+
+
+def profile_key(linkedin_url: str) -> str:
+    """Cache key for a person: their canonical LinkedIn URL, so URL variants share one credit."""
+    return canonical_profile_url(linkedin_url)
+
+
+def _headers() -> dict:
+    return {
+        "accept": "application/json",
+        "Cache-Control": "no-cache",
+        "Content-Type": "application/json",
+        "x-api-key": APOLLO_API_KEY,
+    }
+
+
+def _not_sent(error: Exception) -> bool:
+    """Whether a request failed before reaching Apollo: no connection could be made."""
+    import requests
+    from urllib3.exceptions import ConnectTimeoutError
+    if not isinstance(error, requests.exceptions.ConnectionError):
+        return False
+    # requests wraps urllib3's MaxRetryError; NewConnectionError subclasses ConnectTimeoutError
+    reason = error.args[0] if error.args else None
+    return isinstance(getattr(reason, "reason", reason), ConnectTimeoutError)
+
+
+def _post(path: str, **kwargs):
+    """POST to Apollo; non-200s raise ApolloError.
+
+    Every match is billed, and a request that timed out or got a 5xx may still have been
+    served, so only requests that never reached Apollo are retried.
+    """
+    def send():
+        response = get_http_session().post(f"{APOLLO_BASE_URL}{path}", headers=_headers(),
+                                           timeout=APOLLO_TIMEOUT, **kwargs)
+        if response.status_code != 200:
+            raise ApolloError(response.status_code, response.text)
+        return response
+    return resilience.call("apollo", send, idempotent=True, deadline=APOLLO_TIMEOUT, retryable=_not_sent)
+
+
+def _cached(key: str):
+    """(hit, email) from the positive or negative cache."""
+    if match_cache is not None:
+        found = match_cache.get(key)
+        if found is not None:
+            return True, found["email"]
+    if miss_cache is not None and miss_cache.get(key) is not None:
+        return True, None
+    return False, None
+
+
+def _remember(key: str, email):
+    if email:
+        if match_cache is not None:
+            match_cache.set(key, {"email": email})
+        if miss_cache is not None:
+            miss_cache.delete(key)
+    elif miss_cache is not None:
+        miss_cache.set(key, True)
+
+
+def match_email(first_name: str, last_name: str, linkedin_url: str):
+    """Email for one person via Apollo people/match, or None. Raises ApolloError on a non-200."""
+    key = profile_key(linkedin_url)
+    hit, email = _cached(key)
+    if hit:
+        return email
+
+    params = {
+        "first_name": first_name,
+        "last_name": last_name,
+        "linkedin_url": linkedin_url,
+        "reveal_personal_emails": "true",
+        "reveal_phone_number": "false",
+    }
+    with metrics.span("apollo.match", upstream="apollo"):
+        response = _post("/people/match", params=params)
+
+    email = (response.json().get("person") or {}).get("email")
+    _remember(key, email)
+    return email
+
+
+def _bulk_match_chunk(people: list) -> list:
+    with metrics.span("apollo.bulk_match", upstream="apollo"):
+        response = _post(
+            "/people/bulk_match",
+            params={"reveal_personal_emails": "true", "reveal_phone_number": "false"},
+            json={"details": [{"first_name": p.get("first_name"), "last_name": p.get("last_name"),
+                               "linkedin_url": p["linkedin_url"]} for p in people]},
+        )
+    # Matches come back in request order, with null for people Apollo couldn't match
+    matches = response.json().get("matches") or []
+    matches += [None] * (len(people) - len(matches))
+    return [(match or {}).get("email") for match in matches[:len(people)]]
+
+
+def bulk_match_emails(people: list) -> list:
+    """Emails (or None) for many {first_name, last_name, linkedin_url} dicts, in input order.
+
+    Cached people cost nothing; the rest are deduplicated by canonical LinkedIn
+    URL and sent to Apollo's bulk match in chunks of APOLLO_BULK_SIZE, concurrently.
+    A chunk that fails raises ApolloError.
+    """
+    emails = {}
+    pending = {}
+    for person in people:
+        key = profile_key(person["linkedin_url"])
+        if key in emails or key in pending:
+            continue
+        hit, email = _cached(key)
+        if hit:
+            emails[key] = email
+        else:
+            pending[key] = person
+
+    keys = list(pending)
+    size = max(1, APOLLO_BULK_SIZE)
+    chunks = [keys[i:i + size] for i in range(0, len(keys), size)]
+    if chunks:
+        with ThreadPoolExecutor(max_workers=len(chunks), thread_name_prefix="apollo") as pool:
+            results = pool.map(
+                lambda chunk: contextvars.copy_context().run(_bulk_match_chunk, [pending[k] for k in chunk]),
+                chunks,
+            )
+            for chunk, chunk_emails in zip(chunks, results):
+                for key, email in zip(chunk, chunk_emails):
+                    _remember(key, email)
+                    emails[key] = email
+    logger.info("Apollo bulk match: %d people, %d looked up in %d call(s)", len(people), len(keys), len(chunks))
+    return [emails[profile_key(person["linkedin_url"])] for person in people]
+
+
+def cache_stats() -> dict:
+    return {
+        "apollo_matches": match_cache.info() if match_cache is not None else None,
+        "apollo_misses": miss_cache.info() if miss_cache is not None else None,
+    }
+
+
+metrics.registry.register_collector(metrics.cache_collector(cache_stats))
@@ -1,19 +1,28 @@
 import os
-import fitz  # PyMuPDF
 from dotenv import load_dotenv
-from flask import Flask, request, jsonify, redirect, url_for, session, render_template_string, Response
+from flask import Flask, request, jsonify, redirect, url_for, session, render_template_string, Response, stream_with_context, g
 from flask_cors import CORS
-import requests
 import json
+import functools
 import asyncio
 import base64
-import urllib.parse
+import datetime
+import time
 from email.mime.text import MIMEText
-from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
-from google.cloud import firestore
-from google.oauth2.credentials import Credentials
-from google.auth.transport.requests import Request
+# Google SDKs are imported inside the routes that use them to keep cold starts fast (see clients.py)
+import clients
+import gmail_messages
+import gmail_sync
+import user_store
+from credentials_cache import CredentialCache
+from quota import make_search_quota
+from search_planner import canonical_profile_url
+import resume_extract
+import metrics
+import resilience
+import outbox
+import apollo
+from people_index import people_index
 
 # Load environment variables from .env file
 load_dotenv()
@@ -22,7 +31,7 @@ load_dotenv()
 GOOGLE_API_KEY = os.getenv('GOOGLE_API_KEY')
 GOOGLE_CSE_ID = os.getenv('GOOGLE_CSE_ID')
 GMAIL_CREDENTIALS_PATH = os.getenv('GMAIL_CREDENTIALS_PATH', './GCP_gmail_api_credentials.json')
-FIRESTORE_CREDENTIALS_PATH = os.getenv('FIRESTORE_CREDENTIALS_PATH', './firestore-creds.json')
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
 
 # Allow insecure transport for OAuth (development only)
 os.environ['OAUTHLIB_INSECURE_TRANSPORT'] = '1'
@@ -33,7 +42,8 @@ SCOPES = [
     'https://www.googleapis.com/auth/gmail.readonly'
 ]
 
-from people_search import generate_google_dorks
+from people_search import (search_people, stream_search_people, batch_google_dorks, invalidate_dork_cache,
+                           cache_stats, warm_up as warm_up_search)
 
 app = Flask(__name__)
 CORS(
@@ -48,18 +58,51 @@ app.secret_key = "FLASK_SESSION_KEY"
 # Enable cross-domain cookies
 app.config.update(
     SESSION_COOKIE_SAMESITE=None,
-    SESSION_COOKIE_SECURE=False  # Set to True if using HTTPS
+    SESSION_COOKIE_SECURE=False,  # Set to True if using HTTPS
+    # Reject oversized request bodies before they are read (resume limit plus room for form fields)
+    MAX_CONTENT_LENGTH=resume_extract.RESUME_MAX_BYTES + 1024 * 1024
 )
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.metrics_token = metrics.start_request()
+
+@app.before_request
+def warm_up_clients():
+    # The port is bound by the time a request arrives; preload SDKs in the background from here on
+    clients.start_warm_up(hooks=(warm_up_search,))
+
+@app.after_request
+def record_request_timing(response):
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        start, method, path, endpoint = g.request_start, request.method, request.path, request.endpoint
+        status = response.status_code
+        # A streamed body is still being generated here, so the request ends when the response is closed
+        response.call_on_close(lambda: metrics.finish_request(
+            token, method, path, endpoint, status, time.perf_counter() - start))
+    return response
+
+@app.errorhandler(resilience.CircuitOpenError)
+def upstream_unavailable(e):
+    # An upstream's circuit breaker is open: fail fast instead of holding the worker
+    response = jsonify({"error": f"{e.upstream} is temporarily unavailable", "upstream": e.upstream})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(int(e.retry_after + 0.5))
+    return response
+
 # Helper functions for Google API and Firestore
 def get_firestore_client():
-    # Set the credentials path for Firestore
-    os.environ['GOOGLE_APPLICATION_CREDENTIALS'] = FIRESTORE_CREDENTIALS_PATH
-    return firestore.Client()
+    # Shared, process-wide client (see clients.py)
+    return clients.get_firestore_client()
 
-def get_user_credentials(user_id):
+def load_user_credentials(user_id):
+    from google.oauth2.credentials import Credentials
     db = get_firestore_client()
-    doc = db.collection("users").document(user_id).get()
+    with metrics.span("firestore.credentials", upstream="firestore"):
+        doc = resilience.call("firestore", lambda: user_store.user_ref(db, user_id).get(
+            field_paths=user_store.CREDENTIAL_FIELDS, timeout=clients.FIRESTORE_TIMEOUT), idempotent=True)
     if not doc.exists:
         return None
 
@@ -72,23 +115,65 @@ def get_user_credentials(user_id):
         client_secret=os.environ.get('GOOGLE_CLIENT_SECRET'),
         scopes=SCOPES
     )
+    if data.get('token_expiry'):
+        # Stored as naive UTC isoformat, which is what google-auth expects
+        creds.expiry = datetime.datetime.fromisoformat(data['token_expiry'])
+    return creds
 
-    if creds.expired and creds.refresh_token:
-        creds.refresh(Request())
-
-        # Save new access token and expiry to Firestore
-        db.collection("users").document(user_id).update({
+def save_user_token(user_id, creds):
+    # Save new access token and expiry to Firestore
+    db = get_firestore_client()
+    with metrics.span("firestore.save_token", upstream="firestore"):
+        resilience.call("firestore", lambda: db.collection("users").document(user_id).update({
             "access_token": creds.token,
             "token_expiry": creds.expiry.isoformat()
-        })
+        }, timeout=clients.FIRESTORE_TIMEOUT), idempotent=True)
 
-    return creds
+credential_cache = CredentialCache(load=load_user_credentials, save=save_user_token)
+
+def get_user_credentials(user_id):
+    # Cached per user; expired tokens are refreshed once even under concurrent requests
+    with metrics.span("credentials.get"):
+        return credential_cache.get(user_id)
 
 # Get environment variables or use defaults
 PORT = int(os.getenv("PORT", 8080))
 HOST = os.getenv("HOST", "0.0.0.0")
 DEBUG = os.getenv("DEBUG", "True").lower() == "true"
 
+# Maximum number of profile cards returned per search
+MAX_SEARCH_RESULTS = 10
+# Maximum number of queries accepted by /search/batch
+MAX_BATCH_QUERIES = 50
+# Maximum number of profiles accepted by /get_email/bulk
+MAX_BULK_EMAIL_LOOKUPS = 100
+
+def transform_result(idx, result):
+    """Turn one CSE item into the profile card format expected by the frontend."""
+    raw_title = result.get('title', 'Unknown')
+    # Extract name before any dash, slash, or pipe
+    for sep in [' - ', ' / ', ' | ']:
+        if sep in raw_title:
+            raw_title = raw_title.split(sep, 1)[0]
+    name = raw_title.strip()
+    return {
+        "id": f"{idx}-{result.get('link', '')[-8:]}",
+        "name": name,
+        "profileImage": f"https://ui-avatars.com/api/?name={name.replace(' ', '+')}&background=random",
+        "linkUrl": result.get('link', '#'),
+        "linkText": "View Profile"
+    }
+
+search_quota = make_search_quota(get_firestore_client)
+
+def check_search_quota(user_id):
+    """Reserve one search from the user's quota. Returns an error response or None."""
+    with metrics.span("quota.reserve"):
+        allowed = search_quota.reserve(user_id)
+    if not allowed:
+        return jsonify({"error": "Search limit reached"}), 403
+    return None
+
 @app.route('/search', methods=['POST'])
 def search():
     # Ensure user is authenticated
@@ -96,45 +181,170 @@ def search():
     if not user_id:
         return jsonify({"error": "Not authenticated"}), 401
     # Check and increment user search count
-    db = get_firestore_client()
-    user_ref = db.collection('users').document(user_id)
-    user_doc = user_ref.get()
-    current_searches = user_doc.to_dict().get('searches', 0)
-    if current_searches >= 5:
-        return jsonify({"error": "Search limit reached"}), 403
-    user_ref.update({"searches": firestore.Increment(1)})
+    quota_error = check_search_quota(user_id)
+    if quota_error:
+        return quota_error
     try:
         data = request.get_json()
         if not data or 'query' not in data:
+            search_quota.refund(user_id)
             return jsonify({"error": "Missing 'query' in request"}), 400
         query = data['query']
         
-        # Call local generate_google_dorks
-        results_dict = generate_google_dorks(query)
+        # Serve what the local people index already knows, then run dorks in priority order
+        # only until the remaining MAX_SEARCH_RESULTS unique profiles are found
+        plan = search_people(query, budget=MAX_SEARCH_RESULTS)
         
         # Transform results into the format expected by the frontend
-        transformed_results = []
-        for idx, entry in enumerate(results_dict.values()):
-            for result in entry.get('results', {}).get('data', []):
-                raw_title = result.get('title', 'Unknown')
-                # Extract name before any dash, slash, or pipe
-                for sep in [' - ', ' / ', ' | ']:
-                    if sep in raw_title:
-                        raw_title = raw_title.split(sep, 1)[0]
-                name = raw_title.strip()
-                transformed_results.append({
-                    "id": f"{idx}-{result.get('link', '')[-8:]}",
-                    "name": name,
-                    "profileImage": f"https://ui-avatars.com/api/?name={name.replace(' ', '+')}&background=random",
-                    "linkUrl": result.get('link', '#'),
-                    "linkText": "View Profile"
-                })
-        # Limit to 10 results
-        transformed_results = transformed_results[:10]
-        return jsonify({"results": transformed_results})
+        transformed_results = [transform_result(idx - 1, result) for idx, _dork, result in plan['results']]
+        return jsonify({"results": transformed_results, "stats": plan['stats']})
+    except resilience.CircuitOpenError as e:
+        search_quota.refund(user_id)
+        return upstream_unavailable(e)
+    except Exception as e:
+        search_quota.refund(user_id)
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/search/stream', methods=['POST'])
+def search_stream():
+    """Like /search, but streams NDJSON: index hits, then one line per profile card as each dork completes."""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    data = request.get_json(silent=True)
+    if not data or 'query' not in data:
+        return jsonify({"error": "Missing 'query' in request"}), 400
+    quota_error = check_search_quota(user_id)
+    if quota_error:
+        return quota_error
+    query = data['query']
+
+    def generate():
+        sent = 0
+        seen = set()
+        results = stream_search_people(query, budget=MAX_SEARCH_RESULTS)
+        try:
+            for idx, _dork, dork_results in results:
+                for result in dork_results.get('data', []):
+                    key = canonical_profile_url(result.get('link', ''))
+                    if key in seen:
+                        continue
+                    seen.add(key)
+                    yield json.dumps({"type": "result", "result": transform_result(idx - 1, result)}) + "\n"
+                    sent += 1
+                    if sent >= MAX_SEARCH_RESULTS:
+                        break
+                if sent >= MAX_SEARCH_RESULTS:
+                    break
+            yield json.dumps({"type": "done", "count": sent}) + "\n"
+        except Exception as e:
+            if sent == 0:
+                search_quota.refund(user_id)
+            # Terminal: the results already sent stand, and count says how many there were
+            yield json.dumps({"type": "error", "error": str(e), "count": sent}) + "\n"
+        finally:
+            # Cancels CSE calls that haven't started yet and closes the Claude stream
+            results.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """Run many queries at once; each query is charged against the quota separately."""
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    data = request.get_json(silent=True) or {}
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q.strip() for q in queries):
+        return jsonify({"error": "'queries' must be a non-empty list of strings"}), 400
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"At most {MAX_BATCH_QUERIES} queries per batch"}), 400
+
+    # Queries beyond the remaining quota are reported individually rather than failing the batch
+    allowed = []
+    with metrics.span("quota.reserve"):
+        try:
+            for _query in queries:
+                allowed.append(search_quota.reserve(user_id))
+        except Exception:
+            for _ok in filter(None, allowed):
+                search_quota.refund(user_id)
+            raise
+    accepted = [query for query, ok in zip(queries, allowed) if ok]
+    if not accepted:
+        return jsonify({"error": "Search limit reached"}), 403
+
+    try:
+        batch = batch_google_dorks(accepted, budget=MAX_SEARCH_RESULTS)
+    except resilience.CircuitOpenError as e:
+        for _query in accepted:
+            search_quota.refund(user_id)
+        return upstream_unavailable(e)
     except Exception as e:
+        for _query in accepted:
+            search_quota.refund(user_id)
         return jsonify({"error": str(e)}), 500
 
+    per_query = iter(batch['queries'])
+    results = []
+    for query, ok in zip(queries, allowed):
+        if not ok:
+            results.append({"query": query, "error": "Search limit reached"})
+            continue
+        results.append({
+            "query": query,
+            "results": [transform_result(idx - 1, result) for idx, _dork, result in next(per_query)],
+        })
+    # Point each deduplicated profile back at the position of the query that found it
+    positions = [position for position, ok in enumerate(allowed) if ok]
+    profiles = [
+        {**transform_result(idx - 1, result), "queryIndex": positions[accepted_idx]}
+        for accepted_idx, idx, _dork, result in batch['profiles']
+    ]
+    return jsonify({"queries": results, "profiles": profiles, "stats": batch['stats']})
+
+def is_admin_request():
+    return bool(ADMIN_TOKEN) and request.headers.get('X-Admin-Token') == ADMIN_TOKEN
+
+@app.route('/admin/cache', methods=['GET'])
+def admin_cache_stats():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    return jsonify({**cache_stats(), **apollo.cache_stats(), **gmail_sync.cache_stats(),
+                    "people_index": people_index.info() if people_index is not None else None})
+
+@app.route('/admin/upstreams', methods=['GET'])
+def admin_upstream_stats():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    # Circuit breaker state, hedge delay and hedge win rate per upstream
+    return jsonify(resilience.upstream_stats())
+
+@app.route('/admin/cache/invalidate', methods=['POST'])
+def admin_invalidate_dork_cache():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    # Drop a single query's translation, or everything when no query is given
+    data = request.get_json(silent=True) or {}
+    invalidate_dork_cache(data.get('query'))
+    return jsonify({"success": True})
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Prometheus text exposition: per-stage latency, upstream calls, LLM tokens, cache ratios
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/admin/people_index/compact', methods=['POST'])
+def admin_compact_people_index():
+    if not is_admin_request():
+        return jsonify({"error": "Forbidden"}), 403
+    if people_index is None:
+        return jsonify({"error": "People index is disabled"}), 404
+    people_index.compact()
+    return jsonify(people_index.info())
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({"status": "healthy"})
@@ -146,10 +356,25 @@ def home():
         "version": "1.0.0",
         "endpoints": [
             {"path": "/search", "method": "POST", "description": "Search with Google dorks"},
+            {"path": "/search/stream", "method": "POST", "description": "Stream search results as NDJSON"},
             {"path": "/health", "method": "GET", "description": "Health check endpoint"}
         ]
     })
 
+@functools.lru_cache(maxsize=1)
+def oauth_client_config():
+    # Parsed once per process instead of on every /login and /oauth2callback
+    with open(GMAIL_CREDENTIALS_PATH) as f:
+        return json.load(f)
+
+def oauth_flow():
+    from google_auth_oauthlib.flow import Flow
+    return Flow.from_client_config(
+        oauth_client_config(),
+        scopes=SCOPES,
+        redirect_uri=url_for('oauth2callback', _external=True)
+    )
+
 # Email-related endpoints
 @app.route('/login')
 def login():
@@ -163,22 +388,15 @@ def login():
             return '❌ Username required for signup', 400
         session['custom_username'] = username
 
-    flow_obj = Flow.from_client_secrets_file(
-        GMAIL_CREDENTIALS_PATH,
-        scopes=SCOPES,
-        redirect_uri=url_for('oauth2callback', _external=True)
-    )
+    flow_obj = oauth_flow()
     auth_url, _ = flow_obj.authorization_url(include_granted_scopes='true')
     return redirect(auth_url)
 
 @app.route('/oauth2callback')
 def oauth2callback():
     # Exchange token
-    flow_obj = Flow.from_client_secrets_file(
-        GMAIL_CREDENTIALS_PATH,
-        scopes=SCOPES,
-        redirect_uri=url_for('oauth2callback', _external=True)
-    )
+    from googleapiclient.discovery import build
+    flow_obj = oauth_flow()
     flow_obj.fetch_token(authorization_response=request.url)
 
     creds = flow_obj.credentials
@@ -191,21 +409,20 @@ def oauth2callback():
 
     flow_type = session.get('flow', 'login')
     db = get_firestore_client()
-    users_ref = db.collection('users')
     frontend_url = os.getenv('FRONTEND_URL', 'http://localhost:8000')
 
     if flow_type == 'login':
-        # Existing user login
-        docs = list(users_ref.where('email', '==', email).stream())
-        if docs:
-            doc = docs[0]
-            user_id = doc.id
+        # Existing user login: one get on the emails/{email} index
+        with metrics.span("firestore.find_user", upstream="firestore"):
+            user_id = user_store.find_user_id(db, email)
+        if user_id:
             # Update tokens
-            doc.reference.update({
+            resilience.call("firestore", lambda: user_store.user_ref(db, user_id).update({
                 'access_token': access_token,
                 'refresh_token': refresh_token,
                 'token_expiry': token_expiry
-            })
+            }, timeout=clients.FIRESTORE_TIMEOUT), idempotent=True)
+            credential_cache.invalidate(user_id)
             session['user_id'] = user_id
             session['user_email'] = email
             session.permanent = True
@@ -216,40 +433,40 @@ def oauth2callback():
             return redirect(f"{frontend_url}/login?flow=signup")
     else:
         # Signup flow
-        # Enforce unique email
-        normalized_email = email.lower().strip()
-        dup = list(users_ref.where('email', '==', normalized_email).stream())
-        if dup:
-            session.pop('temp_email', None)
-            session.pop('flow', None)
-            return redirect(f"{frontend_url}/login?error=email_already_registered")
         username = session.get('custom_username')
         if not username:
             return '❌ Missing username for signup', 400
+        # The email index entry and the user are created in one transaction, so emails stay unique
+        try:
+            with metrics.span("firestore.create_user", upstream="firestore"):
+                if user_store.find_user_id(db, email):
+                    raise user_store.SignupConflict("email")
+                user_store.create_user(db, username, email, {
+                    'access_token': access_token,
+                    'refresh_token': refresh_token,
+                    'token_expiry': token_expiry,
+                    'searches': 0,
+                    'joined_waitlist': False,
+                    'profile_completed': False
+                })
+        except user_store.SignupConflict as e:
+            session.pop('temp_email', None)
+            session.pop('flow', None)
+            error = 'email_already_registered' if e.field == 'email' else 'username_taken'
+            return redirect(f"{frontend_url}/login?error={error}")
         user_id = username
         session['user_id'] = user_id
         session['user_email'] = email
         session.permanent = True
-        # Create new user
-        users_ref.document(user_id).set({
-            'email': normalized_email,
-            'access_token': access_token,
-            'refresh_token': refresh_token,
-            'token_expiry': token_expiry,
-            'searches': 0,
-            'joined_waitlist': False,
-            'profile_completed': False
-        })
         return redirect(f"{frontend_url}/resume")
 
-def extract_text_from_upload(file):
+def extract_text_from_upload(path, filename):
     try:
         # Try to open as PDF first
-        if file.filename.lower().endswith('.pdf'):
-            doc = fitz.open(stream=file.read(), filetype="pdf")
-            text = "\n".join(page.get_text() for page in doc)
-            doc.close()
-            return text
+        if filename.lower().endswith('.pdf'):
+            # Runs in a bounded process pool with page, CPU and memory limits
+            with metrics.span("resume.extract"):
+                return resume_extract.extractor.extract(path)
         # For other file types, you might need additional libraries
         # This is a placeholder for DOC/DOCX handling
         else:
@@ -257,6 +474,11 @@ def extract_text_from_upload(file):
     except Exception as e:
         return f"Error extracting text: {str(e)}"
 
+def save_profile(user_id, fields):
+    # The resume text goes to its own document so reads of users/{id} stay small
+    with metrics.span("firestore.profile", upstream="firestore"):
+        user_store.save_profile(get_firestore_client(), user_id, fields)
+
 @app.route('/complete_profile', methods=['POST'])
 def complete_profile():
     # Get user_id from session instead of form
@@ -274,35 +496,88 @@ def complete_profile():
     file = request.files['resume_file']
     if file.filename == '':
         return "❌ No resume file selected", 400
-    
+
+    # Spool the upload to disk, rejecting it as soon as it passes the size limit
+    try:
+        path, size = resume_extract.spool_upload(file)
+    except resume_extract.UploadTooLarge:
+        return "❌ Resume file too large", 413
+
+    profile = {
+        "additional_details": additional_details,
+        "profile_completed": True,
+        "joined_waitlist": True
+    }
+
+    if file.filename.lower().endswith('.pdf') and size > resume_extract.RESUME_ASYNC_BYTES:
+        # Large files are extracted in the background; the text lands in Firestore when done
+        job_id = resume_extract.new_job_id()
+        save_profile(user_id, {**profile, "resume_job_id": job_id, "resume_status": "processing"})
+        resume_extract.extractor.submit_job(
+            path,
+            on_done=lambda text: save_profile(user_id, {"resume_text": text, "resume_status": "done"}),
+            on_error=lambda error: save_profile(user_id, {"resume_text": error, "resume_status": "error"}),
+            job_id=job_id,
+        )
+        return jsonify({"status": "processing", "job_id": job_id}), 202
+
     # Extract text from the uploaded file
-    resume_text = extract_text_from_upload(file)
-    
+    try:
+        resume_text = extract_text_from_upload(path, file.filename)
+    finally:
+        os.remove(path)
+
     # Store in Firestore
-    db = get_firestore_client()
-    user_ref = db.collection("users").document(user_id)
-    
-    # First check if document exists
-    doc = user_ref.get()
-    if not doc.exists:
-        # Create new document
-        user_ref.set({
-            "resume_text": resume_text,
-            "additional_details": additional_details,
-            "profile_completed": True,
-            "joined_waitlist": True
-        })
-    else:
-        # Update existing document
-        user_ref.update({
-            "resume_text": resume_text,
-            "additional_details": additional_details,
-            "profile_completed": True,
-            "joined_waitlist": True
-        })
+    save_profile(user_id, {**profile, "resume_text": resume_text, "resume_status": "done"})
 
     return "✅ Saved"
 
+@app.route('/complete_profile/<job_id>', methods=['GET'])
+def complete_profile_status(job_id):
+    user_id = session.get('user_id')
+    if not user_id:
+        return jsonify({"error": "Not authenticated"}), 401
+    db = get_firestore_client()
+    with metrics.span("firestore.resume_status", upstream="firestore"):
+        doc = resilience.call("firestore", lambda: user_store.user_ref(db, user_id).get(
+            field_paths=user_store.RESUME_JOB_FIELDS, timeout=clients.FIRESTORE_TIMEOUT), idempotent=True)
+    data = doc.to_dict() if doc.exists else {}
+    if data.get('resume_job_id') != job_id:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify({"job_id": job_id, "status": data.get('resume_status', 'processing')})
+
+
+def deliver_email(user_id, to_email, subject, body):
+    """Send one message through the user's Gmail account; runs on an outbox worker."""
+    creds = get_user_credentials(user_id)
+    if creds is None:
+        raise outbox.PermanentSendError("No credentials found for this user")
+
+    service = clients.get_gmail_service(user_id, creds)
+    message = MIMEText(body)
+    message['to'] = to_email
+    message['subject'] = subject
+
+    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
+    # Not retried here: the outbox retries sends itself, with idempotency per message
+    with metrics.span("gmail.send", upstream="gmail"), resilience.guard("gmail"):
+        send_result = service.users().messages().send(userId='me', body={'raw': raw_message}).execute()
+    return send_result['id']
+
+email_outbox = outbox.Outbox(deliver_email)
+metrics.registry.register_collector(outbox.outbox_collector(email_outbox))
+
+@app.before_request
+def start_outbox():
+    # Not at import: the dispatcher thread wouldn't survive gunicorn --preload forking the workers.
+    # From the first request on, each worker also picks up messages left queued by a previous run
+    email_outbox.start()
+
+# Maximum recipients in one /send_email/bulk request
+MAX_MERGE_RECIPIENTS = 500
+
+def idempotency_key(data):
+    return request.headers.get('Idempotency-Key') or data.get('idempotency_key')
 
 @app.route('/send_email', methods=['POST'])
 def send_email():
@@ -319,15 +594,58 @@ def send_email():
     if creds is None:
         return {"error": "❌ No credentials found for this user"}, 403
 
-    service = build('gmail', 'v1', credentials=creds)
-    message = MIMEText(body)
-    message['to'] = to_email
-    message['subject'] = subject
+    # Sent by an outbox worker; poll /send_email/<id> for the outcome
+    message_id, _created = email_outbox.enqueue(username, to_email, subject, body, idempotency_key(data))
+    return {"status": "queued", "id": message_id}, 202
 
-    raw_message = base64.urlsafe_b64encode(message.as_bytes()).decode()
-    send_result = service.users().messages().send(userId='me', body={'raw': raw_message}).execute()
+@app.route('/send_email/bulk', methods=['POST'])
+def send_email_bulk():
+    """Mail merge: render one subject/body template per recipient and queue them all."""
+    data = request.get_json(silent=True) or {}
+    username = data.get('username')
+    subject = data.get('subject')
+    body = data.get('body')
+    recipients = data.get('recipients')
+
+    if not all([username, subject, body]) or not isinstance(recipients, list) or not recipients:
+        return {"error": "Missing one of: username, subject, body, recipients"}, 400
+    if len(recipients) > MAX_MERGE_RECIPIENTS:
+        return {"error": f"At most {MAX_MERGE_RECIPIENTS} recipients per request"}, 400
+
+    creds = get_user_credentials(username)
+    if creds is None:
+        return {"error": "❌ No credentials found for this user"}, 403
 
-    return {"status": "✅ Email sent successfully!", "id": send_result['id']}
+    # Render everything up front so a bad row rejects the whole request before anything is queued
+    base_key = idempotency_key(data)
+    messages = []
+    for position, recipient in enumerate(recipients):
+        if not isinstance(recipient, dict) or not recipient.get('to'):
+            return {"error": f"Recipient {position} is missing 'to'"}, 400
+        fields = {**recipient.get('fields', {}), "to": recipient['to']}
+        try:
+            rendered_subject = outbox.render_template(subject, fields)
+            rendered_body = outbox.render_template(body, fields)
+        except KeyError as e:
+            return {"error": f"Recipient {position} is missing field {e.args[0]!r}"}, 400
+        key = f"{base_key}:{position}" if base_key else None
+        messages.append((recipient['to'], rendered_subject, rendered_body, key))
+
+    queued = email_outbox.enqueue_many(username, messages)
+    return {
+        "status": "queued",
+        "messages": [{"to": to, "id": message_id} for (to, *_rest), (message_id, _created) in zip(messages, queued)],
+    }, 202
+
+@app.route('/send_email/<message_id>', methods=['GET'])
+def send_email_status(message_id):
+    username = request.args.get('username') or session.get('user_id')
+    if not username:
+        return {"error": "Missing username"}, 400
+    status = email_outbox.status(message_id, username)
+    if status is None:
+        return {"error": "Unknown message"}, 404
+    return status
 
 
 @app.route('/read_with', methods=['POST'])
@@ -335,59 +653,50 @@ def read_with():
     data = request.json
     username = data.get('username')
     target_email = data.get('email')
+    # Optional paging/body controls; defaults match the original response
+    include_body = data.get('include_body', True)
+    page_token = data.get('pageToken')
 
     if not username or not target_email:
         return {"error": "Missing username or target email"}, 400
+    try:
+        body_chars = int(data.get('body_chars', 500))
+        max_results = int(data.get('maxResults', 10))
+    except (TypeError, ValueError):
+        return {"error": "'body_chars' and 'maxResults' must be integers"}, 400
+    if body_chars < 0:
+        return {"error": "'body_chars' must not be negative"}, 400
+    # Gmail rejects maxResults below 1
+    max_results = max(1, min(max_results, 100))
 
     creds = get_user_credentials(username)
     if creds is None:
         return {"error": "❌ No credentials found for this user"}, 403
 
-    service = build('gmail', 'v1', credentials=creds)
-    query = f'to:{target_email} OR from:{target_email}'
-    results = service.users().messages().list(userId='me', q=query, maxResults=10).execute()
-    messages = results.get('messages', [])
-
-    email_data = []
-    for msg in messages:
-        msg_detail = service.users().messages().get(userId='me', id=msg['id'], format='full').execute()
-        headers = msg_detail.get('payload', {}).get('headers', [])
-
-        def get_header(name):
-            return next((h['value'] for h in headers if h['name'].lower() == name.lower()), "")
-
-        subject = get_header('Subject')
-        sender = get_header('From')
-        recipient = get_header('To')
-        cc = get_header('Cc')
-        bcc = get_header('Bcc')
-        date = get_header('Date')
-
-        body = ''
-        payload = msg_detail.get('payload', {})
-        parts = payload.get('parts', [])
-
-        if parts:
-            for part in parts:
-                if part['mimeType'] == 'text/plain' and 'data' in part['body']:
-                    body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
-                    break
-                elif part['mimeType'] == 'text/html' and 'data' in part['body']:
-                    body = base64.urlsafe_b64decode(part['body']['data']).decode('utf-8', errors='ignore')
-        elif 'data' in payload.get('body', {}):
-            body = base64.urlsafe_b64decode(payload['body']['data']).decode('utf-8', errors='ignore')
-
-        email_data.append({
-            'from': sender,
-            'to': recipient,
-            'cc': cc,
-            'bcc': bcc,
-            'date': date,
-            'subject': subject,
-            'body': body[:500]
-        })
+    service = clients.get_gmail_service(username, creds)
+    # Repeat views cost one history call plus the new messages
+    try:
+        synced = gmail_sync.read_conversation(service, username, target_email, max_results, page_token,
+                                              include_body=bool(include_body), body_chars=body_chars)
+    except gmail_sync.InvalidPageToken:
+        return {"error": "Invalid 'pageToken'"}, 400
+    if synced is not None:
+        return synced
+
+    query = gmail_sync.conversation_query(target_email)
+    with metrics.span("gmail.list", upstream="gmail"):
+        page = gmail_messages.list_messages(service, query, max_results=max_results, page_token=page_token)
+
+    # Metadata-only fetches skip the message payload entirely
+    fetch_body = bool(include_body) and body_chars > 0
+    with metrics.span("gmail.fetch", upstream="gmail"):
+        messages = gmail_messages.fetch_messages(service, page['ids'], include_body=fetch_body)
+    email_data = [
+        gmail_messages.summarize_message(msg, body_chars if fetch_body else 0)
+        for msg in messages
+    ]
 
-    return {'emails': email_data}
+    return {'emails': email_data, 'nextPageToken': page['nextPageToken']}
 
 
 @app.route('/get_email', methods=['POST'])
@@ -402,35 +711,52 @@ def get_email():
         if not first_name or not last_name or not linkedin_url:
             return jsonify({"error": "Missing required fields: first_name, last_name, linkedin_url"}), 400
 
-        encoded_profile = urllib.parse.quote(linkedin_url, safe='')
-        url = (f"https://api.apollo.io/api/v1/people/match?first_name={first_name}"
-               f"&last_name={last_name}&linkedin_url={encoded_profile}&"
-               "reveal_personal_emails=true&reveal_phone_number=false")
-
-        headers = {
-            "accept": "application/json",
-            "Cache-Control": "no-cache",
-            "Content-Type": "application/json",
-            "x-api-key": APOLLO_API_KEY
-        }
-
-        response = requests.post(url, headers=headers)
-        if response.status_code != 200:
-            return jsonify({
-                "error": "Failed to fetch email from Apollo API",
-                "status_code": response.status_code,
-                "details": response.text
-            }), response.status_code
-
-        # Parse and return only the email
-        result = response.json()
-        email = result.get("person", {}).get("email")
+        # Cached by canonical LinkedIn URL, including misses, so repeats don't spend credits
+        email = apollo.match_email(first_name, last_name, linkedin_url)
         if not email:
             return jsonify({"error": "Email not found"}), 404
         return jsonify({"email": email})
+    except apollo.ApolloError as e:
+        return jsonify({
+            "error": "Failed to fetch email from Apollo API",
+            "status_code": e.status_code,
+            "details": e.details
+        }), e.status_code
+    except resilience.CircuitOpenError as e:
+        return upstream_unavailable(e)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/get_email/bulk', methods=['POST'])
+def get_email_bulk():
+    """Look up emails for many profiles (e.g. one /search page) through Apollo's bulk match."""
+    data = request.get_json(silent=True) or {}
+    people = data.get('people')
+    if not isinstance(people, list) or not people:
+        return jsonify({"error": "'people' must be a non-empty list"}), 400
+    if len(people) > MAX_BULK_EMAIL_LOOKUPS:
+        return jsonify({"error": f"At most {MAX_BULK_EMAIL_LOOKUPS} people per request"}), 400
+    for position, person in enumerate(people):
+        if not isinstance(person, dict) or not all(person.get(f) for f in ("first_name", "last_name", "linkedin_url")):
+            return jsonify({"error": f"Person {position} is missing first_name, last_name or linkedin_url"}), 400
+
+    try:
+        emails = apollo.bulk_match_emails(people)
+    except apollo.ApolloError as e:
+        return jsonify({
+            "error": "Failed to fetch emails from Apollo API",
+            "status_code": e.status_code,
+            "details": e.details
+        }), e.status_code
+    except resilience.CircuitOpenError as e:
+        return upstream_unavailable(e)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({"results": [
+        {"linkedin_url": person["linkedin_url"], "email": email}
+        for person, email in zip(people, emails)
+    ]})
+
 
 @app.route('/me', methods=['GET'])
 def me():
@@ -438,7 +764,9 @@ def me():
     if not user_id:
         return jsonify({'authenticated': False}), 401
     db = get_firestore_client()
-    doc = db.collection('users').document(user_id).get()
+    with metrics.span("firestore.me", upstream="firestore"):
+        doc = resilience.call("firestore", lambda: user_store.user_ref(db, user_id).get(
+            field_paths=user_store.SESSION_FIELDS, timeout=clients.FIRESTORE_TIMEOUT), idempotent=True)
     data = doc.to_dict() if doc.exists else {}
     return jsonify({
         'authenticated': True,
@@ -449,6 +777,9 @@ def me():
 
 @app.route('/logout', methods=['POST'])
 def logout():
+    user_id = session.get('user_id')
+    if user_id and gmail_sync.conversation_store is not None:
+        gmail_sync.conversation_store.evict_user(user_id)
     session.clear()
     return jsonify({'success': True}), 200
 
@@ -0,0 +1,105 @@
+"""Local dork synthesizer vs the LLM on the fixture queries.
+
+For each query in fixtures.LLM_OUTPUTS, reports the synthesizer's confidence,
+whether it would answer locally, its latency against the (fake) LLM path, and
+how close its dorks and their CSE results come to the LLM's.
+
+    python -m bench.dorks
+    python -m bench.dorks --llm-latency 1.2 --json
+
+Result overlap uses fixtures.cse_payload keyed by the canonical dork, so
+equivalent dorks return the same profiles.
+"""
+import json
+import time
+import argparse
+import statistics
+
+from bench import fixtures
+from bench.fakes import FakeUpstreams
+
+
+def jaccard(first: set, second: set) -> float:
+    if not first and not second:
+        return 1.0
+    return len(first & second) / len(first | second)
+
+
+def canonical(dork: str) -> str:
+    from dork_optimizer import DorkSyntaxError, parse_dork, render_dork
+    try:
+        return render_dork(parse_dork(dork))
+    except DorkSyntaxError:
+        return " ".join(dork.split()).casefold()
+
+
+def profiles(dorks: list) -> set:
+    from search_planner import canonical_profile_url
+    return {canonical_profile_url(item["link"])
+            for dork in dorks for item in fixtures.cse_payload(canonical(dork))["items"]}
+
+
+def time_call(fn, iterations: int) -> float:
+    """Median seconds per call."""
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare local dork synthesis with the LLM translation")
+    parser.add_argument("--iterations", type=int, default=1000, help="synthesizer timing iterations")
+    parser.add_argument("--llm-latency", type=float, default=0.8, help="fake Anthropic latency in seconds")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    FakeUpstreams(llm_latency=args.llm_latency).install()
+    import local_dorks
+    import people_search
+
+    rows = []
+    for natural_query, output in fixtures.LLM_OUTPUTS:
+        local, confidence = local_dorks.synthesize(natural_query)
+        llm = people_search.parse_dorks(output)
+        local_s = time_call(lambda: local_dorks.synthesize(natural_query), args.iterations)
+        local_dorks.LOCAL_DORKS_ENABLED = False
+        llm_s = time_call(lambda: people_search.translate_query(natural_query), 1)
+        local_dorks.LOCAL_DORKS_ENABLED = True
+        rows.append({
+            "query": natural_query,
+            "confidence": confidence,
+            "local": bool(local) and confidence >= local_dorks.LOCAL_DORKS_MIN_CONFIDENCE,
+            "local_us": local_s * 1e6,
+            "llm_ms": llm_s * 1e3,
+            "dork_overlap": jaccard({canonical(d) for d in local}, {canonical(d) for d in llm}),
+            "result_overlap": jaccard(profiles(local), profiles(llm)) if local else 0.0,
+        })
+
+    handled = [row for row in rows if row["local"]]
+    summary = {
+        "handled_locally": len(handled) / len(rows),
+        "median_local_us": statistics.median(row["local_us"] for row in rows),
+        "median_llm_ms": statistics.median(row["llm_ms"] for row in rows),
+        "result_overlap_when_local": (statistics.mean(row["result_overlap"] for row in handled)
+                                      if handled else 0.0),
+    }
+    if args.json:
+        print(json.dumps({"queries": rows, "summary": summary}, indent=2))
+        return 0
+
+    print(f"{'query':<48}{'conf':>6}{'local':>7}{'local µs':>10}{'llm ms':>9}{'dorks':>7}{'results':>9}")
+    for row in rows:
+        print(f"{row['query'][:47]:<48}{row['confidence']:>6.2f}{'yes' if row['local'] else 'no':>7}"
+              f"{row['local_us']:>10.1f}{row['llm_ms']:>9.1f}{row['dork_overlap']:>7.2f}"
+              f"{row['result_overlap']:>9.2f}")
+    print()
+    for key, value in summary.items():
+        print(f"{key:<28}{value:>10.3f}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
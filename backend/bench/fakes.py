@@ -0,0 +1,468 @@
+"""In-process stand-ins for Anthropic, Google CSE, Gmail, Firestore and Apollo with configurable latency."""
+import os
+import re
+import json
+import time
+import types
+import threading
+import contextlib
+from collections import Counter
+
+import requests
+
+from bench import fixtures
+
+
+# Settings naming the SQLite files the app writes
+SQLITE_PATH_SETTINGS = {
+    "SEARCH_CACHE_PATH": "search_cache.sqlite3",
+    "DORK_CACHE_PATH": "dork_cache.sqlite3",
+    "PEOPLE_INDEX_PATH": "people_index.sqlite3",
+    "OUTBOX_PATH": "outbox.sqlite3",
+    "GMAIL_SYNC_PATH": "gmail_sync.sqlite3",
+    "APOLLO_CACHE_PATH": "apollo_cache.sqlite3",
+}
+
+
+def use_sqlite_dir(directory: str):
+    """Keep the app's SQLite files in `directory` instead of ./.cache.
+
+    The paths are read when the app's modules are imported, so call this first.
+    """
+    for setting, filename in SQLITE_PATH_SETTINGS.items():
+        os.environ[setting] = os.path.join(directory, filename)
+
+
+class Upstream:
+    """Shared latency and call counting for a fake upstream."""
+
+    def __init__(self, name: str, latency: float):
+        self.name = name
+        self.latency = latency
+
+    def call(self, counters: Counter):
+        counters[self.name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+
+class FakeRequest:
+    """A googleapiclient-style request; execute() pays the upstream latency, batches call _fn directly."""
+
+    def __init__(self, fn, upstream: Upstream = None, counters: Counter = None):
+        self._fn = fn
+        self._upstream = upstream
+        self._counters = counters
+
+    def execute(self, *args, **kwargs):
+        if self._upstream is not None:
+            self._upstream.call(self._counters)
+        return self._fn()
+
+
+# Anthropic
+
+class FakeAnthropic:
+    """Returns fixture dork outputs; streaming spreads the latency over the generated text."""
+
+    def __init__(self, upstream: Upstream, counters: Counter):
+        self.messages = types.SimpleNamespace(create=self._create, stream=self._stream)
+        self._upstream = upstream
+        self._counters = counters
+
+    def _output_for_query(self, query: str) -> str:
+        for natural, output in fixtures.LLM_OUTPUTS:
+            if natural.lower() == query.lower():
+                return output
+        return fixtures.LLM_OUTPUTS[hash(query) % len(fixtures.LLM_OUTPUTS)][1]
+
+    def _output_for(self, prompt: str) -> str:
+        if "\nQueries:\n" in prompt:
+            # Batch prompt: answer every numbered query in one JSON object
+            from people_search import parse_dorks
+            numbered = re.findall(r"^(\d+)\. (.*)$", prompt.split("\nQueries:\n", 1)[1], re.MULTILINE)
+            return json.dumps({number: parse_dorks(self._output_for_query(query.strip()))
+                               for number, query in numbered})
+        match = re.search(r"User Query: (.*)", prompt)
+        return self._output_for_query(match.group(1).strip() if match else "")
+
+    def _message(self, text: str, prompt: str):
+        usage = types.SimpleNamespace(input_tokens=len(prompt) // 4, output_tokens=len(text) // 4)
+        return types.SimpleNamespace(content=[types.SimpleNamespace(text=text)], usage=usage)
+
+    def _create(self, messages, **kwargs):
+        prompt = messages[0]["content"]
+        self._upstream.call(self._counters)
+        return self._message(self._output_for(prompt), prompt)
+
+    @contextlib.contextmanager
+    def _stream(self, messages, **kwargs):
+        prompt = messages[0]["content"]
+        text = self._output_for(prompt)
+        self._counters[self._upstream.name] += 1
+        chunks = [text[i:i + 8] for i in range(0, len(text), 8)]
+        delay = self._upstream.latency / max(1, len(chunks))
+
+        def text_stream():
+            for chunk in chunks:
+                time.sleep(delay)
+                yield chunk
+
+        yield types.SimpleNamespace(text_stream=text_stream(),
+                                    get_final_message=lambda: self._message(text, prompt))
+
+
+# Google Custom Search
+
+class FakeCustomSearch:
+    def __init__(self, upstream: Upstream, counters: Counter):
+        self._upstream = upstream
+        self._counters = counters
+
+    def cse(self):
+        return self
+
+    def list(self, q, cx=None, num=5, **kwargs):
+        return FakeRequest(lambda: fixtures.cse_payload(q, num), self._upstream, self._counters)
+
+
+# Gmail
+
+class FakeGmailBatch:
+    def __init__(self, upstream, counters, callback):
+        self._upstream = upstream
+        self._counters = counters
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id=None):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        # One round-trip for the whole batch
+        self._upstream.call(self._counters)
+        for request_id, request in self._requests:
+            self._callback(request_id, request._fn(), None)
+
+
+class FakeGmailHistory:
+    """users.history with a mailbox that never changes: every delta is empty."""
+
+    def __init__(self, upstream: Upstream, counters: Counter):
+        self._upstream = upstream
+        self._counters = counters
+
+    def list(self, userId, startHistoryId, **kwargs):
+        return FakeRequest(lambda: {"historyId": startHistoryId}, self._upstream, self._counters)
+
+
+class FakeGmail:
+    """Gmail service whose mailbox holds `messages_per_contact` messages for any contact."""
+
+    def __init__(self, upstream: Upstream, counters: Counter, messages_per_contact: int = 25):
+        self._upstream = upstream
+        self._counters = counters
+        self.messages_per_contact = messages_per_contact
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def getProfile(self, userId):
+        return FakeRequest(lambda: {"emailAddress": "bench@example.com", "historyId": "1000"})
+
+    def history(self):
+        return FakeGmailHistory(self._upstream, self._counters)
+
+    def list(self, userId, q, maxResults=100, pageToken=None, **kwargs):
+        def run():
+            contact = q.split("from:")[-1].strip()
+            start = int(pageToken or 0)
+            end = min(start + maxResults, self.messages_per_contact)
+            result = {"messages": [{"id": f"{contact}-{i}"} for i in range(start, end)]}
+            if end < self.messages_per_contact:
+                result["nextPageToken"] = str(end)
+            return result
+        return FakeRequest(run, self._upstream, self._counters)
+
+    def get(self, userId, id, format="full", **kwargs):
+        def fetch():
+            message = fixtures.gmail_message(id, id.rsplit("-", 1)[0])
+            if format == "metadata":
+                message["payload"] = {"headers": message["payload"]["headers"]}
+            return message
+        return FakeRequest(fetch, self._upstream, self._counters)
+
+    def send(self, userId, body):
+        return FakeRequest(lambda: {"id": f"sent-{self._counters[self._upstream.name]}"},
+                           self._upstream, self._counters)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeGmailBatch(self._upstream, self._counters, callback)
+
+
+# Firestore
+
+class FakeSnapshot:
+    def __init__(self, reference, data):
+        self.reference = reference
+        self.id = reference.id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+    def get(self, field):
+        return (self._data or {}).get(field)
+
+
+def _apply(existing: dict, data: dict) -> dict:
+    updated = dict(existing)
+    for key, value in data.items():
+        if type(value).__name__ == "Increment":
+            updated[key] = updated.get(key, 0) + value.value
+        else:
+            updated[key] = value
+    return updated
+
+
+class FakeDocument:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[-1]
+
+    def get(self, field_paths=None, transaction=None, timeout=None):
+        self._db.upstream.call(self._db.counters)
+        with self._db.lock:
+            data = self._db.docs.get(self.path)
+            if data is not None and field_paths is not None:
+                data = {k: v for k, v in data.items() if k in field_paths}
+            return FakeSnapshot(self, data)
+
+    def set(self, data, merge=False, timeout=None):
+        self._db.upstream.call(self._db.counters)
+        self._set(data, merge)
+
+    def update(self, data, timeout=None):
+        self._db.upstream.call(self._db.counters)
+        self._update(data)
+
+    def delete(self):
+        self._db.upstream.call(self._db.counters)
+        self._delete()
+
+    # Local mutations without the round-trip, used by batches and transactions
+    def _set(self, data, merge=False):
+        with self._db.lock:
+            base = self._db.docs.get(self.path, {}) if merge else {}
+            self._db.docs[self.path] = _apply(base, data)
+
+    def _update(self, data):
+        with self._db.lock:
+            if self.path not in self._db.docs:
+                raise KeyError(f"No document to update: {self.path}")
+            self._db.docs[self.path] = _apply(self._db.docs[self.path], data)
+
+    def _delete(self):
+        with self._db.lock:
+            self._db.docs.pop(self.path, None)
+
+    def collection(self, name):
+        return FakeCollection(self._db, f"{self.path}/{name}")
+
+
+class FakeQuery:
+    def __init__(self, collection, filters):
+        self._collection = collection
+        self._filters = filters
+
+    def where(self, field, op, value):
+        return FakeQuery(self._collection, self._filters + [(field, op, value)])
+
+    def limit(self, count):
+        return self
+
+    def select(self, field_paths):
+        return self
+
+    def stream(self, timeout=None):
+        db = self._collection._db
+        db.upstream.call(db.counters)
+        prefix = self._collection.path + "/"
+        with db.lock:
+            matches = [
+                (path, data) for path, data in db.docs.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):]
+                and all(op == "==" and data.get(field) == value for field, op, value in self._filters)
+            ]
+        return [FakeSnapshot(FakeDocument(db, path), data) for path, data in matches]
+
+
+class FakeCollection:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+
+    def document(self, doc_id):
+        return FakeDocument(self._db, f"{self.path}/{doc_id}")
+
+    def where(self, field, op, value):
+        return FakeQuery(self, [(field, op, value)])
+
+    def stream(self):
+        return FakeQuery(self, []).stream()
+
+
+class FakeBatch:
+    def __init__(self, db):
+        self._db = db
+        self._ops = []
+
+    def set(self, ref, data, merge=False):
+        self._ops.append(lambda: ref._set(data, merge))
+
+    def update(self, ref, data):
+        self._ops.append(lambda: ref._update(data))
+
+    def delete(self, ref):
+        self._ops.append(ref._delete)
+
+    def commit(self, timeout=None):
+        # One round-trip for the whole batch
+        self._db.upstream.call(self._db.counters)
+        with self._db.lock:
+            for op in self._ops:
+                op()
+
+
+class FakeFirestore:
+    """Dict-backed Firestore client covering the calls the app makes."""
+
+    def __init__(self, upstream: Upstream, counters: Counter):
+        self.upstream = upstream
+        self.counters = counters
+        self.lock = threading.RLock()
+        self.docs = {}
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def batch(self):
+        return FakeBatch(self)
+
+    def run_transaction(self, ref, decide):
+        """A read, decide(data) -> (..., fields) and a merge of fields, atomic under the fake's lock.
+
+        Stands in for a @firestore.transactional read-modify-write (see SearchQuota._transact).
+        """
+        # A transaction is a read plus a commit
+        self.upstream.call(self.counters)
+        with self.lock:
+            result = decide(dict(self.docs.get(ref.path) or {}))
+            if result[-1]:
+                ref._set(result[-1], merge=True)
+        self.upstream.call(self.counters)
+        return result
+
+
+# Apollo
+
+class FakeApollo:
+    """Patches requests.Session.request so Apollo calls never leave the process."""
+
+    def __init__(self, upstream: Upstream, counters: Counter, hit_rate: float = 0.8):
+        self._upstream = upstream
+        self._counters = counters
+        self.hit_rate = hit_rate
+        self._original = requests.Session.request
+
+    def _response(self, payload, status=200):
+        response = requests.Response()
+        response.status_code = status
+        response._content = requests.compat.json.dumps(payload).encode()
+        response.headers["Content-Type"] = "application/json"
+        return response
+
+    def _person(self, key: str):
+        found = (hash(key) % 100) < self.hit_rate * 100
+        return {"email": f"{abs(hash(key)) % 100000}@example.com" if found else None}
+
+    def install(self):
+        fake = self
+
+        def request(session, method, url, *args, **kwargs):
+            if "api.apollo.io" not in url:
+                return fake._original(session, method, url, *args, **kwargs)
+            fake._upstream.call(fake._counters)
+            if "bulk_match" in url:
+                details = (kwargs.get("json") or {}).get("details", [])
+                return fake._response({"matches": [fake._person(d.get("linkedin_url", "")) for d in details]})
+            return fake._response({"person": fake._person((kwargs.get("params") or {}).get("linkedin_url", url))})
+
+        requests.Session.request = request
+
+    def uninstall(self):
+        requests.Session.request = self._original
+
+
+class FakeUpstreams:
+    """All fakes wired into the app's client registry."""
+
+    def __init__(self, llm_latency=0.8, cse_latency=0.3, gmail_latency=0.1,
+                 firestore_latency=0.02, apollo_latency=0.25):
+        self.counters = Counter()
+        self.anthropic = FakeAnthropic(Upstream("anthropic", llm_latency), self.counters)
+        self.cse = FakeCustomSearch(Upstream("cse", cse_latency), self.counters)
+        self.gmail = FakeGmail(Upstream("gmail", gmail_latency), self.counters)
+        self.firestore = FakeFirestore(Upstream("firestore", firestore_latency), self.counters)
+        self.apollo = FakeApollo(Upstream("apollo", apollo_latency), self.counters)
+
+    def seed_user(self, user_id: str, searches: int = 0):
+        self.firestore.docs[f"users/{user_id}"] = {
+            "email": f"{user_id}@example.com",
+            "access_token": "bench-token",
+            "refresh_token": "bench-refresh",
+            "token_expiry": "2099-01-01T00:00:00",
+            "searches": searches,
+            "joined_waitlist": True,
+            "profile_completed": True,
+        }
+
+    def install(self, keep_caches: bool = False):
+        """Point the app at the fakes. Import app only after calling this."""
+        import clients
+        import people_search
+
+        clients.registry.firestore = lambda: self.firestore
+        clients.registry.anthropic = lambda: self.anthropic
+        clients.registry.customsearch = lambda timeout=None: self.cse
+        clients.registry.gmail = lambda user_id, creds: self.gmail
+        self.apollo.install()
+
+        people_search.ANTHROPIC_API_KEY = people_search.ANTHROPIC_API_KEY or "bench"
+        people_search.GOOGLE_API_KEY = people_search.GOOGLE_API_KEY or "bench"
+        people_search.GOOGLE_CSE_ID = people_search.GOOGLE_CSE_ID or "bench"
+        if not keep_caches:
+            people_search.search_cache = None
+            people_search.dork_cache = None
+            people_search.people_index = None
+
+        import gmail_sync
+        if not keep_caches:
+            gmail_sync.conversation_store = None
+
+        import apollo
+        apollo.APOLLO_API_KEY = apollo.APOLLO_API_KEY or "bench"
+        if not keep_caches:
+            apollo.match_cache = None
+            apollo.miss_cache = None
+
+        import app
+        # Quota claims use a Firestore transaction; run the same decision under the fake's lock
+        app.search_quota.limit = 10 ** 9
+        app.search_quota._transact = lambda db, ref, decide: self.firestore.run_transaction(ref, decide)
+        return app
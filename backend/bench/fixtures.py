@@ -0,0 +1,107 @@
+"""Fixture corpus for the offline benchmarks: LLM dork outputs, CSE payloads and resume PDFs."""
+import random
+
+# Natural queries paired with the raw text Claude typically returns for them
+LLM_OUTPUTS = [
+    ("Find software engineers at Microsoft in Seattle",
+     '```json\n[\n  "site:linkedin.com/in \\"software engineer\\" \\"Microsoft\\" \\"Seattle\\"",\n'
+     '  "(site:linkedin.com/in OR site:twitter.com) \\"software engineer\\" \\"Microsoft\\" \\"Seattle\\"",\n'
+     '  "site:linkedin.com/in \\"SDE\\" \\"Microsoft\\" \\"Seattle\\"",\n'
+     '  "site:twitter.com \\"software engineer\\" \\"Microsoft\\" inurl:/status"\n]\n```'),
+    ("Find Sarah Johnson who works at Google",
+     '```json\n[\n  "site:linkedin.com/in \\"Sarah Johnson\\" \\"Google\\"",\n'
+     '  "site:twitter.com \\"Sarah Johnson\\" \\"Google\\"",\n'
+     '  "site:linkedin.com/in \\"Sarah Johnson\\" \\"Google\\" OR site:twitter.com \\"Sarah Johnson\\" \\"Google\\""\n]\n```'),
+    ("Find data scientists who graduated from MIT",
+     '[\n  "site:linkedin.com/in \\"data scientist\\" \\"MIT\\"",\n'
+     '  "site:linkedin.com/in \\"data scientist\\" \\"Massachusetts Institute of Technology\\"",\n'
+     '  "(site:linkedin.com/in OR site:twitter.com) \\"data scientist\\" \\"MIT\\" \\"alumni\\"",\n'
+     '  "site:linkedin.com/in \\"machine learning\\" \\"MIT\\"",\n'
+     '  "site:linkedin.com/in \\"data science\\" \\"MIT\\" \\"PhD\\""\n]'),
+    ("Find startup founders in San Francisco",
+     '```json\n[\n  "site:linkedin.com/in \\"founder\\" \\"San Francisco\\"",\n'
+     '  "site:linkedin.com/in \\"co-founder\\" \\"startup\\" \\"San Francisco\\"",\n'
+     '  "site:twitter.com \\"founder\\" \\"San Francisco\\" inurl:/status",\n'
+     '  "(site:linkedin.com/in OR site:twitter.com OR site:instagram.com) \\"startup founder\\" \\"CEO\\"",\n'
+     '  "site:linkedin.com/in \\"founder\\" \\"SF Bay Area\\"",\n'
+     '  "site:linkedin.com/in \\"CEO\\" \\"seed\\" \\"San Francisco\\""\n]\n```'),
+    ("Find people who recently joined Meta",
+     '```json\n[\n  "site:linkedin.com/in \\"Meta\\" \\"new position\\" after:2024-02-01",\n'
+     '  "site:linkedin.com/in \\"joined Meta\\"",\n'
+     '  "site:linkedin.com/in \\"Meta\\" \\"started a new position\\""\n]\n```'),
+]
+
+FIRST_NAMES = ["Alex", "Priya", "Wei", "Maria", "James", "Fatima", "Noah", "Yuki", "Omar", "Emma",
+               "Lucas", "Aisha", "Chen", "Sofia", "Daniel", "Zara", "Ethan", "Lena", "Ravi", "Grace"]
+LAST_NAMES = ["Smith", "Patel", "Zhang", "Garcia", "Kim", "Khan", "Nguyen", "Brown", "Silva", "Cohen",
+              "Ivanova", "Okafor", "Tanaka", "Müller", "Johnson", "Rossi", "Haddad", "Lee", "Wilson", "Chen"]
+TITLES = ["Software Engineer", "Senior Data Scientist", "Product Manager", "Founder & CEO",
+          "Machine Learning Engineer", "Engineering Manager", "Staff Engineer", "Research Scientist"]
+COMPANIES = ["Microsoft", "Google", "Meta", "Stripe", "OpenAI", "Airbnb", "Amazon", "a stealth startup"]
+CITIES = ["Seattle", "San Francisco", "New York", "London", "Boston", "Austin"]
+
+
+def cse_payload(dork: str, num: int = 5) -> dict:
+    """A realistic CSE response, deterministic per dork so repeated runs compare cleanly."""
+    rng = random.Random(dork)
+    items = []
+    for _ in range(num):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        title, company, city = rng.choice(TITLES), rng.choice(COMPANIES), rng.choice(CITIES)
+        slug = f"{first}-{last}-{rng.randrange(16 ** 6):06x}".lower()
+        items.append({
+            "kind": "customsearch#result",
+            "title": f"{first} {last} - {title} - {company} | LinkedIn",
+            "link": f"https://www.linkedin.com/in/{slug}",
+            "displayLink": "www.linkedin.com",
+            "snippet": f"{title} at {company}. {city}. 500+ connections on LinkedIn. "
+                       f"View {first} {last}'s profile on LinkedIn, a professional community of 1 billion members.",
+        })
+    return {"kind": "customsearch#search", "items": items}
+
+
+def gmail_message(message_id: str, contact: str, body_chars: int = 4000) -> dict:
+    """A Gmail API message resource in format=full."""
+    import base64
+    rng = random.Random(message_id)
+    text = " ".join(rng.choice(["hello", "meeting", "follow", "up", "thanks", "resume", "intro", "coffee"])
+                    for _ in range(body_chars // 6))
+    data = base64.urlsafe_b64encode(text.encode()).decode()
+    return {
+        "id": message_id,
+        "threadId": message_id,
+        "internalDate": str(1711965600000 + rng.randrange(10 ** 9)),
+        "payload": {
+            "mimeType": "multipart/alternative",
+            "headers": [
+                {"name": "Subject", "value": f"Re: intro {message_id}"},
+                {"name": "From", "value": contact},
+                {"name": "To", "value": "me@example.com"},
+                {"name": "Date", "value": "Mon, 1 Apr 2024 10:00:00 +0000"},
+            ],
+            "parts": [
+                {"mimeType": "text/plain", "body": {"data": data}},
+                {"mimeType": "text/html", "body": {"data": data}},
+            ],
+        },
+    }
+
+
+def resume_pdf(pages: int = 2, images: bool = False) -> bytes:
+    """Generate a resume-like PDF with PyMuPDF."""
+    import fitz  # PyMuPDF
+    doc = fitz.open()
+    for page_no in range(pages):
+        page = doc.new_page()
+        y = 72
+        for line in range(40):
+            page.insert_text((72, y), f"Experience {page_no}.{line}: Built distributed systems at scale, "
+                                      "led a team of engineers, shipped ML features.", fontsize=9)
+            y += 16
+        if images:
+            pix = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 400, 400), False)
+            pix.clear_with(page_no * 7 % 255)
+            page.insert_image(fitz.Rect(300, 500, 500, 700), pixmap=pix)
+    data = doc.tobytes()
+    doc.close()
+    return data
@@ -0,0 +1,220 @@
+"""Offline load driver for the backend.
+
+Runs the Flask handlers in-process against the fakes in bench/fakes.py and
+reports throughput and p50/p95/p99 latency per endpoint.
+
+    python -m bench.run --requests 100 --concurrency 8
+    python -m bench.run --save-baseline bench-baseline.json
+    python -m bench.run --compare bench-baseline.json --tolerance 0.15
+
+--compare exits non-zero when an endpoint's p95 or throughput regressed by
+more than the tolerance.
+"""
+import io
+import json
+import time
+import tempfile
+import argparse
+import itertools
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from bench import fixtures
+from bench.fakes import FakeUpstreams, use_sqlite_dir
+
+# Queries per /search/batch request
+BATCH_QUERIES = 5
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(pct / 100 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+
+class Scenarios:
+    """One callable per endpoint; each returns True on success."""
+
+    def __init__(self, app, upstreams: FakeUpstreams):
+        self.app = app
+        self.upstreams = upstreams
+        self._local = threading.local()
+        self._worker_ids = itertools.count()
+        self._profile_ids = itertools.count()
+        self._queries = itertools.cycle([natural for natural, _output in fixtures.LLM_OUTPUTS])
+        self._resume = fixtures.resume_pdf(pages=3)
+
+    def _client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.app.test_client()
+            self._local.user_id = f"bench-{next(self._worker_ids)}"
+            self.upstreams.seed_user(self._local.user_id)
+            with client.session_transaction() as session:
+                session["user_id"] = self._local.user_id
+        return client
+
+    def search(self):
+        response = self._client().post("/search", json={"query": next(self._queries)})
+        return response.status_code == 200
+
+    def search_stream(self):
+        response = self._client().post("/search/stream", json={"query": next(self._queries)})
+        lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+        return response.status_code == 200 and bool(lines) and lines[-1].get("type") == "done"
+
+    def search_batch(self):
+        queries = [next(self._queries) for _ in range(BATCH_QUERIES)]
+        response = self._client().post("/search/batch", json={"queries": queries})
+        return response.status_code == 200
+
+    def read_with(self):
+        client = self._client()
+        response = client.post("/read_with", json={"username": self._local.user_id,
+                                                   "email": "contact@example.com"})
+        return response.status_code == 200
+
+    def complete_profile(self):
+        response = self._client().post(
+            "/complete_profile",
+            data={"resume_file": (io.BytesIO(self._resume), "resume.pdf"), "additional_details": "bench"},
+            content_type="multipart/form-data",
+        )
+        return response.status_code in (200, 202)
+
+    def get_email(self):
+        response = self._client().post("/get_email", json={
+            "first_name": "Alex", "last_name": "Smith",
+            "linkedin_url": f"https://www.linkedin.com/in/alex-smith-{next(self._profile_ids) % 50}",
+        })
+        return response.status_code in (200, 404)
+
+    def get_email_bulk(self):
+        # One /search page worth of profiles
+        start = next(self._profile_ids)
+        response = self._client().post("/get_email/bulk", json={"people": [
+            {"first_name": "Alex", "last_name": "Smith",
+             "linkedin_url": f"https://www.linkedin.com/in/alex-smith-{(start + i) % 50}"}
+            for i in range(10)
+        ]})
+        return response.status_code == 200
+
+    def generate_google_dorks(self):
+        import people_search
+        return bool(people_search.generate_google_dorks(next(self._queries)))
+
+
+def run_endpoint(fn, requests_count: int, concurrency: int) -> dict:
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        start = time.perf_counter()
+        try:
+            ok = fn()
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests_count)))
+    wall = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "requests": requests_count,
+        "errors": errors,
+        "throughput_rps": requests_count / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Human-readable regressions of `results` against `baseline`."""
+    regressions = []
+    for endpoint, current in results.items():
+        base = baseline.get(endpoint)
+        if not base:
+            continue
+        if current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{endpoint}: p95 {base['p95_ms']:.1f}ms -> {current['p95_ms']:.1f}ms")
+        if current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{endpoint}: throughput {base['throughput_rps']:.1f} -> "
+                               f"{current['throughput_rps']:.1f} req/s")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the MeetDave backend")
+    parser.add_argument("--endpoints", default="search,search_stream,search_batch,read_with,complete_profile,"
+                                               "get_email,get_email_bulk,generate_google_dorks")
+    parser.add_argument("--requests", type=int, default=50, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-latency", type=float, default=0.8)
+    parser.add_argument("--cse-latency", type=float, default=0.3)
+    parser.add_argument("--gmail-latency", type=float, default=0.1)
+    parser.add_argument("--firestore-latency", type=float, default=0.02)
+    parser.add_argument("--apollo-latency", type=float, default=0.25)
+    parser.add_argument("--keep-caches", action="store_true", help="leave the dork/CSE caches enabled")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--compare", metavar="FILE")
+    parser.add_argument("--tolerance", type=float, default=0.15)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory(prefix="meetdave-bench-") as directory:
+        use_sqlite_dir(directory)
+        return run(args)
+
+
+def run(args):
+    upstreams = FakeUpstreams(llm_latency=args.llm_latency, cse_latency=args.cse_latency,
+                              gmail_latency=args.gmail_latency, firestore_latency=args.firestore_latency,
+                              apollo_latency=args.apollo_latency)
+    app = upstreams.install(keep_caches=args.keep_caches)
+    scenarios = Scenarios(app, upstreams)
+
+    results = {}
+    for endpoint in args.endpoints.split(","):
+        before = Counter(upstreams.counters)
+        results[endpoint] = run_endpoint(getattr(scenarios, endpoint), args.requests, args.concurrency)
+        calls = Counter(upstreams.counters)
+        calls.subtract(before)
+        results[endpoint]["upstream_calls"] = {name: count for name, count in calls.items() if count}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'endpoint':<24}{'req/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}  upstream calls")
+        for endpoint, r in results.items():
+            calls = ", ".join(f"{k}={v}" for k, v in sorted(r["upstream_calls"].items()))
+            print(f"{endpoint:<24}{r['throughput_rps']:>9.1f}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+                  f"{r['p99_ms']:>10.1f}{r['errors']:>8}  {calls}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
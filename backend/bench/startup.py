@@ -0,0 +1,150 @@
+"""Cold-start benchmark: import time of app.py, time to the first /health, and RSS.
+
+Each run starts a fresh interpreter, so nothing is shared between runs.
+
+    python -m bench.startup --runs 5
+    python -m bench.startup --save-baseline startup-baseline.json
+    python -m bench.startup --compare startup-baseline.json --tolerance 0.2
+
+--compare exits non-zero when any median got worse by more than the tolerance.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import statistics
+import tempfile
+import subprocess
+import urllib.request
+
+from bench.fakes import use_sqlite_dir
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORT_PROBE = """
+import json, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+heavy = [m for m in ("anthropic", "googleapiclient", "google.cloud.firestore", "google_auth_oauthlib",
+                     "aiohttp", "fitz") if m in __import__("sys").modules]
+rss = 0
+with open("/proc/self/status") as f:
+    for line in f:
+        if line.startswith("VmRSS:"):
+            rss = int(line.split()[1]) / 1024
+print(json.dumps({"import_s": elapsed, "rss_mb": rss, "heavy_modules": heavy}))
+"""
+
+
+def rss_mb(pid: int) -> float:
+    """Resident set size of a process in MB (Linux only; 0 elsewhere)."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return 0.0
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure_import(env: dict) -> dict:
+    output = subprocess.run([sys.executable, "-c", IMPORT_PROBE], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_first_health(env: dict, timeout: float, settle: float) -> dict:
+    """Start the dev server and poll /health until it answers."""
+    port = free_port()
+    env = {**env, "PORT": str(port), "HOST": "127.0.0.1", "DEBUG": "false"}
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "app.py"], cwd=BACKEND_DIR, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"app.py exited with code {server.returncode}")
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError(f"/health did not answer within {timeout}s")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as response:
+                    if response.status == 200:
+                        break
+            except OSError:
+                time.sleep(0.02)
+        first_health = time.perf_counter() - start
+        result = {"first_health_s": first_health, "rss_at_health_mb": rss_mb(server.pid)}
+        if settle:
+            # Give the background warm-up time to finish, then see what it costs in memory
+            time.sleep(settle)
+            result["rss_warm_mb"] = rss_mb(server.pid)
+        return result
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cold-start benchmark for the MeetDave backend")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=60, help="seconds to wait for /health")
+    parser.add_argument("--settle", type=float, default=0,
+                        help="seconds to wait after /health before sampling RSS again")
+    parser.add_argument("--no-warmup", action="store_true", help="run with WARMUP=false")
+    parser.add_argument("--save-baseline", metavar="FILE")
+    parser.add_argument("--compare", metavar="FILE")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    samples = []
+    heavy = []
+    with tempfile.TemporaryDirectory(prefix="meetdave-startup-") as directory:
+        use_sqlite_dir(directory)
+        env = dict(os.environ)
+        if args.no_warmup:
+            env["WARMUP"] = "false"
+        for _ in range(args.runs):
+            imported = measure_import(env)
+            heavy = imported.pop("heavy_modules")
+            samples.append({**imported, **measure_first_health(env, args.timeout, args.settle)})
+
+    results = {key: statistics.median(sample[key] for sample in samples) for key in samples[0]}
+    if args.json:
+        print(json.dumps({**results, "heavy_modules_at_import": heavy}, indent=2))
+    else:
+        for key, value in results.items():
+            unit = "s" if key.endswith("_s") else "MB"
+            print(f"{key:<20}{value:>10.3f} {unit}")
+        print(f"{'heavy modules':<20}{', '.join(heavy) or 'none'}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = [
+            f"{key}: {baseline[key]:.3f} -> {value:.3f}"
+            for key, value in results.items()
+            if baseline.get(key) and value > baseline[key] * (1 + args.tolerance)
+        ]
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,205 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+class CacheStats:
+    """Hit/miss/eviction counters shared by every cache backend."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def evicted(self, count: int = 1):
+        with self._lock:
+            self.evictions += count
+
+    def as_dict(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / total) if total else 0.0,
+            }
+
+
+class MemoryCache:
+    """In-process TTL cache with size-bounded LRU eviction."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.time():
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+        self.stats.record(entry is not None)
+        return entry[1] if entry is not None else None
+
+    def set(self, key: str, value):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            evicted = 0
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                evicted += 1
+        if evicted:
+            self.stats.evicted(evicted)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def info(self) -> dict:
+        return {"backend": "memory", "size": len(self), "max_entries": self.max_entries,
+                "ttl": self.ttl, **self.stats.as_dict()}
+
+
+class ProcessConnection:
+    """A SQLite connection opened on first use in each process.
+
+    A connection must not be used on both sides of a fork() (gunicorn --preload
+    imports the app before forking workers), so nothing is opened at import and
+    a process that finds a connection from its parent opens its own. `setup(conn)`
+    creates the schema; it runs for every connection opened.
+    """
+
+    def __init__(self, path: str, setup, timeout: float = 5.0):
+        self.path = path
+        self._setup = setup
+        self._timeout = timeout
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+
+    def get(self) -> sqlite3.Connection:
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    conn = sqlite3.connect(self.path, check_same_thread=False, timeout=self._timeout)
+                    with conn:
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        self._setup(conn)
+                    self._conn, self._pid = conn, os.getpid()
+        return self._conn
+
+
+class SQLiteCache:
+    """On-disk TTL/LRU cache that survives restarts. Values must be JSON-serializable."""
+
+    def __init__(self, path: str, ttl: float, max_entries: int, table: str = "cache"):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.table = table
+        self.stats = CacheStats()
+        self._lock = threading.Lock()
+        self._db = ProcessConnection(path, self._create_table)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        return self._db.get()
+
+    def _create_table(self, conn):
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table}(accessed_at)")
+
+    def get(self, key: str):
+        now = time.time()
+        value = None
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[1] <= now:
+                self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                row = None
+            if row is not None:
+                self._conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+                value = json.loads(row[0])
+        self.stats.record(row is not None)
+        return value
+
+    def set(self, key: str, value):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now),
+            )
+            count = self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    f"DELETE FROM {self.table} WHERE key IN "
+                    f"(SELECT key FROM {self.table} ORDER BY accessed_at ASC LIMIT ?)",
+                    (overflow,),
+                )
+        if overflow > 0:
+            self.stats.evicted(overflow)
+
+    def delete(self, key: str):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute(f"DELETE FROM {self.table}")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+
+    def info(self) -> dict:
+        return {"backend": "sqlite", "path": self.path, "size": len(self),
+                "max_entries": self.max_entries, "ttl": self.ttl, **self.stats.as_dict()}
+
+
+def make_cache(backend: str, ttl: float, max_entries: int, path: str = None, table: str = "cache"):
+    """Build a cache from config. Returns None when caching is disabled."""
+    backend = (backend or "").lower()
+    if backend in ("", "none", "off"):
+        return None
+    if backend == "memory":
+        return MemoryCache(ttl=ttl, max_entries=max_entries)
+    if backend == "sqlite":
+        return SQLiteCache(path=path, ttl=ttl, max_entries=max_entries, table=table)
+    raise ValueError(f"Unknown cache backend: {backend}")
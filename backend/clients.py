@@ -0,0 +1,298 @@
+import os
+import time
+import asyncio
+import logging
+import importlib
+import threading
+import weakref
+from collections import OrderedDict
+from functools import partial
+
+from dotenv import load_dotenv
+
+# The SDKs below (anthropic, googleapiclient, google.cloud.firestore, aiohttp, ...) take
+# seconds to import, so they are imported inside the methods that build clients rather
+# than here; /health and other light routes never pay for them. See warm_up().
+
+# Load environment variables
+load_dotenv()
+ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
+GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
+FIRESTORE_CREDENTIALS_PATH = os.environ.get("FIRESTORE_CREDENTIALS_PATH", "./firestore-creds.json")
+
+# Default socket timeout for pooled httplib2 connections, in seconds
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 30))
+# Per-request deadlines for the Anthropic and Firestore SDKs, in seconds
+ANTHROPIC_TIMEOUT = float(os.environ.get("ANTHROPIC_TIMEOUT", 60))
+FIRESTORE_TIMEOUT = float(os.environ.get("FIRESTORE_TIMEOUT", 10))
+# Max number of per-user Gmail services kept alive
+GMAIL_SERVICE_CACHE_SIZE = int(os.environ.get("GMAIL_SERVICE_CACHE_SIZE", 256))
+# Max open connections in each event loop's aiohttp pool
+ASYNC_HTTP_LIMIT = int(os.environ.get("ASYNC_HTTP_LIMIT", 100))
+# Keep-alive connections per host in the shared requests.Session
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 20))
+# Preload SDKs and clients in the background once the server has handled its first request
+WARMUP = os.environ.get("WARMUP", "true").lower() == "true"
+
+# Imported by warm_up() in this order; the slowest first
+HEAVY_MODULES = (
+    "anthropic",
+    "googleapiclient.discovery",
+    "google.cloud.firestore",
+    "google_auth_oauthlib.flow",
+    "google.oauth2.credentials",
+    "google.auth.transport.requests",
+    "google_auth_httplib2",
+    "aiohttp",
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ClientRegistry:
+    """Process-wide, lazily built API clients.
+
+    Every client is created on first use under a lock and shared afterwards.
+    gRPC channels, sockets and locks don't survive fork(), so the registry
+    notices when it is running in a new PID (e.g. a gunicorn prefork worker)
+    and starts over with fresh clients.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.RLock()
+        self._clients = {}
+        self._gmail_services = OrderedDict()
+        # httplib2.Http isn't thread-safe, so each thread gets its own keep-alive connection pool
+        self._local = threading.local()
+
+    def _check_pid(self):
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _get(self, name, factory):
+        self._check_pid()
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    client = self._clients[name] = factory()
+        return client
+
+    def thread_http(self, timeout: float = HTTP_TIMEOUT) -> "httplib2.Http":
+        """A keep-alive httplib2.Http owned by the calling thread."""
+        import httplib2
+        self._check_pid()
+        pools = getattr(self._local, "pools", None)
+        if pools is None:
+            pools = self._local.pools = {}
+        http = pools.get(timeout)
+        if http is None:
+            http = pools[timeout] = httplib2.Http(timeout=timeout)
+        return http
+
+    def _request_builder(self, http, *args, credentials=None, timeout=HTTP_TIMEOUT, **kwargs):
+        # Ignore the service-wide http and send each request over the calling thread's pool,
+        # which is what makes a single discovery-built service safe to share across threads
+        import google_auth_httplib2
+        from googleapiclient.http import HttpRequest
+        http = self.thread_http(timeout)
+        if credentials is not None:
+            http = google_auth_httplib2.AuthorizedHttp(credentials, http=http)
+        return HttpRequest(http, *args, **kwargs)
+
+    def firestore(self):
+        def factory():
+            from google.cloud import firestore
+            os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = FIRESTORE_CREDENTIALS_PATH
+            return firestore.Client()
+        return self._get("firestore", factory)
+
+    def anthropic(self):
+        # The SDK keeps an httpx connection pool alive for the life of the client
+        def factory():
+            import anthropic
+            # Retries are done by resilience.call, with the circuit breaker in the loop
+            return anthropic.Anthropic(api_key=ANTHROPIC_API_KEY, timeout=ANTHROPIC_TIMEOUT, max_retries=0)
+        return self._get("anthropic", factory)
+
+    def customsearch(self, timeout: float = HTTP_TIMEOUT):
+        def factory():
+            from googleapiclient.discovery import build
+            return build(
+                "customsearch", "v1", developerKey=GOOGLE_API_KEY,
+                requestBuilder=partial(self._request_builder, timeout=timeout),
+            )
+        return self._get(f"customsearch:{timeout}", factory)
+
+    def http_session(self) -> "requests.Session":
+        """Shared requests.Session for plain REST APIs (Apollo), with a keep-alive pool per host."""
+        def factory():
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            return session
+        return self._get("http_session", factory)
+
+    def gmail(self, user_id: str, creds):
+        """Per-user Gmail service, reused while the user's access token is unchanged."""
+        self._check_pid()
+        with self._lock:
+            entry = self._gmail_services.get(user_id)
+            if entry is not None and entry[0] == creds.token:
+                self._gmail_services.move_to_end(user_id)
+                return entry[1]
+        from googleapiclient.discovery import build
+        service = build(
+            "gmail", "v1", credentials=creds,
+            requestBuilder=partial(self._request_builder, credentials=creds),
+        )
+        with self._lock:
+            self._gmail_services[user_id] = (creds.token, service)
+            self._gmail_services.move_to_end(user_id)
+            while len(self._gmail_services) > GMAIL_SERVICE_CACHE_SIZE:
+                self._gmail_services.popitem(last=False)
+        return service
+
+
+class AsyncClientRegistry:
+    """Async clients shared by every coroutine running on the same event loop.
+
+    aiohttp sessions and the async Anthropic client are bound to the loop they
+    were created on, so each loop gets its own set; they go away with the loop.
+    """
+
+    def __init__(self):
+        self._clients = weakref.WeakKeyDictionary()  # loop -> {name: client}
+
+    def _get(self, name, factory):
+        loop = asyncio.get_running_loop()
+        clients = self._clients.setdefault(loop, {})
+        client = clients.get(name)
+        if client is None:
+            client = clients[name] = factory()
+        return client
+
+    def http_session(self) -> "aiohttp.ClientSession":
+        def factory():
+            import aiohttp
+            return aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=ASYNC_HTTP_LIMIT, keepalive_timeout=60)
+            )
+        return self._get("http", factory)
+
+    def anthropic(self):
+        def factory():
+            import anthropic
+            # Retries happen in resilience.call, as for the sync client
+            return anthropic.AsyncAnthropic(api_key=ANTHROPIC_API_KEY, timeout=ANTHROPIC_TIMEOUT, max_retries=0)
+        return self._get("anthropic", factory)
+
+
+class BackgroundLoop:
+    """One event loop per process, running on a daemon thread, for calling async code from sync code."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+
+    def _get_loop(self):
+        with self._lock:
+            if self._loop is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="async-loop", daemon=True).start()
+            return self._loop
+
+    def run(self, coro, timeout: float = None):
+        """Run `coro` on the background loop and block until it finishes."""
+        future = asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+
+registry = ClientRegistry()
+async_registry = AsyncClientRegistry()
+background_loop = BackgroundLoop()
+
+if hasattr(os, "register_at_fork"):
+    # Drop inherited clients in the child right away rather than on first use
+    os.register_at_fork(after_in_child=registry._reset)
+
+
+def get_firestore_client():
+    return registry.firestore()
+
+
+def get_anthropic_client():
+    return registry.anthropic()
+
+
+def get_customsearch_service(timeout: float = HTTP_TIMEOUT):
+    return registry.customsearch(timeout)
+
+
+def get_http_session() -> "requests.Session":
+    return registry.http_session()
+
+
+def get_gmail_service(user_id: str, creds):
+    return registry.gmail(user_id, creds)
+
+
+def get_async_http_session() -> "aiohttp.ClientSession":
+    return async_registry.http_session()
+
+
+def get_async_anthropic_client():
+    return async_registry.anthropic()
+
+
+def run_sync(coro, timeout: float = None):
+    return background_loop.run(coro, timeout)
+
+
+_warmup_lock = threading.Lock()
+_warmup_started = False
+
+
+def warm_up(hooks=()):
+    """Import the heavy SDKs and build the shared clients so the first real request doesn't pay for them.
+
+    `hooks` are extra callables run afterwards, e.g. to build clients with non-default settings.
+    """
+    start = time.perf_counter()
+    for name in HEAVY_MODULES:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            logger.warning("Warm-up could not import %s", name, exc_info=True)
+    for build_client in (registry.anthropic, registry.http_session, registry.firestore, *hooks):
+        try:
+            build_client()
+        except Exception:
+            logger.warning("Warm-up step %s failed", getattr(build_client, "__name__", build_client), exc_info=True)
+    logger.info("Warm-up finished in %.2fs", time.perf_counter() - start)
+
+
+def start_warm_up(hooks=()):
+    """Run warm_up(hooks) once per process on a daemon thread. Cheap to call on every request."""
+    global _warmup_started
+    if _warmup_started or not WARMUP:
+        return
+    with _warmup_lock:
+        if _warmup_started:
+            return
+        _warmup_started = True
+    threading.Thread(target=warm_up, args=(hooks,), name="warm-up", daemon=True).start()
@@ -0,0 +1,137 @@
+import os
+import logging
+import threading
+import datetime
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# Refresh tokens this many seconds before they expire
+CREDENTIALS_REFRESH_MARGIN = float(os.environ.get("CREDENTIALS_REFRESH_MARGIN", 300))
+# Max number of users whose credentials are kept in memory (least recently used dropped first)
+CREDENTIALS_CACHE_SIZE = int(os.environ.get("CREDENTIALS_CACHE_SIZE", 1024))
+
+logger = logging.getLogger(__name__)
+
+
+class CredentialCache:
+    """Per-user OAuth credentials cache with single-flight token refresh.
+
+    `load(user_id)` builds Credentials from storage (or returns None) and
+    `save(user_id, creds)` persists a refreshed token. Saves run on a background
+    thread, so a cache hit costs no storage round-trips at all.
+
+    At most `max_size` users are kept, least recently used dropped first. A
+    user's refresh lock only exists while a refresh for them is in flight.
+    """
+
+    def __init__(self, load, save, refresh_margin: float = CREDENTIALS_REFRESH_MARGIN,
+                 max_size: int = CREDENTIALS_CACHE_SIZE):
+        self._load = load
+        self._save = save
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._user_locks = {}    # user_id -> [lock, callers holding or waiting for it]
+        self._background = set()
+        self._writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix="creds-writeback")
+
+    @contextmanager
+    def _user_lock(self, user_id):
+        with self._lock:
+            entry = self._user_locks.get(user_id)
+            if entry is None:
+                entry = self._user_locks[user_id] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._user_locks[user_id]
+
+    def _cached(self, user_id):
+        with self._lock:
+            creds = self._entries.get(user_id)
+            if creds is not None:
+                self._entries.move_to_end(user_id)
+            return creds
+
+    def _store(self, user_id, creds):
+        with self._lock:
+            self._entries[user_id] = creds
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _needs_refresh(self, creds, margin):
+        if not creds.refresh_token:
+            return False
+        if creds.expiry is None:
+            return not creds.token
+        # google-auth stores expiry as naive UTC
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return creds.expiry - margin <= now
+
+    def get(self, user_id):
+        creds = self._cached(user_id)
+        if creds is not None and not self._needs_refresh(creds, self.refresh_margin):
+            return creds
+
+        if creds is not None and not self._needs_refresh(creds, datetime.timedelta(0)):
+            # Still valid but close to expiry: refresh in the background, serve the current token
+            with self._lock:
+                start = user_id not in self._background
+                self._background.add(user_id)
+            if start:
+                self._writer.submit(self._background_refresh, user_id)
+            return creds
+
+        return self._refresh(user_id)
+
+    def _refresh(self, user_id):
+        with self._user_lock(user_id):
+            # Another caller may have refreshed while we waited for the lock
+            creds = self._cached(user_id)
+            if creds is not None and not self._needs_refresh(creds, self.refresh_margin):
+                return creds
+            if creds is None:
+                creds = self._load(user_id)
+                if creds is None:
+                    return None
+            if self._needs_refresh(creds, self.refresh_margin):
+                try:
+                    from google.auth.transport.requests import Request
+                    creds.refresh(Request())
+                except Exception:
+                    # A failed refresh of a token that hasn't expired yet isn't fatal
+                    if self._needs_refresh(creds, datetime.timedelta(0)):
+                        raise
+                    logger.warning("Early token refresh failed for %s", user_id, exc_info=True)
+                else:
+                    self._writer.submit(self._write_back, user_id, creds)
+            self._store(user_id, creds)
+            return creds
+
+    def _background_refresh(self, user_id):
+        try:
+            self._refresh(user_id)
+        except Exception:
+            logger.warning("Background token refresh failed for %s", user_id, exc_info=True)
+        finally:
+            with self._lock:
+                self._background.discard(user_id)
+
+    def _write_back(self, user_id, creds):
+        try:
+            self._save(user_id, creds)
+        except Exception:
+            logger.exception("Failed to persist refreshed token for %s", user_id)
+
+    def invalidate(self, user_id):
+        """Forget a user's cached credentials, e.g. after they log in again."""
+        with self._lock:
+            self._entries.pop(user_id, None)
@@ -0,0 +1,272 @@
+import os
+import re
+
+DORK_OPTIMIZE = os.environ.get("DORK_OPTIMIZE", "true").lower() == "true"
+# Google caps queries at 2048 characters and ignores words past the 32nd
+DORK_MAX_LENGTH = int(os.environ.get("DORK_MAX_LENGTH", 2048))
+DORK_MAX_WORDS = int(os.environ.get("DORK_MAX_WORDS", 32))
+# Most alternatives a merge may put in one OR group; wider groups dilute the top results
+DORK_MAX_ALTERNATIVES = int(os.environ.get("DORK_MAX_ALTERNATIVES", 4))
+
+
+# ( ) | and leaf tokens: optional -, optional operator:, then a "quoted phrase" or a bare word
+_TOKEN = re.compile(r'\(|\)|\||-?(?:[A-Za-z]+:)?(?:"[^"]*"|[^\s()"|]+)')
+
+# Clause kinds that can become alternatives of an OR when two dorks differ only there
+_MERGEABLE_OPERATORS = {"site", "inurl", "intitle", "intext"}
+
+# Rendering order of clause kinds, so canonical dorks read like hand-written ones
+_OPERATOR_ORDER = {"site": 0, "inurl": 1, "intitle": 2, "intext": 3}
+
+
+class DorkSyntaxError(ValueError):
+    pass
+
+
+# AST nodes are tuples so they can live in frozensets:
+#   ("term", text, negated)    ("phrase", text, negated)    ("op", name, value, negated)
+#   ("or", frozenset(alternatives))                         ("and", frozenset(clauses))
+# A dork is the frozenset of its top-level (ANDed) clauses.
+
+def _leaf(token: str):
+    negated = token.startswith("-") and len(token) > 1
+    if negated:
+        token = token[1:]
+    match = re.match(r"([A-Za-z]+):(.+)$", token)
+    if match:
+        name, value = match.group(1).casefold(), match.group(2)
+        if value.startswith('"'):
+            value = " ".join(value.strip('"').split())
+            value = f'"{value.casefold()}"' if " " in value else value.casefold()
+        else:
+            value = value.casefold()
+        if name == "site":
+            value = re.sub(r"^(https?://)?(www\.)?", "", value).rstrip("/")
+        return ("op", name, value, negated)
+    if token.startswith('"'):
+        return ("phrase", " ".join(token.strip('"').split()).casefold(), negated)
+    return ("term", token.casefold(), negated)
+
+
+def _site_covers(broad: str, narrow: str) -> bool:
+    return narrow == broad or narrow.startswith(broad + "/")
+
+
+def _make_and(clauses) -> frozenset:
+    flat = set()
+    for clause in clauses:
+        if clause[0] == "and":
+            flat |= clause[1]
+        else:
+            flat.add(clause)
+    # site:a.com site:a.com/in is just site:a.com/in
+    sites = [c for c in flat if c[0] == "op" and c[1] == "site" and not c[3]]
+    for broad in sites:
+        if any(other is not broad and _site_covers(broad[2], other[2]) for other in sites):
+            flat.discard(broad)
+    return frozenset(flat)
+
+
+def _make_or(alternatives):
+    flat = set()
+    for alternative in alternatives:
+        if alternative[0] == "or":
+            flat |= alternative[1]
+        else:
+            flat.add(alternative)
+    # site:a.com OR site:a.com/in is just site:a.com
+    sites = [a for a in flat if a[0] == "op" and a[1] == "site" and not a[3]]
+    for narrow in sites:
+        if any(other is not narrow and _site_covers(other[2], narrow[2]) for other in sites):
+            flat.discard(narrow)
+    if len(flat) == 1:
+        return next(iter(flat))
+    return ("or", frozenset(flat))
+
+
+def parse_dork(dork: str) -> frozenset:
+    """Parse a dork into its canonical set of ANDed clauses. Raises DorkSyntaxError."""
+    tokens = _TOKEN.findall(dork)
+    # Anything the tokenizer skipped (a stray quote, "-(" ...) means we don't understand the dork
+    if "".join("".join(t.split()) for t in tokens) != "".join(dork.split()):
+        raise DorkSyntaxError(dork)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def parse_and(closing):
+        nonlocal position
+        clauses = []
+        while peek() is not None and peek() != ")":
+            clauses.append(parse_or())
+        if closing:
+            if peek() != ")":
+                raise DorkSyntaxError(dork)
+            position += 1
+        elif peek() is not None:
+            raise DorkSyntaxError(dork)
+        return clauses
+
+    def parse_or():
+        nonlocal position
+        alternatives = [parse_atom()]
+        while peek() in ("OR", "|"):
+            position += 1
+            alternatives.append(parse_atom())
+        return _make_or(alternatives) if len(alternatives) > 1 else alternatives[0]
+
+    def parse_atom():
+        nonlocal position
+        token = peek()
+        if token is None or token in (")", "OR", "|"):
+            raise DorkSyntaxError(dork)
+        position += 1
+        if token == "(":
+            group = _make_and(parse_and(closing=True))
+            if not group:
+                raise DorkSyntaxError(dork)
+            return next(iter(group)) if len(group) == 1 else ("and", group)
+        return _leaf(token)
+
+    clauses = [c for c in parse_and(closing=False) if c != ("term", "and", False)]
+    if not clauses:
+        raise DorkSyntaxError(dork)
+    return _make_and(clauses)
+
+
+def _sort_key(node):
+    # site:/inurl: first, then OR groups, phrases and terms, other operators (after:, filetype:), exclusions
+    kind = node[0]
+    if kind == "op":
+        if node[3]:
+            return (4, 0, node[1], node[2])
+        if node[1] in _OPERATOR_ORDER:
+            return (0, _OPERATOR_ORDER[node[1]], node[1], node[2])
+        return (3, 0, node[1], node[2])
+    if kind in ("term", "phrase"):
+        return (4 if node[2] else 2, 0, kind, node[1])
+    return (1, 0, kind, render_node(node))
+
+
+def render_node(node) -> str:
+    kind = node[0]
+    if kind == "term":
+        return ("-" if node[2] else "") + node[1]
+    if kind == "phrase":
+        return ("-" if node[2] else "") + f'"{node[1]}"'
+    if kind == "op":
+        return ("-" if node[3] else "") + f"{node[1]}:{node[2]}"
+    if kind == "or":
+        return "(" + " OR ".join(sorted(render_node(a) for a in node[1])) + ")"
+    return "(" + " ".join(render_node(c) for c in sorted(node[1], key=_sort_key)) + ")"
+
+
+def render_dork(clauses: frozenset) -> str:
+    return " ".join(render_node(c) for c in sorted(clauses, key=_sort_key))
+
+
+def _alternatives(node) -> int:
+    return len(node[1]) if node[0] == "or" else 1
+
+
+def _mergeable(node) -> bool:
+    kind = node[0]
+    if kind in ("term", "phrase"):
+        return not node[2]
+    if kind == "op":
+        return node[1] in _MERGEABLE_OPERATORS and not node[3]
+    return kind == "or"
+
+
+def _fits(clauses: frozenset) -> bool:
+    text = render_dork(clauses)
+    return len(text) <= DORK_MAX_LENGTH and len(text.split()) <= DORK_MAX_WORDS
+
+
+def merge_dorks(first: frozenset, second: frozenset):
+    """Merge two dorks that differ in exactly one clause into one OR query, or return None."""
+    only_first, only_second = first - second, second - first
+    if len(only_first) != 1 or len(only_second) != 1:
+        return None
+    a, b = next(iter(only_first)), next(iter(only_second))
+    if not (_mergeable(a) and _mergeable(b)):
+        return None
+    combined = _make_or([a, b])
+    if _alternatives(combined) > DORK_MAX_ALTERNATIVES:
+        return None
+    merged = _make_and((first & second) | {combined})
+    return merged if _fits(merged) else None
+
+
+def _dork_key(dork: str):
+    """Canonical clause set of a dork, or its normalized text when it can't be parsed."""
+    try:
+        return parse_dork(dork)
+    except DorkSyntaxError:
+        return " ".join(dork.split()).casefold()
+
+
+def unique_dorks(dorks):
+    """Yield each dork unless an equivalent one came before it, as dorks arrive.
+
+    The dedupe step of optimize_dorks for a stream; merging needs the whole list.
+    """
+    seen = set()
+    for dork in dorks:
+        key = _dork_key(dork)
+        if key not in seen:
+            seen.add(key)
+            yield dork
+
+
+def optimize_dorks(dorks: list) -> tuple:
+    """Drop equivalent dorks and merge compatible ones. Returns (dorks, stats).
+
+    Only merged dorks are rendered from their clauses; every other dork comes out
+    exactly as it went in (the first of any equivalent ones), since rewriting it
+    would change its CSE results and cache key. Dorks that can't be parsed are
+    deduplicated by whitespace and case only. Output keeps the order in which
+    dorks first appeared.
+    """
+    parsed = []   # canonical clause set, or the normalized text of an opaque dork
+    original = {}
+    for dork in dorks:
+        key = _dork_key(dork)
+        original.setdefault(key, dork)
+        if key not in parsed:
+            parsed.append(key)
+    unique = len(parsed)
+
+    merges = 0
+    merged_any = True
+    while merged_any:
+        merged_any = False
+        for i, first in enumerate(parsed):
+            if not isinstance(first, frozenset):
+                continue
+            for j in range(i + 1, len(parsed)):
+                second = parsed[j]
+                merged = merge_dorks(first, second) if isinstance(second, frozenset) else None
+                if merged is None:
+                    continue
+                del parsed[j]
+                parsed[i] = merged
+                # The merge may have produced a dork we already have
+                if merged in parsed[:i] or merged in parsed[i + 1:]:
+                    del parsed[i]
+                merges += 1
+                merged_any = True
+                break
+            if merged_any:
+                break
+
+    optimized = [original[key] if key in original else render_dork(key) for key in parsed]
+    stats = {
+        "dorks_generated": len(dorks),
+        "duplicates_removed": len(dorks) - unique,
+        "merges": merges,
+        "dorks_executed": len(optimized),
+        "dork_reduction": round(1 - len(optimized) / len(dorks), 3) if dorks else 0.0,
+    }
+    return optimized, stats
@@ -0,0 +1,120 @@
+import os
+import base64
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import resilience
+
+# Gmail accepts up to 100 calls per batch but recommends staying at or below 50
+GMAIL_BATCH_SIZE = int(os.environ.get("GMAIL_BATCH_SIZE", 50))
+# Worker threads used when a batch (or part of one) fails and we fall back to single gets
+GMAIL_FETCH_WORKERS = int(os.environ.get("GMAIL_FETCH_WORKERS", 8))
+
+SUMMARY_HEADERS = ['Subject', 'From', 'To', 'Cc', 'Bcc', 'Date']
+
+logger = logging.getLogger(__name__)
+
+_fetch_executor = ThreadPoolExecutor(max_workers=GMAIL_FETCH_WORKERS, thread_name_prefix="gmail")
+
+
+def list_messages(service, query: str, max_results: int = 10, page_token: str = None) -> dict:
+    """One page of message ids matching `query`, plus the token for the next page."""
+    kwargs = {'userId': 'me', 'q': query, 'maxResults': max_results}
+    if page_token:
+        kwargs['pageToken'] = page_token
+    results = resilience.call("gmail", lambda: service.users().messages().list(**kwargs).execute(),
+                              idempotent=True)
+    return {
+        'ids': [msg['id'] for msg in results.get('messages', [])],
+        'nextPageToken': results.get('nextPageToken'),
+    }
+
+
+def _get_request(service, message_id: str, include_body: bool):
+    if include_body:
+        return service.users().messages().get(userId='me', id=message_id, format='full')
+    return service.users().messages().get(
+        userId='me', id=message_id, format='metadata', metadataHeaders=SUMMARY_HEADERS
+    )
+
+
+def _fetch_one(service, message_id: str, include_body: bool) -> dict:
+    # Build the request on the worker thread so it uses that thread's HTTP connection
+    return resilience.call("gmail", lambda: _get_request(service, message_id, include_body).execute(),
+                           idempotent=True)
+
+
+def fetch_messages(service, message_ids: list, include_body: bool = True) -> list:
+    """Fetch messages via the Gmail batch endpoint, in the order of `message_ids`.
+
+    Messages the batch couldn't return (e.g. per-item 429s) are retried as
+    concurrent single gets.
+    """
+    fetched = {}
+    failed = []
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            failed.append(request_id)
+        else:
+            fetched[request_id] = response
+
+    for start in range(0, len(message_ids), GMAIL_BATCH_SIZE):
+        chunk = message_ids[start:start + GMAIL_BATCH_SIZE]
+        batch = service.new_batch_http_request(callback=callback)
+        for message_id in chunk:
+            batch.add(_get_request(service, message_id, include_body), request_id=message_id)
+        try:
+            with resilience.guard("gmail"):
+                batch.execute()
+        except Exception:
+            logger.warning("Gmail batch request failed, falling back to single gets", exc_info=True)
+            failed.extend(m for m in chunk if m not in fetched and m not in failed)
+
+    if failed:
+        futures = {m: _fetch_executor.submit(_fetch_one, service, m, include_body) for m in failed}
+        for message_id, future in futures.items():
+            fetched[message_id] = future.result()
+
+    return [fetched[m] for m in message_ids if m in fetched]
+
+
+def _decode_prefix(data: str, max_chars: int) -> str:
+    """Decode just enough base64url to yield `max_chars` characters of UTF-8 text."""
+    # A character is at most 4 UTF-8 bytes, and every 3 bytes take 4 base64 characters
+    needed = -(-(max_chars * 4) // 3) * 4
+    prefix = data[:needed]
+    prefix += '=' * (-len(prefix) % 4)
+    return base64.urlsafe_b64decode(prefix).decode('utf-8', errors='ignore')[:max_chars]
+
+
+def summarize_message(msg_detail: dict, body_chars: int = 500) -> dict:
+    """Flatten a Gmail message into the headers and body prefix /read_with returns."""
+    payload = msg_detail.get('payload', {})
+    headers = payload.get('headers', [])
+
+    def get_header(name):
+        return next((h['value'] for h in headers if h['name'].lower() == name.lower()), "")
+
+    body = ''
+    if body_chars > 0:
+        parts = payload.get('parts', [])
+        if parts:
+            for part in parts:
+                if part['mimeType'] == 'text/plain' and 'data' in part['body']:
+                    body = _decode_prefix(part['body']['data'], body_chars)
+                    break
+                elif part['mimeType'] == 'text/html' and 'data' in part['body']:
+                    body = _decode_prefix(part['body']['data'], body_chars)
+        elif 'data' in payload.get('body', {}):
+            body = _decode_prefix(payload['body']['data'], body_chars)
+
+    return {
+        'from': get_header('From'),
+        'to': get_header('To'),
+        'cc': get_header('Cc'),
+        'bcc': get_header('Bcc'),
+        'date': get_header('Date'),
+        'subject': get_header('Subject'),
+        'body': body
+    }
@@ -0,0 +1,464 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from email.utils import getaddresses
+
+import metrics
+import resilience
+import gmail_messages
+from cache import ProcessConnection
+
+GMAIL_SYNC_ENABLED = os.environ.get("GMAIL_SYNC_ENABLED", "true").lower() == "true"
+GMAIL_SYNC_PATH = os.environ.get("GMAIL_SYNC_PATH", "./.cache/gmail_sync.sqlite3")
+# Conversations nobody opened for this long are dropped
+GMAIL_SYNC_TTL = float(os.environ.get("GMAIL_SYNC_TTL", 7 * 24 * 60 * 60))
+# Most conversations kept per user, least recently viewed dropped first
+GMAIL_SYNC_MAX_CONTACTS = int(os.environ.get("GMAIL_SYNC_MAX_CONTACTS", 200))
+# Most messages stored per conversation; pages past them are read live
+GMAIL_SYNC_DEPTH = int(os.environ.get("GMAIL_SYNC_DEPTH", 100))
+# Body prefix kept per message. 0 keeps headers only and bodies are fetched for each page read;
+# anything more is message text on local disk, unencrypted, until the conversation is dropped
+GMAIL_SYNC_BODY_CHARS = int(os.environ.get("GMAIL_SYNC_BODY_CHARS", 0))
+# Compact after this many conversation writes
+GMAIL_SYNC_COMPACT_EVERY = int(os.environ.get("GMAIL_SYNC_COMPACT_EVERY", 100))
+
+logger = logging.getLogger(__name__)
+
+# Label changes that move a message in or out of what a Gmail search returns
+HIDDEN_LABELS = {"SPAM", "TRASH"}
+
+LOCAL_PAGE_PREFIX = "local:"
+
+# Bumped when the tables change; the store is a cache, so an older one is dropped and rebuilt
+SCHEMA_VERSION = 2
+
+
+class HistoryExpired(Exception):
+    """The stored historyId is too old for users.history.list; a full resync is needed."""
+
+
+class InvalidPageToken(ValueError):
+    """A "local:<offset>" page token whose offset isn't a non-negative integer."""
+
+
+def conversation_query(contact: str) -> str:
+    return f'to:{contact} OR from:{contact}'
+
+
+def message_addresses(message: dict) -> set:
+    """Lower-cased addresses in a message's From/To/Cc/Bcc headers."""
+    headers = message.get('payload', {}).get('headers', [])
+    values = [h['value'] for h in headers if h['name'].lower() in ('from', 'to', 'cc', 'bcc')]
+    return {address.lower() for _name, address in getaddresses(values) if address}
+
+
+class ConversationStore:
+    """Per-user store of message summaries, grouped by contact address, plus each user's Gmail historyId.
+
+    One history cursor per user covers all of that user's stored conversations,
+    so a delta is fetched once however many contacts it touches.
+
+    A conversation holds the newest messages read so far and the Gmail page token
+    that continues the listing, so it grows a page at a time as older pages are
+    requested. Bodies are only stored when GMAIL_SYNC_BODY_CHARS is set: messages
+    are then stored without one (has_body = 0) until a page that needs it is read.
+    """
+
+    def __init__(self, path: str = GMAIL_SYNC_PATH, ttl: float = GMAIL_SYNC_TTL,
+                 max_contacts: int = GMAIL_SYNC_MAX_CONTACTS, compact_every: int = GMAIL_SYNC_COMPACT_EVERY):
+        self.path = path
+        self.ttl = ttl
+        self.max_contacts = max_contacts
+        self.compact_every = compact_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        # Striped per-user locks: one sync per user at a time without a lock per user forever
+        self._user_locks = [threading.Lock() for _ in range(64)]
+        self._db = ProcessConnection(path, self._create_tables)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        return self._db.get()
+
+    def _create_tables(self, conn):
+        if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            for table in ("cursors", "conversations", "messages"):
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cursors (user_id TEXT PRIMARY KEY, history_id TEXT NOT NULL, "
+            "updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversations (user_id TEXT NOT NULL, contact TEXT NOT NULL, "
+            "page_token TEXT, complete INTEGER NOT NULL, synced_at REAL NOT NULL, accessed_at REAL NOT NULL, "
+            "PRIMARY KEY (user_id, contact))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS conversations_accessed ON conversations(accessed_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS messages (user_id TEXT NOT NULL, contact TEXT NOT NULL, "
+            "message_id TEXT NOT NULL, internal_date INTEGER NOT NULL, has_body INTEGER NOT NULL, "
+            "summary TEXT NOT NULL, PRIMARY KEY (user_id, contact, message_id))"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS messages_order ON messages(user_id, contact, internal_date)"
+        )
+
+    def user_lock(self, user_id: str) -> threading.Lock:
+        return self._user_locks[hash(user_id) % len(self._user_locks)]
+
+    def cursor(self, user_id: str):
+        with self._lock:
+            row = self._conn.execute("SELECT history_id FROM cursors WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_cursor(self, user_id: str, history_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO cursors (user_id, history_id, updated_at) VALUES (?, ?, ?)",
+                               (user_id, str(history_id), time.time()))
+
+    def contacts(self, user_id: str) -> list:
+        with self._lock:
+            rows = self._conn.execute("SELECT contact FROM conversations WHERE user_id = ?", (user_id,)).fetchall()
+        return [row[0] for row in rows]
+
+    def conversation(self, user_id: str, contact: str):
+        """{complete, count, page_token} for a stored conversation (marking it viewed), or None."""
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT complete, page_token FROM conversations "
+                                     "WHERE user_id = ? AND contact = ?", (user_id, contact)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute("UPDATE conversations SET accessed_at = ? WHERE user_id = ? AND contact = ?",
+                               (time.time(), user_id, contact))
+            count = self._conn.execute("SELECT COUNT(*) FROM messages WHERE user_id = ? AND contact = ?",
+                                       (user_id, contact)).fetchone()[0]
+        return {"complete": bool(row[0]), "count": count, "page_token": row[1]}
+
+    def messages(self, user_id: str, contact: str, offset: int, limit: int) -> list:
+        """Stored (message_id, has_body, summary), newest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message_id, has_body, summary FROM messages WHERE user_id = ? AND contact = ? "
+                "ORDER BY internal_date DESC, message_id DESC LIMIT ? OFFSET ?",
+                (user_id, contact, limit, offset),
+            ).fetchall()
+        return [(message_id, bool(has_body), json.loads(summary)) for message_id, has_body, summary in rows]
+
+    def replace_conversation(self, user_id: str, contact: str, items: list, page_token: str = None):
+        """Store the first page of a conversation. items are (message_id, internal_date, has_body, summary)."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE user_id = ? AND contact = ?", (user_id, contact))
+            self._insert(user_id, contact, items)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversations (user_id, contact, page_token, complete, synced_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (user_id, contact, page_token, int(page_token is None), now, now),
+            )
+            self._writes += 1
+            compact = self.compact_every and self._writes >= self.compact_every
+            if compact:
+                self._writes = 0
+        if compact:
+            self.compact()
+
+    def extend_conversation(self, user_id: str, contact: str, items: list, page_token: str = None):
+        """Append the next (older) page of a stored conversation and where the listing continues."""
+        with self._lock, self._conn:
+            self._insert(user_id, contact, items)
+            self._conn.execute(
+                "UPDATE conversations SET page_token = ?, complete = ? WHERE user_id = ? AND contact = ?",
+                (page_token, int(page_token is None), user_id, contact),
+            )
+
+    def set_bodies(self, user_id: str, items: list):
+        """Replace body-less summaries once their bodies are fetched. items are (message_id, summary)."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "UPDATE messages SET has_body = 1, summary = ? WHERE user_id = ? AND message_id = ?",
+                [(json.dumps(summary), user_id, message_id) for message_id, summary in items],
+            )
+
+    def _insert(self, user_id: str, contact: str, items: list):
+        # Caller holds self._lock and a transaction
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO messages (user_id, contact, message_id, internal_date, has_body, summary) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(user_id, contact, message_id, internal_date, int(has_body), json.dumps(summary))
+             for message_id, internal_date, has_body, summary in items],
+        )
+
+    def add_messages(self, user_id: str, items: list) -> int:
+        """Add delta messages to every stored conversation they belong to.
+
+        items are (message_id, internal_date, has_body, summary, addresses). Returns rows written.
+        """
+        with self._lock, self._conn:
+            contacts = {row[0] for row in self._conn.execute(
+                "SELECT contact FROM conversations WHERE user_id = ?", (user_id,))}
+            rows = [(user_id, contact, message_id, internal_date, int(has_body), json.dumps(summary))
+                    for message_id, internal_date, has_body, summary, addresses in items
+                    for contact in addresses & contacts]
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO messages (user_id, contact, message_id, internal_date, has_body, summary) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._conn.execute("UPDATE conversations SET synced_at = ? WHERE user_id = ?", (time.time(), user_id))
+        return len(rows)
+
+    def remove_messages(self, user_id: str, message_ids) -> int:
+        message_ids = list(message_ids)
+        if not message_ids:
+            return 0
+        with self._lock, self._conn:
+            return self._conn.executemany("DELETE FROM messages WHERE user_id = ? AND message_id = ?",
+                                          [(user_id, m) for m in message_ids]).rowcount
+
+    def evict_user(self, user_id: str):
+        """Forget everything stored for a user (logout, or an expired history cursor)."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages WHERE user_id = ?", (user_id,))
+            self._conn.execute("DELETE FROM conversations WHERE user_id = ?", (user_id,))
+            self._conn.execute("DELETE FROM cursors WHERE user_id = ?", (user_id,))
+
+    def compact(self):
+        """Drop conversations not viewed within the TTL, trim each user to max_contacts, remove orphans."""
+        with self._lock, self._conn:
+            expired = self._conn.execute("DELETE FROM conversations WHERE accessed_at < ?",
+                                         (time.time() - self.ttl,)).rowcount
+            overflow = self._conn.execute(
+                "DELETE FROM conversations WHERE rowid IN (SELECT rowid FROM ("
+                "SELECT rowid, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY accessed_at DESC) AS rank "
+                "FROM conversations) WHERE rank > ?)",
+                (self.max_contacts,),
+            ).rowcount
+            self._conn.execute(
+                "DELETE FROM messages WHERE NOT EXISTS (SELECT 1 FROM conversations c "
+                "WHERE c.user_id = messages.user_id AND c.contact = messages.contact)"
+            )
+            self._conn.execute("DELETE FROM cursors WHERE user_id NOT IN (SELECT user_id FROM conversations)")
+        if expired or overflow:
+            logger.info("Gmail sync store compacted: %d expired, %d over the per-user limit", expired, overflow)
+
+    def info(self) -> dict:
+        with self._lock:
+            users = self._conn.execute("SELECT COUNT(*) FROM cursors").fetchone()[0]
+            conversations = self._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+            messages = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return {"path": self.path, "users": users, "conversations": conversations, "messages": messages,
+                "max_contacts": self.max_contacts, "ttl": self.ttl}
+
+
+def make_conversation_store():
+    return ConversationStore() if GMAIL_SYNC_ENABLED else None
+
+
+conversation_store = make_conversation_store()
+
+
+def _summaries(messages: list, has_body: bool) -> list:
+    has_body = has_body and GMAIL_SYNC_BODY_CHARS > 0
+    body_chars = GMAIL_SYNC_BODY_CHARS if has_body else 0
+    return [(m['id'], int(m.get('internalDate') or 0), has_body, gmail_messages.summarize_message(m, body_chars))
+            for m in messages]
+
+
+def _history_changes(service, start_history_id: str) -> tuple:
+    """(added ids, removed ids, latest historyId) since start_history_id. Raises HistoryExpired."""
+    changes = {}
+    history_id = start_history_id
+    page_token = None
+    while True:
+        kwargs = {'userId': 'me', 'startHistoryId': start_history_id,
+                  'historyTypes': ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']}
+        if page_token:
+            kwargs['pageToken'] = page_token
+        try:
+            with metrics.span("gmail.history", upstream="gmail"):
+                response = resilience.call("gmail", lambda: service.users().history().list(**kwargs).execute(),
+                                           idempotent=True)
+        except Exception as e:
+            # Gmail answers 404 once a historyId is older than it keeps history for
+            if getattr(getattr(e, 'resp', None), 'status', None) == 404:
+                raise HistoryExpired(start_history_id) from e
+            raise
+        # Records are in history order, so the last change to a message wins
+        for record in response.get('history', []):
+            for entry in record.get('messagesAdded', []):
+                message = entry['message']
+                hidden = HIDDEN_LABELS & set(message.get('labelIds', []))
+                changes[message['id']] = 'removed' if hidden else 'added'
+            for entry in record.get('messagesDeleted', []):
+                changes[entry['message']['id']] = 'removed'
+            for entry in record.get('labelsAdded', []):
+                if HIDDEN_LABELS & set(entry.get('labelIds', [])):
+                    changes[entry['message']['id']] = 'removed'
+            for entry in record.get('labelsRemoved', []):
+                if HIDDEN_LABELS & set(entry.get('labelIds', [])):
+                    changes[entry['message']['id']] = 'added'
+        history_id = response.get('historyId', history_id)
+        page_token = response.get('nextPageToken')
+        if not page_token:
+            break
+    added = [m for m, change in changes.items() if change == 'added']
+    removed = [m for m, change in changes.items() if change == 'removed']
+    return added, removed, history_id
+
+
+def _apply_history(service, store: ConversationStore, user_id: str, history_id: str):
+    added, removed, latest = _history_changes(service, history_id)
+    store.remove_messages(user_id, removed)
+    written = 0
+    if added:
+        contacts = set(store.contacts(user_id))
+        # Headers only: they say which conversations a message belongs to, and bodies
+        # are fetched when a page that shows them is read
+        with metrics.span("gmail.fetch", upstream="gmail"):
+            headers = gmail_messages.fetch_messages(service, added, include_body=False)
+        relevant = [(item, message_addresses(m) & contacts) for m, item in zip(headers, _summaries(headers, False))]
+        written = store.add_messages(user_id, [(*item, addresses) for item, addresses in relevant if addresses])
+    store.set_cursor(user_id, latest)
+    metrics.inc("meetdave_gmail_sync_total", help="Gmail conversation syncs", kind="delta")
+    logger.debug("Gmail delta for %s: %d added, %d removed, %d stored", user_id, len(added), len(removed), written)
+
+
+def _fetch_page(service, contact: str, max_results: int, page_token: str, include_body: bool) -> tuple:
+    """(summaries, next page token) for one page of a conversation, in the requested format."""
+    with metrics.span("gmail.list", upstream="gmail"):
+        page = gmail_messages.list_messages(service, conversation_query(contact), max_results=max_results,
+                                            page_token=page_token)
+    with metrics.span("gmail.fetch", upstream="gmail"):
+        messages = gmail_messages.fetch_messages(service, page['ids'], include_body=include_body)
+    return _summaries(messages, include_body), page['nextPageToken']
+
+
+def _first_sync(service, store: ConversationStore, user_id: str, contact: str, max_results: int, include_body: bool):
+    items, page_token = _fetch_page(service, contact, min(max_results, GMAIL_SYNC_DEPTH), None, include_body)
+    store.replace_conversation(user_id, contact, items, page_token)
+    metrics.inc("meetdave_gmail_sync_total", help="Gmail conversation syncs", kind="full")
+
+
+def _extend(service, store: ConversationStore, user_id: str, contact: str, wanted: int, include_body: bool):
+    """Continue the stored listing until the conversation holds `wanted` messages or ends."""
+    conversation = store.conversation(user_id, contact)
+    while conversation["count"] < wanted and not conversation["complete"]:
+        items, page_token = _fetch_page(service, contact, min(500, wanted - conversation["count"]),
+                                        conversation["page_token"], include_body)
+        store.extend_conversation(user_id, contact, items, page_token)
+        metrics.inc("meetdave_gmail_sync_total", help="Gmail conversation syncs", kind="page")
+        conversation = store.conversation(user_id, contact)
+    return conversation
+
+
+def sync_conversation(service, store: ConversationStore, user_id: str, contact: str, max_results: int = 10,
+                      include_body: bool = True):
+    """Bring a stored conversation up to date: a history delta if we have a cursor, else its first page."""
+    with store.user_lock(user_id):
+        history_id = store.cursor(user_id)
+        if history_id is not None:
+            try:
+                _apply_history(service, store, user_id, history_id)
+            except HistoryExpired:
+                logger.info("Gmail history for %s expired, resyncing from scratch", user_id)
+                metrics.inc("meetdave_gmail_sync_total", help="Gmail conversation syncs", kind="resync")
+                store.evict_user(user_id)
+                history_id = None
+        if store.conversation(user_id, contact) is None:
+            if history_id is None:
+                # Take the cursor before listing, so anything that arrives meanwhile shows up in the next delta
+                with metrics.span("gmail.profile", upstream="gmail"):
+                    profile = resilience.call("gmail", lambda: service.users().getProfile(userId='me').execute(),
+                                              idempotent=True)
+                history_id = profile['historyId']
+                store.set_cursor(user_id, history_id)
+            _first_sync(service, store, user_id, contact, max_results, include_body)
+
+
+def _live_page(service, contact: str, offset: int, limit: int, include_body: bool, body_chars: int) -> dict:
+    # Past the stored messages: list from the top, a page at a time, and skip what the caller has already seen
+    ids = []
+    page_token = None
+    while len(ids) < offset + limit:
+        with metrics.span("gmail.list", upstream="gmail"):
+            page = gmail_messages.list_messages(service, conversation_query(contact),
+                                                max_results=min(500, offset + limit - len(ids)),
+                                                page_token=page_token)
+        ids.extend(page['ids'])
+        page_token = page['nextPageToken']
+        if not page_token:
+            break
+    with metrics.span("gmail.fetch", upstream="gmail"):
+        messages = gmail_messages.fetch_messages(service, ids[offset:offset + limit], include_body=include_body)
+    more = page_token is not None or len(ids) > offset + limit
+    return {'emails': [gmail_messages.summarize_message(m, body_chars if include_body else 0) for m in messages],
+            'nextPageToken': f"{LOCAL_PAGE_PREFIX}{offset + limit}" if more else None}
+
+
+def _local_offset(page_token: str) -> int:
+    try:
+        offset = int(page_token[len(LOCAL_PAGE_PREFIX):])
+    except ValueError:
+        raise InvalidPageToken(page_token) from None
+    if offset < 0:
+        raise InvalidPageToken(page_token)
+    return offset
+
+
+def read_conversation(service, user_id: str, contact: str, max_results: int, page_token: str = None,
+                      include_body: bool = True, body_chars: int = 500):
+    """A /read_with page served from the synced store, or None when the store can't answer it.
+
+    Pages past the first carry "local:<offset>" tokens; Gmail page tokens are left to the live path.
+    Raises InvalidPageToken for a malformed local token.
+    """
+    if page_token and not page_token.startswith(LOCAL_PAGE_PREFIX):
+        return None
+    offset = _local_offset(page_token) if page_token else 0
+    store = conversation_store
+    if store is None:
+        return None
+    contact = contact.strip().lower()
+
+    fetch_body = include_body and body_chars > 0
+    # The listing is synced with bodies only if the store keeps them; the page's bodies are fetched below
+    store_body = fetch_body and GMAIL_SYNC_BODY_CHARS > 0
+    sync_conversation(service, store, user_id, contact, max_results, store_body)
+    with store.user_lock(user_id):
+        conversation = store.conversation(user_id, contact)
+        if conversation is None:
+            return None
+        wanted = offset + max_results
+        if wanted > conversation["count"] and not conversation["complete"]:
+            if wanted > GMAIL_SYNC_DEPTH:
+                # Deeper than the store keeps
+                return _live_page(service, contact, offset, max_results, fetch_body, body_chars)
+            conversation = _extend(service, store, user_id, contact, wanted, store_body)
+
+    rows = store.messages(user_id, contact, offset, max_results)
+    # Bodies the store doesn't hold, or holds too little of, are fetched for this page
+    missing = [message_id for message_id, has_body, _summary in rows
+               if fetch_body and (not has_body or body_chars > GMAIL_SYNC_BODY_CHARS)]
+    bodies = {}
+    if missing:
+        with metrics.span("gmail.fetch", upstream="gmail"):
+            messages = gmail_messages.fetch_messages(service, missing, include_body=True)
+        bodies = {m['id']: gmail_messages.summarize_message(m, body_chars) for m in messages}
+        if GMAIL_SYNC_BODY_CHARS:
+            store.set_bodies(user_id, [(message_id, summary)
+                                       for message_id, _date, _has_body, summary in _summaries(messages, True)])
+    emails = []
+    for message_id, _has_body, summary in rows:
+        email = bodies.get(message_id, summary)
+        email['body'] = email['body'][:body_chars] if fetch_body else ''
+        emails.append(email)
+    more = offset + max_results < conversation["count"] or not conversation["complete"]
+    return {'emails': emails, 'nextPageToken': f"{LOCAL_PAGE_PREFIX}{offset + max_results}" if more else None}
+
+
+def cache_stats() -> dict:
+    return {"gmail_sync": conversation_store.info() if conversation_store is not None else None}
@@ -0,0 +1,206 @@
+import os
+import re
+
+LOCAL_DORKS_ENABLED = os.environ.get("LOCAL_DORKS_ENABLED", "true").lower() == "true"
+# Queries parsed with less confidence than this go to the LLM instead
+LOCAL_DORKS_MIN_CONFIDENCE = float(os.environ.get("LOCAL_DORKS_MIN_CONFIDENCE", 0.8))
+
+_LEAD = re.compile(
+    r"^(?:please\s+)?(?:find|search\s+for|search|show\s+me|show|look\s+for|looking\s+for|get\s+me|get|list|"
+    r"who\s+are)\s+(?:me\s+)?",
+    re.IGNORECASE,
+)
+# Articles and quantifiers in front of a role or slot value ("a lawyer", "the Bay Area")
+_DETERMINER = re.compile(r"^(?:(?:a|an|the|all|some|any)\s+)+", re.IGNORECASE)
+
+# Phrases that introduce a slot, longest first so "who work at" wins over "at"
+_SLOT_KEYWORDS = {
+    "company": ["who work at", "who works at", "who work for", "who works for", "working at", "working for",
+                "employed at", "employed by", "at", "from"],
+    "location": ["based in", "located in", "living in", "who live in", "who lives in", "near", "in"],
+    "school": ["who went to", "went to", "who studied at", "studied at", "who graduated from", "graduated from",
+               "who attended", "attended", "alumni of", "alumni from", "alums of"],
+}
+_KEYWORD_SLOT = {kw: slot for slot, kws in _SLOT_KEYWORDS.items() for kw in kws}
+_KEYWORDS = re.compile(
+    r"\s+(" + "|".join(re.escape(kw) for kw in sorted(_KEYWORD_SLOT, key=len, reverse=True)) + r")\s+",
+    re.IGNORECASE,
+)
+
+# Last words that make the head of a query a job title
+ROLE_WORDS = {
+    "engineer", "developer", "programmer", "scientist", "designer", "manager", "founder", "cofounder",
+    "co-founder", "ceo", "cto", "cfo", "coo", "cmo", "vp", "director", "recruiter", "analyst", "researcher",
+    "consultant", "architect", "lead", "intern", "marketer", "sde", "pm", "investor", "partner", "professor",
+    "student", "president", "executive", "specialist", "writer", "editor", "lawyer", "attorney", "doctor",
+    "nurse", "teacher", "accountant", "head", "officer", "strategist", "advisor", "associate",
+}
+_GENERIC_HEADS = {"", "people", "person", "someone", "folks", "profiles", "anyone", "everyone"}
+# Words that mean the query says more than the grammar understands (time, intent, conditions)
+_UNSUPPORTED = re.compile(
+    r"\b(who|that|which|recently|recent|joined|left|hiring|with|without|and|or|not|before|after|since|"
+    r"last|years?|months?|ago|posted|tweeted|\d+)\b",
+    re.IGNORECASE,
+)
+
+# Places a location slot is trusted to be; anything else has to look like a place name to stay local
+KNOWN_LOCATIONS = {
+    "new york", "nyc", "new york city", "brooklyn", "san francisco", "sf", "bay area", "sf bay area",
+    "silicon valley", "los angeles", "la", "san diego", "san jose", "palo alto", "mountain view", "oakland",
+    "seattle", "portland", "chicago", "boston", "austin", "dallas", "houston", "denver", "miami", "atlanta",
+    "washington", "washington dc", "dc", "philadelphia", "pittsburgh", "phoenix", "salt lake city",
+    "minneapolis", "detroit", "nashville", "raleigh", "toronto", "vancouver", "montreal", "london",
+    "paris", "berlin", "munich", "amsterdam", "dublin", "zurich", "stockholm", "madrid", "barcelona",
+    "lisbon", "tel aviv", "dubai", "singapore", "hong kong", "tokyo", "seoul", "shanghai", "beijing",
+    "bangalore", "bengaluru", "mumbai", "delhi", "sydney", "melbourne", "sao paulo", "mexico city",
+    "california", "texas", "florida", "massachusetts", "colorado", "illinois", "georgia", "virginia",
+    "usa", "us", "united states", "canada", "uk", "united kingdom", "england", "germany", "france",
+    "india", "china", "japan", "israel", "australia", "brazil", "europe", "asia", "latin america",
+}
+# Words after "in" that name a field rather than a place ("engineers in fintech")
+_FIELDS = {
+    "fintech", "finance", "tech", "technology", "healthcare", "health", "biotech", "crypto", "web3", "ai",
+    "ml", "saas", "marketing", "sales", "consulting", "education", "edtech", "media", "gaming", "retail",
+    "security", "cybersecurity", "venture", "vc", "banking", "law", "real estate", "government", "research",
+    "startups", "ecommerce", "e-commerce", "energy", "climate", "insurance", "robotics", "hardware", "product",
+}
+
+ROLE_SYNONYMS = {
+    "software engineer": ["SDE", "software developer"],
+    "software developer": ["software engineer"],
+    "data scientist": ["data science"],
+    "product manager": ["PM"],
+    "founder": ["co-founder"],
+    "startup founder": ["founder"],
+    "machine learning engineer": ["ML engineer"],
+    "ml engineer": ["machine learning engineer"],
+}
+ALIASES = {
+    "mit": "Massachusetts Institute of Technology",
+    "cmu": "Carnegie Mellon University",
+    "stanford": "Stanford University",
+    "uc berkeley": "University of California, Berkeley",
+    "ucla": "University of California, Los Angeles",
+    "san francisco": "SF Bay Area",
+    "sf": "San Francisco",
+    "nyc": "New York",
+    "new york": "NYC",
+}
+
+PROFILE_SITE = "site:linkedin.com/in"
+SOCIAL_SITES = "(site:linkedin.com/in OR site:twitter.com)"
+
+
+def _singular(word: str) -> str:
+    if word.lower().endswith("ies") and len(word) > 4:
+        return word[:-3] + "y"
+    if word.lower().endswith("s") and not word.lower().endswith("ss") and len(word) > 2:
+        return word[:-1]
+    return word
+
+
+def _location_confidence(location: str) -> float:
+    key = location.lower().split(",")[0].strip()
+    if location.lower() in KNOWN_LOCATIONS or key in KNOWN_LOCATIONS:
+        return 1.0
+    if key in _FIELDS or location.lower() in _FIELDS:
+        return 0.3
+    # An unknown place still reads as a proper noun ("Boise", "Cape Town"); "fintech" doesn't
+    if all(word[:1].isupper() for word in location.replace(",", " ").split()):
+        return 0.8
+    return 0.4
+
+
+def _classify_head(head: str) -> tuple:
+    """("role" | "name" | None, value, confidence) for the words before the first slot keyword."""
+    words = head.split()
+    if head.lower() in _GENERIC_HEADS:
+        return None, "", 1.0
+    if words and words[0].lower() in ("people", "person"):
+        return None, "", 0.3
+    last = _singular(words[-1]).lower()
+    if last in ROLE_WORDS:
+        return "role", " ".join(words[:-1] + [_singular(words[-1])]).lower(), 1.0
+    if 2 <= len(words) <= 3 and all(w[:1].isupper() and w[1:].replace("-", "").replace("'", "").isalpha()
+                                    for w in words):
+        return "name", head, 0.9
+    return None, head, 0.3
+
+
+def parse_query(natural_query: str) -> tuple:
+    """Extract {name, role, company, location, school} from a query. Returns (entities, confidence)."""
+    text = " ".join(natural_query.strip().rstrip("?.!").split())
+    text = _LEAD.sub("", text)
+    parts = _KEYWORDS.split(" " + text)
+    head = _DETERMINER.sub("", parts[0].strip())
+    entities = {}
+    confidence = 1.0
+
+    kind, value, head_confidence = _classify_head(head)
+    confidence = min(confidence, head_confidence)
+    if kind:
+        entities[kind] = value
+
+    for keyword, segment in zip(parts[1::2], parts[2::2]):
+        slot = _KEYWORD_SLOT[keyword.lower()]
+        segment = _DETERMINER.sub("", segment.strip(" ,"))
+        if slot in entities or not segment or len(segment.split()) > 5 or _UNSUPPORTED.search(segment):
+            confidence = min(confidence, 0.4)
+            continue
+        if slot == "location":
+            confidence = min(confidence, _location_confidence(segment))
+        entities[slot] = segment
+    if _UNSUPPORTED.search(head):
+        confidence = min(confidence, 0.4)
+
+    if not (entities.keys() & {"company", "location", "school"}):
+        # A bare role or name is too broad to get right without the LLM
+        confidence = min(confidence, 0.5)
+    if not (entities.keys() & {"name", "role"}) and len(entities) < 2:
+        confidence = min(confidence, 0.5)
+    return entities, confidence
+
+
+def _quoted(*values) -> str:
+    return " ".join(f'"{v}"' for v in values if v)
+
+
+def build_dorks(entities: dict) -> list:
+    """The dork shapes DORKS_TEMPLATE-prompted translations use for the same entities."""
+    name, role = entities.get("name"), entities.get("role")
+    company, school, location = entities.get("company"), entities.get("school"), entities.get("location")
+    core = _quoted(name, role, company, school, location)
+
+    dorks = [f"{PROFILE_SITE} {core}"]
+    if name:
+        dorks.append(f"site:twitter.com {core}")
+    else:
+        dorks.append(f"{SOCIAL_SITES} {core}")
+    for synonym in ROLE_SYNONYMS.get(role or "", [])[:1]:
+        dorks.append(f"{PROFILE_SITE} {_quoted(name, synonym, company, school, location)}")
+    if school:
+        alias = ALIASES.get(school.lower())
+        if alias:
+            dorks.append(f"{PROFILE_SITE} {_quoted(name, role, company, alias, location)}")
+        dorks.append(f"{SOCIAL_SITES} {_quoted(name, role, company, school, location, 'alumni')}")
+    elif location and location.lower() in ALIASES:
+        dorks.append(f"{PROFILE_SITE} {_quoted(name, role, company, ALIASES[location.lower()])}")
+    return dorks
+
+
+def synthesize(natural_query: str) -> tuple:
+    """Translate a query without the LLM. Returns (dorks, confidence); dorks is [] when nothing parsed."""
+    entities, confidence = parse_query(natural_query)
+    if not entities:
+        return [], 0.0
+    return build_dorks(entities), confidence
+
+
+def local_translation(natural_query: str):
+    """Dorks for the query if the local synthesizer is confident enough, else None."""
+    if not LOCAL_DORKS_ENABLED:
+        return None
+    dorks, confidence = synthesize(natural_query)
+    if dorks and confidence >= LOCAL_DORKS_MIN_CONFIDENCE:
+        return dorks
+    return None
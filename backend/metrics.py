@@ -0,0 +1,185 @@
+import os
+import time
+import json
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Log one JSON line with per-stage timings for every request
+REQUEST_TIMING_LOG = os.environ.get("REQUEST_TIMING_LOG", "false").lower() == "true"
+
+# Histogram buckets in seconds, from cache hits up to slow LLM calls
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger(__name__)
+if REQUEST_TIMING_LOG and not logger.handlers:
+    logger.addHandler(logging.StreamHandler())
+    logger.setLevel(logging.INFO)
+
+# Spans recorded during the current request; copied into worker threads with the context
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+def _label_key(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+class Registry:
+    """Thread-safe counters and histograms rendered in Prometheus text format."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # name -> {label_key: value}
+        self._histograms = {}  # name -> {label_key: [bucket_counts, sum, count]}
+        self._help = {}
+        self._collectors = []
+
+    def inc(self, name: str, value: float = 1, help: str = "", **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+            self._help.setdefault(name, help)
+
+    def observe(self, name: str, seconds: float, help: str = "", **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            entry = series.get(key)
+            if entry is None:
+                entry = series[key] = [[0] * len(BUCKETS), 0.0, 0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    entry[0][i] += 1
+            entry[1] += seconds
+            entry[2] += 1
+            self._help.setdefault(name, help)
+
+    def register_collector(self, collector):
+        """`collector()` returns (name, type, help, labels, value) tuples, read at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+
+        def fmt(labels):
+            if not labels:
+                return ""
+            return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{fmt(labels)} {value}")
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {self._help.get(name, '')}")
+                lines.append(f"# TYPE {name} histogram")
+                for labels, (buckets, total, count) in series.items():
+                    for bound, bucket_count in zip(BUCKETS, buckets):
+                        lines.append(f"{name}_bucket{fmt(labels + (('le', str(bound)),))} {bucket_count}")
+                    lines.append(f"{name}_bucket{fmt(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{fmt(labels)} {total}")
+                    lines.append(f"{name}_count{fmt(labels)} {count}")
+
+        # Several collectors can report one family (e.g. each cache's hits); its samples must be contiguous
+        families = {}  # name -> (type, help, sample lines), in first-seen order
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception:
+                logger.exception("Metrics collector failed")
+                continue
+            for name, kind, help_text, labels, value in samples:
+                family = families.setdefault(name, (kind, help_text, []))
+                family[2].append(f"{name}{fmt(_label_key(labels))} {value}")
+        for name, (kind, help_text, samples) in families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+registry = Registry()
+
+
+def inc(name: str, value: float = 1, help: str = "", **labels):
+    registry.inc(name, value, help, **labels)
+
+
+@contextmanager
+def span(name: str, upstream: str = None):
+    """Time a stage of work. Upstream spans also count calls to that upstream."""
+    if upstream:
+        registry.inc("meetdave_upstream_calls_total", help="Calls made to external services",
+                     upstream=upstream)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        registry.inc("meetdave_span_errors_total", help="Stages that raised an exception", span=name)
+        if upstream:
+            registry.inc("meetdave_upstream_errors_total", help="Failed calls to external services",
+                         upstream=upstream)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        registry.observe("meetdave_span_seconds", elapsed, help="Time spent per stage", span=name)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((name, elapsed))
+
+
+def record_llm_usage(usage, model: str):
+    """Count input/output tokens from an Anthropic `message.usage`."""
+    if usage is None:
+        return
+    for kind in ("input", "output"):
+        tokens = getattr(usage, f"{kind}_tokens", None)
+        if tokens:
+            registry.inc("meetdave_llm_tokens_total", tokens, help="LLM tokens used", model=model, type=kind)
+
+
+def cache_collector(get_stats):
+    """Expose cache.info() dicts (keyed by cache name) as gauges and counters."""
+    def collect():
+        for cache_name, info in get_stats().items():
+            if not info:
+                continue
+            yield ("meetdave_cache_hits_total", "counter", "Cache hits", {"cache": cache_name}, info["hits"])
+            yield ("meetdave_cache_misses_total", "counter", "Cache misses", {"cache": cache_name}, info["misses"])
+            yield ("meetdave_cache_evictions_total", "counter", "Cache evictions", {"cache": cache_name},
+                   info["evictions"])
+            yield ("meetdave_cache_hit_ratio", "gauge", "Cache hit ratio", {"cache": cache_name}, info["hit_rate"])
+            yield ("meetdave_cache_entries", "gauge", "Entries in cache", {"cache": cache_name}, info["size"])
+    return collect
+
+
+def start_request():
+    """Begin collecting spans for the current request."""
+    return _request_spans.set([])
+
+
+def finish_request(token, method: str, path: str, endpoint: str, status: int, elapsed: float):
+    spans = _request_spans.get() or []
+    try:
+        _request_spans.reset(token)
+    except ValueError:
+        # The response was closed from another context than the one the request ran in
+        pass
+    registry.observe("meetdave_request_seconds", elapsed, help="HTTP request latency",
+                     endpoint=endpoint or "unknown", method=method, status=status)
+    if REQUEST_TIMING_LOG:
+        stages = {}
+        for name, seconds in spans:
+            stages[name] = round(stages.get(name, 0) + seconds * 1000, 2)
+        logger.info(json.dumps({
+            "event": "request_timing", "method": method, "path": path, "status": status,
+            "duration_ms": round(elapsed * 1000, 2), "stages_ms": stages,
+        }))
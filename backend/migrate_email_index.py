@@ -0,0 +1,62 @@
+"""Backfill emails/{email} for users created before the email index existed.
+
+Safe to re-run: entries that already exist are left alone. Once it has run,
+EMAIL_INDEX_FALLBACK=false makes unknown emails cost a single get at login.
+
+    python migrate_email_index.py --dry-run
+    python migrate_email_index.py
+"""
+import logging
+import argparse
+
+import clients
+import user_store
+
+# Firestore batches hold at most 500 writes
+WRITES_PER_BATCH = 400
+
+logger = logging.getLogger(__name__)
+
+
+def backfill(db, dry_run: bool = False) -> int:
+    """Index every user's email. Returns how many entries were written."""
+    # list_documents reads references only, no field data
+    indexed = {ref.id for ref in db.collection(user_store.EMAIL_INDEX_COLLECTION).list_documents()}
+    written = 0
+    batch, pending = db.batch(), 0
+    for snapshot in db.collection("users").select(["email"]).stream():
+        email = (snapshot.to_dict() or {}).get("email")
+        if not email:
+            continue
+        ref = user_store.email_ref(db, email)
+        if ref.id in indexed:
+            continue
+        # Two users with one email predate the uniqueness check; the first one keeps it
+        indexed.add(ref.id)
+        written += 1
+        if dry_run:
+            continue
+        batch.set(ref, {"user_id": snapshot.id})
+        pending += 1
+        if pending == WRITES_PER_BATCH:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+    return written
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Backfill the emails/{email} -> user id index")
+    parser.add_argument("--dry-run", action="store_true", help="count missing entries, write nothing")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    written = backfill(clients.get_firestore_client(), dry_run=args.dry_run)
+    logger.info("%s %d email index entr%s", "Would write" if args.dry_run else "Wrote", written,
+                "y" if written == 1 else "ies")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
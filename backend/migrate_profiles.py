@@ -0,0 +1,58 @@
+"""Move resume_text and additional_details out of users/{id} into users/{id}/profile/resume.
+
+Safe to re-run: users already migrated have none of the fields left and are skipped.
+
+    python migrate_profiles.py --dry-run
+    python migrate_profiles.py
+"""
+import logging
+import argparse
+
+import clients
+import user_store
+
+# Each migrated user is two writes; Firestore batches hold at most 500
+USERS_PER_BATCH = 200
+
+logger = logging.getLogger(__name__)
+
+
+def migrate(db, dry_run: bool = False) -> int:
+    """Migrate every user document that still carries profile fields. Returns how many were moved."""
+    from google.cloud import firestore
+
+    # Only the heavy fields are read; users without them come back empty
+    users = db.collection("users").select(list(user_store.PROFILE_FIELDS)).stream()
+    migrated = 0
+    batch, pending = db.batch(), 0
+    for snapshot in users:
+        fields = {k: v for k, v in (snapshot.to_dict() or {}).items() if k in user_store.PROFILE_FIELDS}
+        if not fields:
+            continue
+        migrated += 1
+        if dry_run:
+            continue
+        batch.set(user_store.profile_ref(db, snapshot.id), fields, merge=True)
+        batch.update(snapshot.reference, {field: firestore.DELETE_FIELD for field in fields})
+        pending += 1
+        if pending == USERS_PER_BATCH:
+            batch.commit()
+            batch, pending = db.batch(), 0
+    if pending:
+        batch.commit()
+    return migrated
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Split heavy profile fields out of user documents")
+    parser.add_argument("--dry-run", action="store_true", help="count users that need migrating, write nothing")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    migrated = migrate(clients.get_firestore_client(), dry_run=args.dry_run)
+    logger.info("%s %d user document(s)", "Would migrate" if args.dry_run else "Migrated", migrated)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
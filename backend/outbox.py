@@ -0,0 +1,309 @@
+import os
+import re
+import time
+import uuid
+import random
+import sqlite3
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+import resilience
+from cache import ProcessConnection
+
+OUTBOX_PATH = os.environ.get("OUTBOX_PATH", "./.cache/outbox.sqlite3")
+OUTBOX_WORKERS = int(os.environ.get("OUTBOX_WORKERS", 4))
+# Per-user sending rate in messages per minute
+OUTBOX_USER_RATE = float(os.environ.get("OUTBOX_USER_RATE", 30))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get("OUTBOX_MAX_ATTEMPTS", 6))
+# Retry delays grow as base * 2^attempt (with jitter), capped at the max
+OUTBOX_BACKOFF_BASE = float(os.environ.get("OUTBOX_BACKOFF_BASE", 2))
+OUTBOX_BACKOFF_MAX = float(os.environ.get("OUTBOX_BACKOFF_MAX", 300))
+# Messages stuck in "sending" this long (e.g. after a crash) are queued again
+OUTBOX_SENDING_TIMEOUT = float(os.environ.get("OUTBOX_SENDING_TIMEOUT", 300))
+
+POLL_INTERVAL = 1.0
+DISPATCH_BATCH = 100
+
+logger = logging.getLogger(__name__)
+
+_FIELD = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+
+class PermanentSendError(Exception):
+    """A send failure that retrying won't fix."""
+
+
+def is_retryable(error: Exception) -> bool:
+    """429s, 5xx responses and network errors are retried; anything else fails the message."""
+    if isinstance(error, PermanentSendError):
+        return False
+    if isinstance(error, resilience.CircuitOpenError):
+        # Gmail is failing for everyone right now; the backoff gives it time to recover
+        return True
+    return resilience.is_transient(error)
+
+
+def render_template(template: str, fields: dict) -> str:
+    """Fill {{name}} placeholders. Raises KeyError for fields that aren't provided."""
+    return _FIELD.sub(lambda m: str(fields[m.group(1)]), template)
+
+
+class Outbox:
+    """SQLite-backed email queue drained by a bounded worker pool.
+
+    `send(user_id, to, subject, body)` delivers one message and returns the
+    provider's message id. Enqueueing with an idempotency key that the user has
+    already used returns the existing message instead of queueing a duplicate.
+    Several processes can share one database: a message is claimed with a
+    conditional UPDATE before it's sent, and each user's next send slot lives in
+    the database too, so the per-user rate holds across all of them.
+    """
+
+    def __init__(self, send, path: str = OUTBOX_PATH, workers: int = OUTBOX_WORKERS,
+                 per_minute: float = OUTBOX_USER_RATE, max_attempts: int = OUTBOX_MAX_ATTEMPTS):
+        self._send = send
+        self.path = path
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._inflight = 0
+        self._pool = None
+        self._dispatcher = None
+        # Several worker processes write to the outbox, so wait out each other's locks
+        self._db = ProcessConnection(path, self._create_tables, timeout=30)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        return self._db.get()
+
+    def _create_tables(self, conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id TEXT PRIMARY KEY, user_id TEXT NOT NULL, idempotency_key TEXT, "
+            "to_addr TEXT NOT NULL, subject TEXT NOT NULL, body TEXT NOT NULL, "
+            "status TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, "
+            "next_attempt_at REAL NOT NULL, gmail_id TEXT, error TEXT, "
+            "created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE UNIQUE INDEX IF NOT EXISTS outbox_idempotency ON outbox(user_id, idempotency_key) "
+            "WHERE idempotency_key IS NOT NULL"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox(status, next_attempt_at)")
+        # When each user may send next; a user without a row may send now
+        conn.execute("CREATE TABLE IF NOT EXISTS outbox_slots (user_id TEXT PRIMARY KEY, next_send_at REAL NOT NULL)")
+
+    # Producer side
+
+    def enqueue(self, user_id: str, to: str, subject: str, body: str, idempotency_key: str = None) -> tuple:
+        """Queue one message. Returns (message_id, created)."""
+        return self.enqueue_many(user_id, [(to, subject, body, idempotency_key)])[0]
+
+    def enqueue_many(self, user_id: str, messages: list) -> list:
+        """Queue (to, subject, body, idempotency_key) tuples in one transaction. Returns [(id, created)]."""
+        now = time.time()
+        queued = []
+        with self._lock, self._conn:
+            for to, subject, body, key in messages:
+                message_id = uuid.uuid4().hex
+                cursor = self._conn.execute(
+                    "INSERT OR IGNORE INTO outbox (id, user_id, idempotency_key, to_addr, subject, body, "
+                    "status, next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+                    (message_id, user_id, key, to, subject, body, now, now, now),
+                )
+                if cursor.rowcount:
+                    queued.append((message_id, True))
+                else:
+                    row = self._conn.execute(
+                        "SELECT id FROM outbox WHERE user_id = ? AND idempotency_key = ?", (user_id, key)
+                    ).fetchone()
+                    queued.append((row[0], False))
+        created = sum(1 for _id, is_new in queued if is_new)
+        if created:
+            metrics.inc("meetdave_outbox_enqueued_total", created, help="Emails added to the outbox")
+        self.start()
+        self._wake.set()
+        return queued
+
+    def status(self, message_id: str, user_id: str = None):
+        """Public status of a message, or None if it doesn't exist (or belongs to someone else)."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, user_id, to_addr, status, attempts, gmail_id, error, created_at, updated_at "
+                "FROM outbox WHERE id = ?", (message_id,)
+            ).fetchone()
+        if row is None or (user_id is not None and row[1] != user_id):
+            return None
+        return {"id": row[0], "to": row[2], "status": row[3], "attempts": row[4], "gmail_id": row[5],
+                "error": row[6], "created_at": row[7], "updated_at": row[8]}
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        return dict(rows)
+
+    # Worker side
+
+    def start(self):
+        """Start the dispatcher in this process unless it is running. Cheap to call on every request.
+
+        Threads don't survive fork(), so each worker process starts its own on first use.
+        """
+        dispatcher = self._dispatcher
+        if dispatcher is not None and dispatcher.is_alive():
+            return
+        with self._lock:
+            if self._dispatcher is not None and self._dispatcher.is_alive():
+                return
+            self._stop.clear()
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="outbox")
+            self._dispatcher = threading.Thread(target=self._dispatch_loop, name="outbox-dispatch", daemon=True)
+            self._dispatcher.start()
+
+    def stop(self, wait: bool = True):
+        self._stop.set()
+        self._wake.set()
+        dispatcher, pool = self._dispatcher, self._pool
+        if dispatcher is not None:
+            dispatcher.join()
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    def _dispatch_loop(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                self._requeue_stuck()
+                wait = self._dispatch()
+            except Exception:
+                logger.exception("Outbox dispatch failed")
+                wait = POLL_INTERVAL
+            self._wake.wait(wait)
+
+    def _requeue_stuck(self):
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = 'queued', updated_at = ? WHERE status = 'sending' AND updated_at < ?",
+                (now, now - OUTBOX_SENDING_TIMEOUT),
+            )
+            # Slots in the past say nothing a missing row doesn't, so only users waiting on one are kept
+            self._conn.execute("DELETE FROM outbox_slots WHERE next_send_at <= ?", (now,))
+
+    def _dispatch(self) -> float:
+        """Hand due messages to free workers. Returns how long to sleep before looking again."""
+        now = time.time()
+        with self._lock:
+            free = self.workers - self._inflight
+            if free <= 0:
+                return POLL_INTERVAL
+            rows = self._conn.execute(
+                "SELECT id, user_id, to_addr, subject, body, attempts FROM outbox "
+                "WHERE status = 'queued' AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?",
+                (now, DISPATCH_BATCH),
+            ).fetchall()
+            upcoming = self._conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'queued' AND next_attempt_at > ?", (now,)
+            ).fetchone()[0]
+
+        wait = POLL_INTERVAL if upcoming is None else min(POLL_INTERVAL, max(0.0, upcoming - now))
+        for row in rows:
+            if free <= 0:
+                break
+            claimed, delay = self._claim(row[0], row[1])
+            if not claimed:
+                if delay > 0:
+                    wait = min(wait, delay)
+                continue
+            free -= 1
+            with self._lock:
+                self._inflight += 1
+            self._pool.submit(self._deliver, *row)
+        return wait
+
+    def _claim(self, message_id: str, user_id: str) -> tuple:
+        """Claim a queued message if its user's send slot is due. Returns (claimed, seconds to wait).
+
+        The slot check, the claim and taking the slot are one write transaction, so
+        two processes can't both use a slot, and a slot is only used by a claim that won.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute("BEGIN IMMEDIATE")
+            row = self._conn.execute("SELECT next_send_at FROM outbox_slots WHERE user_id = ?", (user_id,)).fetchone()
+            if row is not None and row[0] > now:
+                # Over this user's rate: leave it queued until the slot opens, unless another worker has it
+                self._conn.execute(
+                    "UPDATE outbox SET next_attempt_at = ?, updated_at = ? WHERE id = ? AND status = 'queued'",
+                    (row[0], now, message_id),
+                )
+                return False, row[0] - now
+            cursor = self._conn.execute(
+                "UPDATE outbox SET status = 'sending', updated_at = ? WHERE id = ? AND status = 'queued'",
+                (now, message_id),
+            )
+            if cursor.rowcount != 1:
+                return False, 0.0
+            if self.interval:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO outbox_slots (user_id, next_send_at) VALUES (?, ?)",
+                    (user_id, now + self.interval),
+                )
+            return True, 0.0
+
+    def _pause(self, user_id: str, seconds: float):
+        """Push the user's next slot back, e.g. after Gmail answered 429."""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO outbox_slots (user_id, next_send_at) VALUES (?, ?) ON CONFLICT(user_id) "
+                "DO UPDATE SET next_send_at = MAX(next_send_at, excluded.next_send_at)",
+                (user_id, time.time() + seconds),
+            )
+
+    def _update(self, message_id: str, status: str, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        values = list(fields.values())
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"UPDATE outbox SET status = ?, updated_at = ?{', ' if assignments else ''}{assignments} WHERE id = ?",
+                [status, time.time(), *values, message_id],
+            )
+
+    def _deliver(self, message_id, user_id, to, subject, body, attempts):
+        attempts += 1
+        try:
+            gmail_id = self._send(user_id, to, subject, body)
+        except Exception as e:
+            if is_retryable(e) and attempts < self.max_attempts:
+                delay = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (attempts - 1))
+                delay *= random.uniform(0.5, 1.5)
+                if getattr(getattr(e, "resp", None), "status", None) in (429, "429"):
+                    self._pause(user_id, delay)
+                logger.warning("Email %s failed (attempt %d), retrying in %.1fs: %s", message_id, attempts, delay, e)
+                self._update(message_id, "queued", attempts=attempts, error=str(e),
+                             next_attempt_at=time.time() + delay)
+                metrics.inc("meetdave_outbox_retries_total", help="Email sends scheduled for retry")
+            else:
+                logger.error("Email %s failed permanently after %d attempt(s): %s", message_id, attempts, e)
+                self._update(message_id, "failed", attempts=attempts, error=str(e))
+                metrics.inc("meetdave_outbox_failed_total", help="Emails that could not be sent")
+        else:
+            self._update(message_id, "sent", attempts=attempts, gmail_id=gmail_id, error=None)
+            metrics.inc("meetdave_outbox_sent_total", help="Emails sent from the outbox")
+        finally:
+            with self._lock:
+                self._inflight -= 1
+            self._wake.set()
+
+
+def outbox_collector(outbox: Outbox):
+    """Queue depth by status, read at scrape time."""
+    def collect():
+        for status, count in outbox.counts().items():
+            yield ("meetdave_outbox_messages", "gauge", "Emails in the outbox by status", {"status": status}, count)
+    return collect
@@ -0,0 +1,198 @@
+import os
+import re
+import math
+import time
+import sqlite3
+import logging
+import threading
+
+from cache import ProcessConnection
+from search_planner import canonical_profile_url, is_profile_url
+
+PEOPLE_INDEX_ENABLED = os.environ.get("PEOPLE_INDEX_ENABLED", "true").lower() == "true"
+PEOPLE_INDEX_PATH = os.environ.get("PEOPLE_INDEX_PATH", "./.cache/people_index.sqlite3")
+# Profiles not seen in a CSE result for this long are neither served nor kept
+PEOPLE_INDEX_TTL = float(os.environ.get("PEOPLE_INDEX_TTL", 14 * 24 * 60 * 60))
+PEOPLE_INDEX_SIZE = int(os.environ.get("PEOPLE_INDEX_SIZE", 100000))
+# Share of the query's terms a profile must contain to count as a match
+PEOPLE_INDEX_MIN_MATCH = float(os.environ.get("PEOPLE_INDEX_MIN_MATCH", 0.75))
+# Compact after this many profile writes
+PEOPLE_INDEX_COMPACT_EVERY = int(os.environ.get("PEOPLE_INDEX_COMPACT_EVERY", 1000))
+
+logger = logging.getLogger(__name__)
+
+# Field weights: a term in the name or company says more than one in the snippet
+FIELD_WEIGHTS = {"name": 3, "company": 3, "headline": 2, "location": 2, "site": 1, "snippet": 1}
+
+# Words in natural language queries that don't describe the person
+STOPWORDS = {
+    "a", "an", "and", "any", "at", "based", "by", "currently", "find", "for", "from", "get", "in", "is",
+    "list", "located", "me", "near", "of", "on", "or", "people", "person", "profile", "profiles", "search",
+    "show", "some", "that", "the", "to", "who", "with", "work", "working", "works",
+}
+
+_TITLE_SEPARATORS = re.compile(r"\s+[-–—|·]\s+")
+_LOCATION = re.compile(r"(?:Location|Based in|Lives in)\s*:?\s*([^·|.]+)", re.IGNORECASE)
+_AT_COMPANY = re.compile(r"\bat\s+(.+)$", re.IGNORECASE)
+_TOKEN = re.compile(r"[\w+#]+")
+
+
+def tokenize(text: str) -> list:
+    """Lower-cased word tokens with a light plural strip, so "engineers" matches "engineer"."""
+    tokens = []
+    for token in _TOKEN.findall(text.casefold()):
+        if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def query_terms(natural_query: str) -> list:
+    terms = []
+    for token in tokenize(natural_query):
+        if token not in STOPWORDS and token not in terms:
+            terms.append(token)
+    return terms
+
+
+def parse_profile(item: dict) -> dict:
+    """Split a CSE item like "Jane Doe - Staff Engineer - Acme | LinkedIn" into profile fields."""
+    title = item.get("title", "")
+    snippet = item.get("snippet", "")
+    parts = [p.strip() for p in _TITLE_SEPARATORS.split(title) if p.strip()]
+    site = canonical_profile_url(item.get("link", "")).split("/", 1)[0]
+    # Drop a trailing site name ("LinkedIn", "X", ...)
+    if len(parts) > 1 and parts[-1].casefold().replace(" ", "") in site.replace(".", ""):
+        parts = parts[:-1]
+    name = parts[0] if parts else ""
+    headline = parts[1] if len(parts) > 1 else ""
+    company = parts[2] if len(parts) > 2 else ""
+    if not company:
+        match = _AT_COMPANY.search(headline)
+        if match:
+            company = match.group(1)
+    match = _LOCATION.search(snippet)
+    location = match.group(1).strip() if match else ""
+    return {"name": name, "headline": headline, "company": company, "location": location,
+            "site": site, "snippet": snippet}
+
+
+class PeopleIndex:
+    """Persistent store of profiles seen in CSE results, with an inverted index over their fields.
+
+    Profiles are deduplicated by canonical profile URL. Each (term, profile)
+    posting keeps the weight of the best field the term appeared in.
+    """
+
+    def __init__(self, path: str = PEOPLE_INDEX_PATH, ttl: float = PEOPLE_INDEX_TTL,
+                 max_profiles: int = PEOPLE_INDEX_SIZE, min_match: float = PEOPLE_INDEX_MIN_MATCH,
+                 compact_every: int = PEOPLE_INDEX_COMPACT_EVERY):
+        self.path = path
+        self.ttl = ttl
+        self.max_profiles = max_profiles
+        self.min_match = min_match
+        self.compact_every = compact_every
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._db = ProcessConnection(path, self._create_tables)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        return self._db.get()
+
+    def _create_tables(self, conn):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS profiles ("
+            "key TEXT PRIMARY KEY, link TEXT NOT NULL, title TEXT NOT NULL, snippet TEXT NOT NULL, "
+            "name TEXT, headline TEXT, company TEXT, location TEXT, seen_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS profiles_seen ON profiles(seen_at)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term TEXT NOT NULL, key TEXT NOT NULL, weight INTEGER NOT NULL, PRIMARY KEY (term, key))"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS postings_key ON postings(key)")
+
+    def add(self, items: list) -> int:
+        """Index CSE items ({title, link, snippet}) that are profile pages. Returns how many were written."""
+        now = time.time()
+        written = 0
+        with self._lock, self._conn:
+            for item in items:
+                # Posts, articles and other pages that mention people would be served later as people
+                if not is_profile_url(item.get("link", "")):
+                    continue
+                key = canonical_profile_url(item.get("link", ""))
+                fields = parse_profile(item)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO profiles (key, link, title, snippet, name, headline, company, "
+                    "location, seen_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (key, item.get("link", ""), item.get("title", ""), item.get("snippet", ""),
+                     fields["name"], fields["headline"], fields["company"], fields["location"], now),
+                )
+                # The snippet can change between sightings, so rebuild this profile's postings
+                self._conn.execute("DELETE FROM postings WHERE key = ?", (key,))
+                weights = {}
+                for field, weight in FIELD_WEIGHTS.items():
+                    for term in tokenize(fields[field]):
+                        weights[term] = max(weights.get(term, 0), weight)
+                self._conn.executemany("INSERT INTO postings (term, key, weight) VALUES (?, ?, ?)",
+                                       [(term, key, weight) for term, weight in weights.items()])
+                written += 1
+            self._writes += written
+            compact = self.compact_every and self._writes >= self.compact_every
+            if compact:
+                self._writes = 0
+        if compact:
+            self.compact()
+        return written
+
+    def search(self, natural_query: str, limit: int = 10, exclude=()) -> list:
+        """Fresh profiles matching the query, best first, as CSE-style {title, link, snippet} items."""
+        terms = query_terms(natural_query)
+        if not terms:
+            return []
+        required = max(1, math.ceil(len(terms) * self.min_match))
+        placeholders = ",".join("?" * len(terms))
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.key, p.link, p.title, p.snippet FROM postings t JOIN profiles p ON p.key = t.key "
+                f"WHERE t.term IN ({placeholders}) AND p.seen_at >= ? "
+                "GROUP BY p.key HAVING COUNT(*) >= ? "
+                "ORDER BY COUNT(*) DESC, SUM(t.weight) DESC, p.seen_at DESC LIMIT ?",
+                (*terms, time.time() - self.ttl, required, limit + len(exclude)),
+            ).fetchall()
+        excluded = set(exclude)
+        results = [{"title": title, "link": link, "snippet": snippet}
+                   for key, link, title, snippet in rows if key not in excluded]
+        return results[:limit]
+
+    def compact(self):
+        """Drop stale profiles, trim to max_profiles (oldest first) and remove orphaned postings."""
+        with self._lock, self._conn:
+            expired = self._conn.execute("DELETE FROM profiles WHERE seen_at < ?",
+                                         (time.time() - self.ttl,)).rowcount
+            count = self._conn.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+            overflow = max(0, count - self.max_profiles)
+            if overflow:
+                self._conn.execute(
+                    "DELETE FROM profiles WHERE key IN (SELECT key FROM profiles ORDER BY seen_at ASC LIMIT ?)",
+                    (overflow,),
+                )
+            self._conn.execute("DELETE FROM postings WHERE key NOT IN (SELECT key FROM profiles)")
+        if expired or overflow:
+            logger.info("People index compacted: %d expired, %d over the size limit", expired, overflow)
+
+    def info(self) -> dict:
+        with self._lock:
+            profiles = self._conn.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+            postings = self._conn.execute("SELECT COUNT(*) FROM postings").fetchone()[0]
+        return {"path": self.path, "profiles": profiles, "postings": postings,
+                "max_profiles": self.max_profiles, "ttl": self.ttl}
+
+
+def make_people_index():
+    return PeopleIndex() if PEOPLE_INDEX_ENABLED else None
+
+
+people_index = make_people_index()
@@ -1,14 +1,60 @@
 import os
+import re
+import time
 import json
-import anthropic
-from googleapiclient.discovery import build
+import queue
+import hashlib
+import logging
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait
 from dotenv import load_dotenv
+from cache import make_cache
+from clients import (ANTHROPIC_TIMEOUT, get_anthropic_client, get_customsearch_service,
+                     get_async_anthropic_client, get_async_http_session, run_sync)
+from search_planner import plan_search, rank_dorks, canonical_profile_url
+import metrics
+import resilience
+from people_index import people_index
+from dork_optimizer import DORK_OPTIMIZE, optimize_dorks, unique_dorks
+from local_dorks import local_translation
 
 # Load environment variables
 load_dotenv()
 ANTHROPIC_API_KEY = os.environ.get("ANTHROPIC_API_KEY")
 GOOGLE_API_KEY = os.environ.get("GOOGLE_API_KEY")
 GOOGLE_CSE_ID = os.environ.get("GOOGLE_CSE_ID")
+CSE_ENDPOINT = "https://www.googleapis.com/customsearch/v1"
+
+# Concurrency settings for the CSE fan-out
+SEARCH_MAX_WORKERS = int(os.environ.get("SEARCH_MAX_WORKERS", 6))
+SEARCH_TIMEOUT = float(os.environ.get("SEARCH_TIMEOUT", 10))
+# Send a duplicate CSE request when one is slower than recent p95 (see resilience.py)
+CSE_HEDGE = os.environ.get("CSE_HEDGE", "true").lower() == "true"
+
+# CSE result cache settings
+SEARCH_CACHE_BACKEND = os.environ.get("SEARCH_CACHE_BACKEND", "memory")
+SEARCH_CACHE_TTL = float(os.environ.get("SEARCH_CACHE_TTL", 24 * 60 * 60))
+SEARCH_CACHE_SIZE = int(os.environ.get("SEARCH_CACHE_SIZE", 5000))
+SEARCH_CACHE_PATH = os.environ.get("SEARCH_CACHE_PATH", "./.cache/search_cache.sqlite3")
+
+# Natural-query -> dork translation cache settings
+DORK_MODEL = "claude-3-opus-20240229"
+DORK_CACHE_BACKEND = os.environ.get("DORK_CACHE_BACKEND", "sqlite")
+DORK_CACHE_TTL = float(os.environ.get("DORK_CACHE_TTL", 30 * 24 * 60 * 60))
+DORK_CACHE_SIZE = int(os.environ.get("DORK_CACHE_SIZE", 10000))
+DORK_CACHE_PATH = os.environ.get("DORK_CACHE_PATH", "./.cache/dork_cache.sqlite3")
+# Natural language queries translated per LLM call by /search/batch
+BATCH_TRANSLATE_SIZE = int(os.environ.get("BATCH_TRANSLATE_SIZE", 10))
+
+logger = logging.getLogger(__name__)
+
+search_cache = make_cache(SEARCH_CACHE_BACKEND, SEARCH_CACHE_TTL, SEARCH_CACHE_SIZE,
+                          path=SEARCH_CACHE_PATH, table="cse_results")
+
+# Shared, bounded pool so concurrent /search requests can't open unbounded CSE calls
+_search_executor = ThreadPoolExecutor(max_workers=SEARCH_MAX_WORKERS, thread_name_prefix="cse")
 
 # Template for prompting Claude to generate Google dorks
 DORKS_TEMPLATE = """
@@ -336,10 +382,70 @@ User Query: {query}
 Return ONLY the JSON with dorks, nothing else.
 """
 
-def search_with_google_api(query: str) -> dict:
+# Changing the prompt template invalidates every cached translation
+TEMPLATE_HASH = hashlib.sha256(DORKS_TEMPLATE.encode("utf-8")).hexdigest()[:16]
+
+# Same syntax reference, asking for several numbered queries in one response
+BATCH_DORKS_TEMPLATE = DORKS_TEMPLATE.split("now following is the user query")[0] + """
+now following are several user queries, numbered. Convert each one to dorks and give me only JSON nothing else:
+a JSON object mapping each query number to its array of dorks, like {"1": ["dork", ...], "2": [...]}
+
+Queries:
+{queries}
+
+Return ONLY the JSON object with dorks, nothing else.
+"""
+
+dork_cache = make_cache(DORK_CACHE_BACKEND, DORK_CACHE_TTL, DORK_CACHE_SIZE,
+                        path=DORK_CACHE_PATH, table="dork_translations")
+
+def empty_results() -> dict:
+    """Result shape used for a dork that failed or timed out."""
+    return {"data": [], "links": []}
+
+
+def normalize_dork(query: str) -> str:
+    """Collapse whitespace and case so equivalent dorks share a cache entry."""
+    return " ".join(query.split()).casefold()
+
+
+def search_with_google_api(query: str, num: int = 5, timeout: float = SEARCH_TIMEOUT) -> dict:
     """Search using Google's Custom Search API."""
-    service = build("customsearch", "v1", developerKey=GOOGLE_API_KEY)
-    response = service.cse().list(q=query, cx=GOOGLE_CSE_ID, num=5).execute()
+    cache_key = f"{num}:{normalize_dork(query)}"
+    if search_cache is not None:
+        cached = search_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    service = get_customsearch_service(timeout)
+    with metrics.span("cse.search", upstream="cse"):
+        # GETs are safe to repeat: retried on transient errors, and raced by a duplicate when slow
+        response = resilience.call(
+            "cse", lambda: service.cse().list(q=query, cx=GOOGLE_CSE_ID, num=num).execute(),
+            idempotent=True, deadline=timeout, hedge=CSE_HEDGE,
+        )
+    results = _parse_cse_response(response)
+    _remember_results(cache_key, results)
+    return results
+
+
+def _remember_results(cache_key: str, results: dict):
+    if search_cache is not None:
+        search_cache.set(cache_key, results)
+    _index_results(results)
+
+
+def _index_results(results: dict):
+    """Keep fresh CSE items in the local people index so later searches can skip CSE."""
+    if people_index is None or not results["data"]:
+        return
+    try:
+        people_index.add(results["data"])
+    except Exception:
+        logger.exception("Failed to index CSE results")
+
+
+def _parse_cse_response(response: dict) -> dict:
     items = response.get("items", []) or []
     data = []
     links = []
@@ -353,33 +459,614 @@ def search_with_google_api(query: str) -> dict:
     return {"data": data, "links": links}
 
 
-def generate_google_dorks(natural_query: str) -> dict:
-    """Generate Google dorks for a natural language query, then fetch CSE results."""
-    if not ANTHROPIC_API_KEY or not GOOGLE_API_KEY or not GOOGLE_CSE_ID:
-        raise RuntimeError("Required environment variables are missing: ANTHROPIC_API_KEY, GOOGLE_API_KEY, GOOGLE_CSE_ID")
+def _safe_search(query: str) -> dict:
+    """Run one CSE call, returning an empty slot instead of raising."""
+    try:
+        return search_with_google_api(query)
+    except Exception:
+        logger.exception("CSE search failed for dork %r", query)
+        return empty_results()
 
-    # 1. Ask Claude to generate JSON array of dorks
-    client = anthropic.Anthropic(api_key=ANTHROPIC_API_KEY)
+
+def run_dork_searches(dorks: list, concurrent: bool = True) -> dict:
+    """Fetch CSE results for each dork, keyed as query_1..query_N in dork order."""
+    if not concurrent:
+        return {
+            f"query_{idx}": {"query": dork, "results": search_with_google_api(dork)}
+            for idx, dork in enumerate(dorks, start=1)
+        }
+
+    # Copy the context so spans recorded on pool threads are attributed to this request
+    futures = [_search_executor.submit(contextvars.copy_context().run, _safe_search, dork) for dork in dorks]
+    # Sockets time out per call; this bounds the wait for calls still queued in the pool
+    wait(futures, timeout=SEARCH_TIMEOUT)
+
+    final_results = {}
+    for idx, (dork, future) in enumerate(zip(dorks, futures), start=1):
+        if future.done():
+            results = future.result()
+        else:
+            future.cancel()
+            logger.warning("CSE search timed out for dork %r", dork)
+            results = empty_results()
+        final_results[f"query_{idx}"] = {"query": dork, "results": results}
+    return final_results
+
+
+def iter_dork_searches(dorks, stop: threading.Event = None):
+    """Yield (idx, dork, results) as each CSE call finishes, in completion order.
+
+    `dorks` may be any iterable, including a generator that is still streaming
+    dorks out of the LLM; each dork is submitted to the pool as soon as it arrives.
+    Closing the generator early cancels any searches still queued in the pool,
+    sets `stop` and closes `dorks`. If `dorks` raises, the searches already
+    submitted are still yielded before the error is raised.
+    """
+    events = queue.Queue()
+    futures = []
+    stop = stop or threading.Event()
+
+    def on_done(future, idx, dork):
+        if not future.cancelled():
+            events.put(("result", idx, dork, future.result()))
+
+    def submit_all():
+        failure = None
+        try:
+            for idx, dork in enumerate(dorks, start=1):
+                if stop.is_set():
+                    break
+                future = _search_executor.submit(contextvars.copy_context().run, _safe_search, dork)
+                futures.append(future)
+                future.add_done_callback(lambda f, idx=idx, dork=dork: on_done(f, idx, dork))
+        except Exception as e:
+            failure = e
+        finally:
+            # A streaming source stops generating (and billing) once it's closed
+            close = getattr(dorks, "close", None)
+            if close is not None:
+                close()
+        events.put(("submitted", len(futures), failure))
+
+    threading.Thread(target=contextvars.copy_context().run, args=(submit_all,),
+                     name="dork-submit", daemon=True).start()
+
+    total = None
+    failure = None
+    received = 0
+    deadline = None
+    try:
+        while total is None or received < total:
+            # The CSE timeout only starts once every dork has been submitted
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                event = events.get(timeout=timeout)
+            except queue.Empty:
+                logger.warning("CSE search stream timed out with %d dork(s) pending", total - received)
+                return
+            if event[0] == "result":
+                received += 1
+                yield event[1], event[2], event[3]
+            else:
+                total, failure = event[1], event[2]
+                deadline = time.monotonic() + SEARCH_TIMEOUT
+        if failure is not None:
+            raise failure
+    finally:
+        stop.set()
+        for future in list(futures):
+            future.cancel()
+
+
+def canonicalize_query(natural_query: str) -> str:
+    """Case-fold and strip punctuation/extra whitespace so near-identical queries match."""
+    text = re.sub(r"[^\w\s]", " ", natural_query.casefold())
+    return " ".join(text.split())
+
+
+def _dork_cache_key(natural_query: str) -> str:
+    return f"{DORK_MODEL}:{TEMPLATE_HASH}:{canonicalize_query(natural_query)}"
+
+
+def parse_dorks(response_text: str) -> list:
+    """Pull the JSON array of dorks out of a Claude response."""
+    if "```json" in response_text:
+        json_str = response_text.split("```json")[1].split("```")[0].strip()
+    else:
+        json_str = response_text.strip()
+    return json.loads(json_str)
+
+
+class IncrementalDorkParser:
+    """Parses a JSON array of strings as it streams in, emitting each complete string.
+
+    Text before the opening '[' (such as a ```json fence) is skipped. If the
+    stream turns out not to be a flat array of strings, `failed` is set and the
+    caller should fall back to parse_dorks on the full text.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.failed = False
+        self._in_string = False
+        self._escaped = False
+        self._buffer = []
+
+    def feed(self, chunk: str) -> list:
+        dorks = []
+        for char in chunk:
+            if self.finished or self.failed:
+                break
+            if not self.started:
+                if char == "[":
+                    self.started = True
+            elif self._in_string:
+                self._buffer.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    try:
+                        dorks.append(json.loads("".join(self._buffer)))
+                    except ValueError:
+                        self.failed = True
+                    self._buffer = []
+            elif char == '"':
+                self._in_string = True
+                self._buffer = [char]
+            elif char == "]":
+                self.finished = True
+            elif char not in ", \t\r\n":
+                self.failed = True
+        return dorks
+
+
+def _local_dorks(natural_query: str):
+    """Dorks from the rule-based synthesizer for simple queries, or None to ask the LLM."""
+    with metrics.span("local.translate"):
+        dorks = local_translation(natural_query)
+    if dorks is not None:
+        metrics.inc("meetdave_local_translations_total", help="Queries translated without the LLM")
+    return dorks
+
+
+def translate_query(natural_query: str) -> list:
+    """Turn a natural language query into dorks, reusing cached translations."""
+    dorks = _local_dorks(natural_query)
+    if dorks is not None:
+        return dorks
+    cache_key = _dork_cache_key(natural_query)
+    if dork_cache is not None:
+        cached = dork_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    client = get_anthropic_client()
     prompt = DORKS_TEMPLATE.replace("{query}", natural_query)
-    message = client.messages.create(
-        model="claude-3-opus-20240229",
+    with metrics.span("llm.translate", upstream="anthropic"):
+        message = resilience.call("anthropic", lambda: client.messages.create(
+            model=DORK_MODEL,
+            max_tokens=4096,
+            temperature=0,
+            messages=[{"role": "user", "content": prompt}]
+        ), idempotent=True, deadline=ANTHROPIC_TIMEOUT)
+    metrics.record_llm_usage(getattr(message, "usage", None), DORK_MODEL)
+    dorks = parse_dorks(message.content[0].text)
+    if dork_cache is not None:
+        dork_cache.set(cache_key, dorks)
+    return dorks
+
+
+def stream_translate_query(natural_query: str, stop: threading.Event = None):
+    """Yield dorks one at a time while Claude is still generating the rest.
+
+    Falls back to parsing the complete response when the incremental parser
+    can't make sense of the stream, yielding only the dorks not seen yet.
+    Setting `stop` closes the Claude stream at the next chunk, so the rest of
+    the response isn't generated.
+    """
+    dorks = _local_dorks(natural_query)
+    if dorks is not None:
+        yield from dorks
+        return
+    cache_key = _dork_cache_key(natural_query)
+    if dork_cache is not None:
+        cached = dork_cache.get(cache_key)
+        if cached is not None:
+            yield from cached
+            return
+
+    client = get_anthropic_client()
+    prompt = DORKS_TEMPLATE.replace("{query}", natural_query)
+    parser = IncrementalDorkParser()
+    emitted = []
+    chunks = []
+    # The request is only sent when the stream is entered, inside the breaker
+    request = client.messages.stream(
+        model=DORK_MODEL,
         max_tokens=4096,
         temperature=0,
         messages=[{"role": "user", "content": prompt}]
     )
-    # Extract JSON
-    response_text = message.content[0].text
-    if "```json" in response_text:
-        json_str = response_text.split("```json")[1].split("```")[0].strip()
+    with metrics.span("llm.translate_stream", upstream="anthropic"), resilience.guard("anthropic"), \
+            request as stream:
+        for text in stream.text_stream:
+            if stop is not None and stop.is_set():
+                return
+            chunks.append(text)
+            for dork in parser.feed(text):
+                emitted.append(dork)
+                yield dork
+        metrics.record_llm_usage(getattr(stream.get_final_message(), "usage", None), DORK_MODEL)
+
+    dorks = emitted
+    if parser.failed or not parser.finished:
+        dorks = parse_dorks("".join(chunks))
+        for dork in dorks:
+            if dork not in emitted:
+                yield dork
+    if dork_cache is not None:
+        dork_cache.set(cache_key, dorks)
+
+
+def parse_batch_dorks(response_text: str, count: int) -> list:
+    """Pull per-query dork arrays out of a batch response. Missing queries come back as None."""
+    parsed = parse_dorks(response_text)
+    if isinstance(parsed, list) and len(parsed) == count and all(isinstance(d, list) for d in parsed):
+        # Some responses drop the numbering and return a list of arrays instead
+        return parsed
+    if not isinstance(parsed, dict):
+        raise ValueError("Batch response is not a JSON object")
+    batches = []
+    for number in range(1, count + 1):
+        dorks = parsed.get(str(number))
+        batches.append(dorks if isinstance(dorks, list) else None)
+    return batches
+
+
+def _translate_batch(natural_queries: list) -> list:
+    """One LLM call for up to BATCH_TRANSLATE_SIZE queries; queries it misses are translated singly."""
+    numbered = "\n".join(f"{number}. {' '.join(query.split())}"
+                         for number, query in enumerate(natural_queries, start=1))
+    prompt = BATCH_DORKS_TEMPLATE.replace("{queries}", numbered)
+    client = get_anthropic_client()
+    try:
+        with metrics.span("llm.translate_batch", upstream="anthropic"):
+            message = resilience.call("anthropic", lambda: client.messages.create(
+                model=DORK_MODEL,
+                max_tokens=4096,
+                temperature=0,
+                messages=[{"role": "user", "content": prompt}]
+            ), idempotent=True, deadline=ANTHROPIC_TIMEOUT)
+        metrics.record_llm_usage(getattr(message, "usage", None), DORK_MODEL)
+        batches = parse_batch_dorks(message.content[0].text, len(natural_queries))
+    except ValueError:
+        logger.warning("Could not parse batch translation of %d queries", len(natural_queries), exc_info=True)
+        batches = [None] * len(natural_queries)
+
+    translated = []
+    for natural_query, dorks in zip(natural_queries, batches):
+        if dorks is None:
+            dorks = translate_query(natural_query)
+        elif dork_cache is not None:
+            dork_cache.set(_dork_cache_key(natural_query), dorks)
+        translated.append(dorks)
+    return translated
+
+
+def translate_queries(natural_queries: list) -> list:
+    """Translate many queries at once: simple and cached ones skip the LLM, the rest share batched calls.
+
+    Returns one list of dorks per query, in input order. Queries that differ only
+    in case or punctuation are translated once.
+    """
+    translations = {}
+    pending = []
+    for natural_query in natural_queries:
+        key = _dork_cache_key(natural_query)
+        if key in translations:
+            continue
+        cached = _local_dorks(natural_query)
+        if cached is None and dork_cache is not None:
+            cached = dork_cache.get(key)
+        translations[key] = cached
+        if cached is None:
+            pending.append(natural_query)
+
+    chunks = [pending[i:i + BATCH_TRANSLATE_SIZE] for i in range(0, len(pending), max(1, BATCH_TRANSLATE_SIZE))]
+    if chunks:
+        with ThreadPoolExecutor(max_workers=len(chunks), thread_name_prefix="dork-batch") as pool:
+            batches = pool.map(lambda chunk: contextvars.copy_context().run(_translate_batch, chunk), chunks)
+            for chunk, translated in zip(chunks, batches):
+                for natural_query, dorks in zip(chunk, translated):
+                    translations[_dork_cache_key(natural_query)] = dorks
+    return [translations[_dork_cache_key(natural_query)] for natural_query in natural_queries]
+
+
+def warm_up():
+    """Build the CSE service used by searches ahead of the first /search (see clients.warm_up)."""
+    get_customsearch_service(SEARCH_TIMEOUT)
+
+
+def optimize(dorks: list) -> tuple:
+    """Drop equivalent dorks and merge compatible ones before they cost CSE calls.
+
+    Returns (dorks, stats); see dork_optimizer.optimize_dorks. Translations are
+    cached as generated, so changing the optimizer settings applies immediately.
+    """
+    if not DORK_OPTIMIZE:
+        return dorks, {"dorks_generated": len(dorks), "dorks_executed": len(dorks), "dork_reduction": 0.0}
+    optimized, stats = optimize_dorks(dorks)
+    metrics.inc("meetdave_dorks_generated_total", stats["dorks_generated"], help="Dorks returned by the LLM")
+    metrics.inc("meetdave_dorks_executed_total", stats["dorks_executed"], help="Dorks left after optimization")
+    if stats["dorks_executed"] < stats["dorks_generated"]:
+        logger.info("Dork optimizer: %(dorks_generated)d -> %(dorks_executed)d dorks "
+                    "(%(duplicates_removed)d duplicate(s), %(merges)d merge(s))", stats)
+    return optimized, stats
+
+
+def invalidate_dork_cache(natural_query: str = None) -> None:
+    """Drop one cached translation, or all of them when no query is given."""
+    if dork_cache is None:
+        return
+    if natural_query is None:
+        dork_cache.clear()
     else:
-        json_str = response_text.strip()
-    dorks = json.loads(json_str)
+        dork_cache.delete(_dork_cache_key(natural_query))
 
-    # 2. For each dork, fetch search results
-    final_results = {}
-    for idx, dork in enumerate(dorks, start=1):
-        final_results[f"query_{idx}"] = {
-            "query": dork,
-            "results": search_with_google_api(dork)
+
+def cache_stats() -> dict:
+    """Size and hit-rate figures for the translation and CSE caches."""
+    return {
+        "dork_translations": dork_cache.info() if dork_cache is not None else None,
+        "cse_results": search_cache.info() if search_cache is not None else None,
+    }
+
+
+metrics.registry.register_collector(metrics.cache_collector(cache_stats))
+
+
+def generate_google_dorks(natural_query: str, concurrent: bool = True, incremental: bool = False) -> dict:
+    """Generate Google dorks for a natural language query, then fetch CSE results.
+
+    With incremental=True the Claude response is streamed and each dork is
+    searched as soon as it is parsed, overlapping generation with search I/O.
+    """
+    if not ANTHROPIC_API_KEY or not GOOGLE_API_KEY or not GOOGLE_CSE_ID:
+        raise RuntimeError("Required environment variables are missing: ANTHROPIC_API_KEY, GOOGLE_API_KEY, GOOGLE_CSE_ID")
+
+    if incremental:
+        dorks = []
+
+        def recorded():
+            for dork in stream_translate_query(natural_query):
+                dorks.append(dork)
+                yield dork
+
+        completed = {idx: results for idx, _dork, results in iter_dork_searches(recorded())}
+        return {
+            f"query_{idx}": {"query": dork, "results": completed.get(idx, empty_results())}
+            for idx, dork in enumerate(dorks, start=1)
         }
-    return final_results
+
+    with metrics.span("generate_google_dorks"):
+        # 1. Ask Claude to generate JSON array of dorks (or reuse a cached translation)
+        dorks, _stats = optimize(translate_query(natural_query))
+
+        # 2. For each dork, fetch search results (in parallel unless concurrent=False)
+        return run_dork_searches(dorks, concurrent=concurrent)
+
+
+def plan_google_dorks(natural_query: str, budget: int = 10, exclude=()) -> dict:
+    """Translate a query, then run its dorks in priority order until `budget` unique profiles are found.
+
+    Returns {"results": [(idx, dork, item), ...], "stats": {...}}; see search_planner.plan_search.
+    `exclude` holds canonical profile URLs the caller already has.
+    """
+    if not ANTHROPIC_API_KEY or not GOOGLE_API_KEY or not GOOGLE_CSE_ID:
+        raise RuntimeError("Required environment variables are missing: ANTHROPIC_API_KEY, GOOGLE_API_KEY, GOOGLE_CSE_ID")
+
+    with metrics.span("plan_google_dorks"):
+        dorks, optimizer_stats = optimize(translate_query(natural_query))
+        plan = plan_search(dorks, iter_dork_searches, budget=budget, exclude=exclude)
+    plan["stats"]["dorks_generated"] = optimizer_stats["dorks_generated"]
+    plan["stats"]["dork_reduction"] = optimizer_stats["dork_reduction"]
+    metrics.inc("meetdave_cse_calls_saved_total", plan["stats"]["calls_saved"],
+                help="CSE calls avoided by the search planner or batch dedupe")
+    return plan
+
+
+def batch_google_dorks(natural_queries: list, budget: int = 10) -> dict:
+    """Translate and search many queries together, sharing LLM calls and CSE calls between them.
+
+    Dorks that several queries produce are searched once. Returns
+    {"queries": [[(idx, dork, item), ...] per query], "profiles": [(query_idx, idx, dork, item), ...],
+    "stats": {...}}: each query keeps up to `budget` unique profiles in dork priority
+    order, and "profiles" dedupes them across the whole batch.
+    """
+    if not ANTHROPIC_API_KEY or not GOOGLE_API_KEY or not GOOGLE_CSE_ID:
+        raise RuntimeError("Required environment variables are missing: ANTHROPIC_API_KEY, GOOGLE_API_KEY, GOOGLE_CSE_ID")
+
+    with metrics.span("batch_google_dorks"):
+        optimized = [optimize(dorks) for dorks in translate_queries(natural_queries)]
+        translated = [dorks for dorks, _stats in optimized]
+
+        # One CSE call per distinct dork, whichever query it came from
+        unique = {}
+        for dorks in translated:
+            for dork in dorks:
+                unique.setdefault(normalize_dork(dork), dork)
+        unique_dorks = list(unique.values())
+        searched = {normalize_dork(dork): results for _idx, dork, results in iter_dork_searches(unique_dorks)}
+
+    per_query = []
+    profiles = []
+    global_seen = set()
+    for query_idx, dorks in enumerate(translated):
+        seen = set()
+        found = []
+        for idx, dork in rank_dorks(dorks):
+            if len(found) >= budget:
+                break
+            for item in searched.get(normalize_dork(dork), empty_results())["data"]:
+                key = canonical_profile_url(item.get("link", ""))
+                if not key or key in seen:
+                    continue
+                if len(found) >= budget:
+                    break
+                seen.add(key)
+                found.append((idx, dork, item))
+                if key not in global_seen:
+                    global_seen.add(key)
+                    profiles.append((query_idx, idx, dork, item))
+        per_query.append(found)
+
+    total_dorks = sum(len(dorks) for dorks in translated)
+    generated = sum(optimizer_stats["dorks_generated"] for _dorks, optimizer_stats in optimized)
+    stats = {
+        "queries": len(natural_queries),
+        "dorks_generated": generated,
+        "dork_reduction": round(1 - total_dorks / generated, 3) if generated else 0.0,
+        "dorks": total_dorks,
+        "cse_calls": len(unique_dorks),
+        "calls_saved": total_dorks - len(unique_dorks),
+        "unique_profiles": len(profiles),
+    }
+    metrics.inc("meetdave_cse_calls_saved_total", stats["calls_saved"],
+                help="CSE calls avoided by the search planner or batch dedupe")
+    logger.info("Batch search: %(queries)d queries, %(cse_calls)d/%(dorks)d CSE calls", stats)
+    return {"queries": per_query, "profiles": profiles, "stats": stats}
+
+
+def search_people(natural_query: str, budget: int = 10) -> dict:
+    """Answer from the local people index first; translate and run dorks only for the shortfall.
+
+    Same shape as plan_google_dorks. Index hits come first with dork None, and
+    stats["local_results"] says how many there were.
+    """
+    local = _search_index(natural_query, budget)
+    found = [(idx, None, item) for idx, item in enumerate(local, start=1)]
+
+    if len(found) >= budget:
+        stats = {"dorks": 0, "cse_calls": 0, "calls_saved": 0, "waves": 0, "unique_results": len(found)}
+    else:
+        plan = plan_google_dorks(natural_query, budget=budget - len(found),
+                                 exclude={canonical_profile_url(item["link"]) for item in local})
+        found += plan["results"]
+        stats = plan["stats"]
+    return {"results": found, "stats": {**stats, "local_results": len(local)}}
+
+
+def _search_index(natural_query: str, limit: int) -> list:
+    if people_index is None:
+        return []
+    with metrics.span("people_index.search"):
+        local = people_index.search(natural_query, limit=limit)
+    metrics.inc("meetdave_people_index_results_total", len(local), help="Search results served from the local index")
+    return local
+
+
+def stream_search_people(natural_query: str, budget: int = 10):
+    """search_people for streaming: yields (idx, dork, results) as results are found.
+
+    Index hits come first, one per item with dork None, and dorks only run if the
+    index falls short of `budget`. Streamed dorks are deduplicated but not merged,
+    and not run in waves, so a stream can cost more CSE calls than search_people.
+    """
+    local = _search_index(natural_query, budget)
+    for idx, item in enumerate(local, start=1):
+        yield idx, None, {"data": [item]}
+    if len(local) < budget:
+        yield from stream_google_dorks(natural_query)
+
+
+def stream_google_dorks(natural_query: str, incremental: bool = True):
+    """Like generate_google_dorks, but yields (idx, dork, results) as each dork completes."""
+    if not ANTHROPIC_API_KEY or not GOOGLE_API_KEY or not GOOGLE_CSE_ID:
+        raise RuntimeError("Required environment variables are missing: ANTHROPIC_API_KEY, GOOGLE_API_KEY, GOOGLE_CSE_ID")
+
+    # Shared so that closing this generator also ends the Claude stream
+    stop = threading.Event()
+    dorks = stream_translate_query(natural_query, stop) if incremental else translate_query(natural_query)
+    if DORK_OPTIMIZE:
+        dorks = unique_dorks(dorks)
+    yield from iter_dork_searches(dorks, stop)
+
+
+async def search_with_google_api_async(query: str, num: int = 5, timeout: float = SEARCH_TIMEOUT) -> dict:
+    """Async variant of search_with_google_api using the CSE REST endpoint over aiohttp.
+
+    Cache and index access can block on SQLite, so it runs in a thread rather than on the shared loop.
+    """
+    cache_key = f"{num}:{normalize_dork(query)}"
+    if search_cache is not None:
+        cached = await asyncio.to_thread(search_cache.get, cache_key)
+        if cached is not None:
+            return cached
+
+    session = get_async_http_session()
+    import aiohttp
+    params = {"key": GOOGLE_API_KEY, "cx": GOOGLE_CSE_ID, "q": query, "num": num}
+    with metrics.span("cse.search", upstream="cse"), resilience.guard("cse"):
+        async with session.get(CSE_ENDPOINT, params=params,
+                               timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            response.raise_for_status()
+            results = _parse_cse_response(await response.json())
+    await asyncio.to_thread(_remember_results, cache_key, results)
+    return results
+
+
+async def translate_query_async(natural_query: str) -> list:
+    """Async variant of translate_query using the async Anthropic client."""
+    dorks = _local_dorks(natural_query)
+    if dorks is not None:
+        return dorks
+    cache_key = _dork_cache_key(natural_query)
+    if dork_cache is not None:
+        cached = await asyncio.to_thread(dork_cache.get, cache_key)
+        if cached is not None:
+            return cached
+
+    client = get_async_anthropic_client()
+    prompt = DORKS_TEMPLATE.replace("{query}", natural_query)
+    with metrics.span("llm.translate", upstream="anthropic"):
+        message = await resilience.call_async("anthropic", lambda: client.messages.create(
+            model=DORK_MODEL,
+            max_tokens=4096,
+            temperature=0,
+            messages=[{"role": "user", "content": prompt}]
+        ), idempotent=True, deadline=ANTHROPIC_TIMEOUT)
+    metrics.record_llm_usage(getattr(message, "usage", None), DORK_MODEL)
+    dorks = parse_dorks(message.content[0].text)
+    if dork_cache is not None:
+        await asyncio.to_thread(dork_cache.set, cache_key, dorks)
+    return dorks
+
+
+async def _safe_search_async(query: str) -> dict:
+    try:
+        return await search_with_google_api_async(query)
+    except Exception:
+        logger.exception("CSE search failed for dork %r", query)
+        return empty_results()
+
+
+async def generate_google_dorks_async(natural_query: str) -> dict:
+    """Async generate_google_dorks: one coroutine per dork instead of one thread per dork."""
+    if not ANTHROPIC_API_KEY or not GOOGLE_API_KEY or not GOOGLE_CSE_ID:
+        raise RuntimeError("Required environment variables are missing: ANTHROPIC_API_KEY, GOOGLE_API_KEY, GOOGLE_CSE_ID")
+
+    dorks, _stats = optimize(await translate_query_async(natural_query))
+    results = await asyncio.gather(*(_safe_search_async(dork) for dork in dorks))
+    return {
+        f"query_{idx}": {"query": dork, "results": dork_results}
+        for idx, (dork, dork_results) in enumerate(zip(dorks, results), start=1)
+    }
+
+
+def generate_google_dorks_sync(natural_query: str) -> dict:
+    """Run generate_google_dorks_async on the shared background loop, for sync callers like Flask."""
+    return run_sync(generate_google_dorks_async(natural_query))
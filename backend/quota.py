@@ -0,0 +1,213 @@
+import os
+import time
+import atexit
+import logging
+import threading
+
+import clients
+import resilience
+import user_store
+
+# Lifetime searches allowed per user
+SEARCH_LIMIT = int(os.environ.get("SEARCH_LIMIT", 5))
+# Searches claimed from Firestore per transaction; the rest are served from memory
+QUOTA_LEASE_SIZE = int(os.environ.get("QUOTA_LEASE_SIZE", 2))
+# Worker processes sharing the quota, across all instances. Once a user has no more than
+# QUOTA_WORKERS * QUOTA_LEASE_SIZE searches left, claims take one search at a time
+QUOTA_WORKERS = int(os.environ.get("QUOTA_WORKERS", 4))
+# Unused leased searches go back to Firestore after this many seconds
+QUOTA_LEASE_TTL = float(os.environ.get("QUOTA_LEASE_TTL", 60))
+# How long a worker remembers that a user is out of searches
+QUOTA_EXHAUSTED_TTL = float(os.environ.get("QUOTA_EXHAUSTED_TTL", 60))
+# How often queued refunds are written back in one batch
+QUOTA_FLUSH_INTERVAL = float(os.environ.get("QUOTA_FLUSH_INTERVAL", 1.0))
+
+logger = logging.getLogger(__name__)
+
+
+class SearchQuota:
+    """Per-user search limit enforced with Firestore leases and a local cache.
+
+    Each worker claims up to QUOTA_LEASE_SIZE searches at a time in a Firestore
+    transaction, so the `searches` counter never passes the limit no matter how
+    many workers are running. Searches are then taken from the local lease
+    without any network calls. Unused leased searches and refunds for failed
+    searches are queued and written back in batches by a background thread.
+
+    While a lease is outstanding, `searches` counts leased searches as used and
+    `searches_leased_until` says until when another worker may still hold some.
+    Near the limit claims take a single search, so no search sits in one worker's
+    lease while another worker turns the user away; a denial is only remembered
+    locally once no lease can be outstanding.
+    """
+
+    def __init__(self, get_db, limit: int = SEARCH_LIMIT, lease_size: int = QUOTA_LEASE_SIZE,
+                 lease_ttl: float = QUOTA_LEASE_TTL, exhausted_ttl: float = QUOTA_EXHAUSTED_TTL,
+                 flush_interval: float = QUOTA_FLUSH_INTERVAL, workers: int = QUOTA_WORKERS):
+        self._get_db = get_db
+        self.limit = limit
+        self.lease_size = max(1, lease_size)
+        self.workers = max(1, workers)
+        self.lease_ttl = lease_ttl
+        self.exhausted_ttl = exhausted_ttl
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._leases = {}        # user_id -> [tokens, expires_at]
+        self._exhausted = {}     # user_id -> expires_at
+        self._pending = {}       # user_id -> searches to give back to Firestore
+        self._flusher_pid = None
+        self._wake = threading.Event()
+
+    def reserve(self, user_id: str) -> bool:
+        """Take one search from the user's quota. Returns False when the limit is reached."""
+        now = time.monotonic()
+        with self._lock:
+            lease = self._leases.get(user_id)
+            if lease is not None and lease[1] > now and lease[0] > 0:
+                lease[0] -= 1
+                return True
+            if self._exhausted.get(user_id, 0) > now:
+                return False
+            if lease is not None:
+                # Expired or empty lease: hand back anything left over
+                self._queue_return(user_id, lease[0])
+                del self._leases[user_id]
+
+        granted, leased_elsewhere = self._claim(user_id)
+        with self._lock:
+            if granted == 0:
+                # Another worker may still hand back unused searches; don't remember the denial until it can't
+                if not leased_elsewhere:
+                    self._exhausted[user_id] = now + self.exhausted_ttl
+                return False
+            self._exhausted.pop(user_id, None)
+            self._leases[user_id] = [granted - 1, now + self.lease_ttl]
+            self._ensure_flusher()
+            return True
+
+    def refund(self, user_id: str):
+        """Give back a search reserved for a request that failed."""
+        with self._lock:
+            lease = self._leases.get(user_id)
+            if lease is not None and lease[1] > time.monotonic():
+                lease[0] += 1
+            else:
+                self._queue_return(user_id, 1)
+            self._exhausted.pop(user_id, None)
+
+    def grant(self, data: dict, pending: int, now: float) -> tuple:
+        """Decide a claim from the user document: (searches granted, whether leases may be outstanding, fields to write)."""
+        used = max(0, data.get('searches', 0) - pending)
+        leased_until = data.get('searches_leased_until', 0)
+        remaining = max(0, self.limit - used)
+        # A lease parks searches in one worker; with few left they must stay claimable by every worker
+        granted = min(self.lease_size if remaining > self.workers * self.lease_size else 1, remaining)
+        fields = {}
+        if granted or pending:
+            fields['searches'] = used + granted
+        if granted > 1:
+            # An expired lease is handed back by the next flush, up to another lease_ttl later
+            leased_until = max(leased_until, now + 2 * self.lease_ttl + self.flush_interval)
+            fields['searches_leased_until'] = leased_until
+        return granted, leased_until > now, fields
+
+    def _claim(self, user_id: str) -> tuple:
+        """Claim searches in a transaction. Returns (granted, whether other workers may hold leases)."""
+        db = self._get_db()
+        user_ref = db.collection('users').document(user_id)
+        # Apply any queued refunds for this user in the same transaction
+        with self._lock:
+            pending = self._pending.pop(user_id, 0)
+        try:
+            # Not retried: a claim that timed out may still have committed
+            granted, leased_elsewhere, _fields = resilience.call(
+                "firestore", lambda: self._transact(db, user_ref, lambda data: self.grant(data, pending, time.time())),
+                timeout=clients.FIRESTORE_TIMEOUT)
+            return granted, leased_elsewhere
+        except Exception:
+            if pending:
+                with self._lock:
+                    self._pending[user_id] = self._pending.get(user_id, 0) + pending
+            raise
+
+    def _transact(self, db, user_ref, decide):
+        """Read the quota fields, decide, and write the decision in one Firestore transaction."""
+        from google.cloud import firestore
+        started = time.monotonic()
+
+        @firestore.transactional
+        def claim(transaction):
+            snapshot = user_ref.get(field_paths=user_store.QUOTA_FIELDS, transaction=transaction,
+                                    timeout=clients.FIRESTORE_TIMEOUT)
+            result = decide(snapshot.to_dict() or {})
+            if time.monotonic() - started > clients.FIRESTORE_TIMEOUT:
+                # The caller has given up on this claim; committing it would only lose searches
+                raise TimeoutError("quota claim exceeded FIRESTORE_TIMEOUT")
+            if result[-1]:
+                transaction.set(user_ref, result[-1], merge=True)
+            return result
+
+        return claim(db.transaction())
+
+    def _queue_return(self, user_id: str, count: int):
+        # Caller holds self._lock
+        if count <= 0:
+            return
+        self._pending[user_id] = self._pending.get(user_id, 0) + count
+        self._ensure_flusher()
+        self._wake.set()
+
+    def _ensure_flusher(self):
+        # Caller holds self._lock. Threads don't survive fork(), so each worker process starts its own
+        if self._flusher_pid != os.getpid():
+            self._flusher_pid = os.getpid()
+            threading.Thread(target=self._flush_loop, name="quota-flush", daemon=True).start()
+
+    def _flush_loop(self):
+        while True:
+            # Wake up for queued refunds, or periodically to return expired leases
+            if self._wake.wait(timeout=self.lease_ttl):
+                time.sleep(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write queued returns to Firestore in a single batch."""
+        now = time.monotonic()
+        with self._lock:
+            for user_id, lease in list(self._leases.items()):
+                if lease[1] <= now:
+                    self._pending[user_id] = self._pending.get(user_id, 0) + lease[0]
+                    del self._leases[user_id]
+            pending = {u: n for u, n in self._pending.items() if n > 0}
+            self._pending = {}
+        if not pending:
+            return
+        try:
+            from google.cloud import firestore
+            db = self._get_db()
+            batch = db.batch()
+            for user_id, count in pending.items():
+                batch.update(db.collection('users').document(user_id),
+                             {'searches': firestore.Increment(-count)})
+            batch.commit(timeout=clients.FIRESTORE_TIMEOUT)
+        except Exception:
+            logger.exception("Failed to write back %d quota refund(s)", len(pending))
+            with self._lock:
+                for user_id, count in pending.items():
+                    self._pending[user_id] = self._pending.get(user_id, 0) + count
+            self._wake.set()
+
+    def release_all(self):
+        """Return every unused leased search, e.g. at shutdown."""
+        with self._lock:
+            for user_id, lease in self._leases.items():
+                self._pending[user_id] = self._pending.get(user_id, 0) + lease[0]
+            self._leases = {}
+        self.flush()
+
+
+def make_search_quota(get_db) -> SearchQuota:
+    quota = SearchQuota(get_db)
+    atexit.register(quota.release_all)
+    return quota
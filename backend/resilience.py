@@ -0,0 +1,360 @@
+import os
+import time
+import asyncio
+import random
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FuturesTimeoutError
+
+import metrics
+
+# Consecutive transient failures that open an upstream's breaker
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", 5))
+# Seconds an open breaker fails fast before letting a trial call through
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", 30))
+# Extra attempts for idempotent calls, with full-jitter exponential backoff
+UPSTREAM_RETRIES = int(os.environ.get("UPSTREAM_RETRIES", 2))
+RETRY_BACKOFF_BASE = float(os.environ.get("RETRY_BACKOFF_BASE", 0.2))
+RETRY_BACKOFF_MAX = float(os.environ.get("RETRY_BACKOFF_MAX", 2))
+# Hedged calls send a duplicate once the first attempt is slower than this percentile of recent calls
+HEDGE_PERCENTILE = float(os.environ.get("HEDGE_PERCENTILE", 95))
+# Delay used until enough latencies are recorded, and the floor under the percentile
+HEDGE_MIN_DELAY = float(os.environ.get("HEDGE_MIN_DELAY", 0.5))
+# Most duplicates as a share of hedged calls, so a slow upstream doesn't get twice the load
+HEDGE_MAX_RATIO = float(os.environ.get("HEDGE_MAX_RATIO", 0.1))
+HEDGE_WORKERS = int(os.environ.get("HEDGE_WORKERS", 16))
+# Threads for calls bounded with call(timeout=...) whose SDK can't take a deadline itself
+TIMEOUT_WORKERS = int(os.environ.get("TIMEOUT_WORKERS", 16))
+
+logger = logging.getLogger(__name__)
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Its own pool: hedges must not wait behind the callers' pools (e.g. the CSE pool that is issuing them)
+_hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+# Separate again, so calls hung past their timeout don't hold up hedges
+_timeout_executor = ThreadPoolExecutor(max_workers=TIMEOUT_WORKERS, thread_name_prefix="deadline")
+
+
+class CircuitOpenError(Exception):
+    """An upstream's breaker is open; the call was not attempted."""
+
+    def __init__(self, upstream: str, retry_after: float):
+        super().__init__(f"{upstream} is unavailable (circuit open)")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+def error_status(error: Exception):
+    """HTTP status carried by an SDK error, if any (googleapiclient, Anthropic, requests, aiohttp, ApolloError)."""
+    status = getattr(getattr(error, "resp", None), "status", None)
+    if status is None:
+        status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    if status is None:
+        # aiohttp.ClientResponseError
+        status = getattr(error, "status", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def is_transient(error: Exception) -> bool:
+    """Timeouts, connection failures, 429s and 5xx: worth a retry and a mark against the upstream."""
+    if isinstance(error, CircuitOpenError):
+        return False
+    status = error_status(error)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(error, (OSError, TimeoutError, FuturesTimeoutError)):
+        return True
+    # SDK network errors that don't subclass OSError (anthropic.APIConnectionError, httpx timeouts, ...)
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name
+
+
+class CircuitBreaker:
+    """Opens after `failures` consecutive transient errors; after `cooldown`, one trial call decides."""
+
+    def __init__(self, upstream: str, failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.upstream = upstream
+        self.failures = failures
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self.state = CLOSED
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        with self._lock:
+            if self.state == CLOSED:
+                return
+            remaining = self._opened_at + self.cooldown - time.monotonic()
+            if self.state == OPEN and remaining <= 0:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return
+        metrics.inc("meetdave_circuit_rejections_total", help="Calls refused by an open circuit breaker",
+                    upstream=self.upstream)
+        raise CircuitOpenError(self.upstream, max(remaining, 1.0))
+
+    def record(self, error: Exception = None):
+        """Report the outcome of a call that before_call let through."""
+        with self._lock:
+            self._trial_running = False
+            if error is None or not is_transient(error):
+                # Client errors (404, 400, ...) still mean the upstream is answering
+                if self.state != CLOSED:
+                    logger.info("Circuit for %s closed", self.upstream)
+                self.state = CLOSED
+                self._consecutive = 0
+                return
+            self._consecutive += 1
+            if self.state == HALF_OPEN or self._consecutive >= self.failures:
+                if self.state != OPEN:
+                    logger.warning("Circuit for %s opened after %d failure(s)", self.upstream, self._consecutive)
+                    metrics.inc("meetdave_circuit_opened_total", help="Times a circuit breaker opened",
+                                upstream=self.upstream)
+                self.state = OPEN
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """The call was abandoned (cancelled, generator closed) without an outcome."""
+        with self._lock:
+            self._trial_running = False
+
+    def info(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self._consecutive}
+
+
+class LatencyTracker:
+    """Recent successful call latencies, for the hedge delay."""
+
+    def __init__(self, size: int = 500):
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=size)
+        self._added = 0
+        self._cached = None
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+            # Re-sorting 500 samples per call would be wasteful; refresh the percentile every 20 adds
+            # (counted separately: the deque's length stops changing once it is full)
+            self._added += 1
+            if self._added % 20 == 0:
+                self._cached = None
+
+    def percentile(self, pct: float):
+        with self._lock:
+            if len(self._samples) < 20:
+                return None
+            if self._cached is None or self._cached[0] != pct:
+                ordered = sorted(self._samples)
+                self._cached = (pct, ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))])
+            return self._cached[1]
+
+
+class Upstream:
+    """Breaker, latency history and hedge accounting for one external service."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.breaker = CircuitBreaker(name)
+        self.latency = LatencyTracker()
+        self._lock = threading.Lock()
+        self.hedged_calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def hedge_delay(self) -> float:
+        observed = self.latency.percentile(HEDGE_PERCENTILE)
+        return max(HEDGE_MIN_DELAY, observed or 0.0)
+
+    def _take_hedge(self) -> bool:
+        with self._lock:
+            if self.hedges >= HEDGE_MAX_RATIO * self.hedged_calls:
+                return False
+            self.hedges += 1
+            return True
+
+    def info(self) -> dict:
+        with self._lock:
+            hedge = {"hedged_calls": self.hedged_calls, "hedges": self.hedges, "hedge_wins": self.hedge_wins,
+                     "hedge_win_rate": self.hedge_wins / self.hedges if self.hedges else 0.0}
+        return {**self.breaker.info(), **hedge, "hedge_delay": self.hedge_delay()}
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def upstream(name: str) -> Upstream:
+    with _upstreams_lock:
+        state = _upstreams.get(name)
+        if state is None:
+            state = _upstreams[name] = Upstream(name)
+        return state
+
+
+@contextmanager
+def guard(name: str):
+    """Breaker around a call that can't be retried or hedged (streams, sends, async calls)."""
+    breaker = upstream(name).breaker
+    breaker.before_call()
+    try:
+        yield
+    except Exception as e:
+        breaker.record(e)
+        raise
+    except BaseException:
+        breaker.release()
+        raise
+    breaker.record()
+
+
+def _hedged(state: Upstream, fn, deadline: float = None):
+    """Run fn; if it hasn't answered within the hedge delay, race a duplicate. First success wins."""
+    with state._lock:
+        state.hedged_calls += 1
+    primary = _hedge_executor.submit(contextvars.copy_context().run, fn)
+    attempts = {primary: "primary"}
+    delay = state.hedge_delay() if deadline is None else min(state.hedge_delay(), deadline)
+    done, _pending = wait([primary], timeout=delay)
+    if not done and state._take_hedge():
+        metrics.inc("meetdave_hedges_total", help="Duplicate requests sent for slow calls", upstream=state.name)
+        attempts[_hedge_executor.submit(contextvars.copy_context().run, fn)] = "hedge"
+
+    end = None if deadline is None else time.monotonic() + deadline
+    pending = set(attempts)
+    error = None
+    while pending:
+        timeout = None if end is None else max(0.0, end - time.monotonic())
+        done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+        if not done:
+            raise FuturesTimeoutError(f"{state.name} call exceeded {deadline}s")
+        for future in done:
+            if future.exception() is not None:
+                error = future.exception()
+                continue
+            winner = attempts[future]
+            if len(attempts) > 1:
+                metrics.inc("meetdave_hedge_wins_total", help="Hedged calls by which attempt answered first",
+                            upstream=state.name, winner=winner)
+                if winner == "hedge":
+                    with state._lock:
+                        state.hedge_wins += 1
+            return future.result()
+    raise error
+
+
+def _bounded(fn, timeout: float):
+    """fn(), or FuturesTimeoutError once it has run for `timeout` seconds (it is left to finish on its own)."""
+    future = _timeout_executor.submit(contextvars.copy_context().run, fn)
+    try:
+        return future.result(timeout=timeout)
+    except FuturesTimeoutError:
+        future.cancel()
+        raise FuturesTimeoutError(f"call exceeded {timeout}s") from None
+
+
+def call(name: str, fn, idempotent: bool = False, deadline: float = None, hedge: bool = False,
+         timeout: float = None, retryable=None):
+    """Call fn() against an upstream through its breaker.
+
+    Idempotent calls are retried on transient errors with full-jitter backoff,
+    as long as the next attempt can start before `deadline` seconds have passed.
+    With hedge=True each attempt races a duplicate once it is slower than recent calls.
+    With timeout, an attempt still running after `timeout` seconds fails as a transient
+    error, for SDK calls that take no deadline of their own (Firestore transactions).
+    `retryable(error)` narrows which transient errors are retried, e.g. for billed calls.
+    """
+    state = upstream(name)
+    start = time.monotonic()
+    attempts = 1 + (UPSTREAM_RETRIES if idempotent else 0)
+    for attempt in range(attempts):
+        state.breaker.before_call()
+        attempt_start = time.monotonic()
+        try:
+            if hedge:
+                remaining = None if deadline is None else deadline - (attempt_start - start)
+                result = _hedged(state, fn, remaining)
+            elif timeout is not None:
+                result = _bounded(fn, timeout)
+            else:
+                result = fn()
+        except Exception as e:
+            state.breaker.record(e)
+            if not is_transient(e) or attempt == attempts - 1 or (retryable is not None and not retryable(e)):
+                raise
+            delay = random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt))
+            if deadline is not None and time.monotonic() - start + delay >= deadline:
+                raise
+            metrics.inc("meetdave_upstream_retries_total", help="Retried calls to external services",
+                        upstream=name)
+            logger.info("Retrying %s call in %.2fs after %s", name, delay, type(e).__name__)
+            time.sleep(delay)
+            continue
+        state.breaker.record()
+        state.latency.add(time.monotonic() - attempt_start)
+        return result
+
+
+async def call_async(name: str, fn, idempotent: bool = False, deadline: float = None):
+    """call() for coroutines: fn() returns an awaitable. Breaker and retries as in call(); no hedging."""
+    state = upstream(name)
+    start = time.monotonic()
+    attempts = 1 + (UPSTREAM_RETRIES if idempotent else 0)
+    for attempt in range(attempts):
+        state.breaker.before_call()
+        attempt_start = time.monotonic()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            state.breaker.release()
+            raise
+        except Exception as e:
+            state.breaker.record(e)
+            if not is_transient(e) or attempt == attempts - 1:
+                raise
+            delay = random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF_BASE * 2 ** attempt))
+            if deadline is not None and time.monotonic() - start + delay >= deadline:
+                raise
+            metrics.inc("meetdave_upstream_retries_total", help="Retried calls to external services",
+                        upstream=name)
+            logger.info("Retrying %s call in %.2fs after %s", name, delay, type(e).__name__)
+            await asyncio.sleep(delay)
+            continue
+        state.breaker.record()
+        state.latency.add(time.monotonic() - attempt_start)
+        return result
+
+
+def upstream_stats() -> dict:
+    with _upstreams_lock:
+        states = list(_upstreams.values())
+    return {state.name: state.info() for state in states}
+
+
+def _collect():
+    for name, info in upstream_stats().items():
+        labels = {"upstream": name}
+        yield ("meetdave_circuit_state", "gauge", "Circuit breaker state (0 closed, 1 half-open, 2 open)",
+               labels, _STATE_VALUES[info["state"]])
+        yield ("meetdave_hedge_delay_seconds", "gauge", "Current delay before a hedged duplicate is sent",
+               labels, info["hedge_delay"])
+        yield ("meetdave_hedge_win_ratio", "gauge", "Share of hedges that answered before the original",
+               labels, info["hedge_win_rate"])
+
+
+metrics.registry.register_collector(_collect)
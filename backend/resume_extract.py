@@ -0,0 +1,142 @@
+import os
+import uuid
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Upload and extraction limits
+RESUME_MAX_BYTES = int(os.environ.get("RESUME_MAX_BYTES", 10 * 1024 * 1024))
+RESUME_MAX_PAGES = int(os.environ.get("RESUME_MAX_PAGES", 30))
+RESUME_CPU_SECONDS = int(os.environ.get("RESUME_CPU_SECONDS", 20))
+RESUME_MEMORY_MB = int(os.environ.get("RESUME_MEMORY_MB", 512))
+RESUME_TIMEOUT = float(os.environ.get("RESUME_TIMEOUT", 30))
+RESUME_WORKERS = int(os.environ.get("RESUME_WORKERS", 2))
+# Uploads larger than this are extracted as a background job
+RESUME_ASYNC_BYTES = int(os.environ.get("RESUME_ASYNC_BYTES", 2 * 1024 * 1024))
+
+SPOOL_CHUNK_SIZE = 64 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def spool_upload(file, max_bytes: int = RESUME_MAX_BYTES):
+    """Copy an upload to a temp file in chunks, enforcing the size limit as it streams.
+
+    Returns (path, size). The caller owns the file and must remove it.
+    """
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    fd, path = tempfile.mkstemp(prefix="resume-", suffix=suffix)
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while True:
+                chunk = file.stream.read(SPOOL_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f"Resume exceeds {max_bytes} bytes")
+                out.write(chunk)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, size
+
+
+def _extract_pdf(path: str, max_pages: int, cpu_seconds: int, memory_bytes: int) -> str:
+    """Runs in a pool process: extract text from at most `max_pages` pages under rlimits."""
+    import resource
+    import fitz  # PyMuPDF, imported only in the worker
+
+    # RLIMIT_CPU counts the whole process lifetime, so allow `cpu_seconds` on top of what's used
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    used = int(usage.ru_utime + usage.ru_stime) + 1
+    _soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+    limit = used + cpu_seconds
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_CPU, (limit, hard))
+    _soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard == resource.RLIM_INFINITY or memory_bytes < hard:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, hard))
+
+    doc = fitz.open(path, filetype="pdf")
+    try:
+        pages = min(doc.page_count, max_pages)
+        return "\n".join(doc[i].get_text() for i in range(pages))
+    finally:
+        doc.close()
+
+
+def new_job_id() -> str:
+    return uuid.uuid4().hex
+
+
+class ResumeExtractor:
+    """Bounded process pool for PDF text extraction, plus background jobs."""
+
+    def __init__(self, workers: int = RESUME_WORKERS):
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn keeps the (threaded) Flask process out of fork()
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _reset_pool(self, pool):
+        # A worker killed by an rlimit breaks the whole pool; start a new one
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def extract(self, path: str, timeout: float = RESUME_TIMEOUT) -> str:
+        """Extract text from a spooled PDF. Raises on failure, timeout or limit breach."""
+        pool = self._get_pool()
+        future = pool.submit(_extract_pdf, path, RESUME_MAX_PAGES, RESUME_CPU_SECONDS,
+                             RESUME_MEMORY_MB * 1024 * 1024)
+        try:
+            return future.result(timeout=timeout)
+        except BrokenProcessPool:
+            self._reset_pool(pool)
+            raise RuntimeError("Resume extraction exceeded its CPU or memory limit")
+
+    def submit_job(self, path: str, on_done, on_error, job_id: str = None) -> str:
+        """Extract in the background and hand the text to `on_done(text)`. Returns the job id.
+
+        Takes ownership of `path` and removes it when the job finishes.
+        """
+        job_id = job_id or new_job_id()
+
+        def run():
+            try:
+                try:
+                    text = self.extract(path, timeout=RESUME_TIMEOUT * 4)
+                except Exception as e:
+                    logger.warning("Resume extraction job %s failed", job_id, exc_info=True)
+                    on_error(f"Error extracting text: {str(e)}")
+                else:
+                    on_done(text)
+            except Exception:
+                logger.exception("Failed to store result of resume job %s", job_id)
+            finally:
+                os.remove(path)
+
+        threading.Thread(target=run, name=f"resume-job-{job_id[:8]}", daemon=True).start()
+        return job_id
+
+
+extractor = ResumeExtractor()
@@ -0,0 +1,109 @@
+import os
+import re
+import logging
+from urllib.parse import urlsplit
+
+# Dorks issued per wave before checking whether the result budget is met
+PLANNER_WAVE_SIZE = int(os.environ.get("PLANNER_WAVE_SIZE", 2))
+
+logger = logging.getLogger(__name__)
+
+# Sites and the URL paths on them that are individual profiles: linkedin.com/in/<slug>, and a bare
+# handle elsewhere. Posts, statuses and articles live deeper; the names listed are site pages, not people
+_HANDLE = r"/(?!(?:{})$)[\w.]+"
+PROFILE_PATHS = {
+    "linkedin.com": re.compile(r"/in/[^/]+"),
+    "twitter.com": re.compile(_HANDLE.format("home|explore|search|hashtag|i|intent|share|login|messages")),
+    "x.com": re.compile(_HANDLE.format("home|explore|search|hashtag|i|intent|share|login|messages")),
+    "instagram.com": re.compile(_HANDLE.format("explore|p|reel|reels|stories|accounts|direct")),
+}
+
+
+def score_dork(dork: str) -> float:
+    """Heuristic priority for a dork: specific, profile-targeted dorks run first."""
+    text = dork.lower()
+    score = 0.0
+    if "site:linkedin.com/in" in text:
+        score += 3
+    # Each quoted phrase narrows the search
+    score += min(len(re.findall(r'"[^"]+"', dork)), 4)
+    # OR alternatives and date filters broaden or skew results towards posts
+    score -= 0.5 * len(re.findall(r"\bOR\b", dork))
+    if "after:" in text or "before:" in text:
+        score -= 1
+    # These restrict to posts and articles rather than profile pages
+    if any(marker in text for marker in ("inurl:/status", "inurl:/p/", "/pulse", "/jobs", "filetype:")):
+        score -= 2
+    return score
+
+
+def rank_dorks(dorks: list) -> list:
+    """(idx, dork) pairs with 1-based original positions, highest priority first."""
+    indexed = list(enumerate(dorks, start=1))
+    # sorted() is stable, so ties keep the LLM's order
+    return sorted(indexed, key=lambda pair: -score_dork(pair[1]))
+
+
+def canonical_profile_url(link: str) -> str:
+    """Normalize a profile URL so the same person found by two dorks dedupes."""
+    parts = urlsplit(link.strip())
+    host = parts.netloc.lower()
+    # Drop www. and country subdomains like uk.linkedin.com
+    for site in PROFILE_PATHS:
+        if host == site or host.endswith("." + site):
+            host = site
+            break
+    path = parts.path.rstrip("/").lower()
+    return f"{host}{path}"
+
+
+def is_profile_url(link: str) -> bool:
+    """Whether a link is a person's profile page on one of PROFILE_PATHS' sites."""
+    site, _, path = canonical_profile_url(link).partition("/")
+    pattern = PROFILE_PATHS.get(site)
+    return pattern is not None and pattern.fullmatch("/" + path) is not None
+
+
+def plan_search(dorks: list, run_wave, budget: int = 10, wave_size: int = PLANNER_WAVE_SIZE,
+                exclude=()) -> dict:
+    """Run dorks in priority order, in waves, until `budget` unique profiles are found.
+
+    `run_wave(list_of_dorks)` must yield (position, dork, results) for the dorks
+    in that wave, where position is 1-based within the list passed in.
+    Returns unique items as (idx, dork, item) in priority order, plus stats on
+    how many CSE calls were skipped. Profiles whose canonical URL is in `exclude`
+    (e.g. already answered from the local index) don't count towards the budget.
+    """
+    ranked = rank_dorks(dorks)
+    seen = set(exclude)
+    found = []
+    calls = 0
+    waves = 0
+
+    for start in range(0, len(ranked), max(1, wave_size)):
+        if len(found) >= budget:
+            break
+        wave = ranked[start:start + wave_size]
+        waves += 1
+        calls += len(wave)
+        wave_results = {}
+        for position, _dork, results in run_wave([dork for _idx, dork in wave]):
+            wave_results[position] = results
+        # Merge in priority order rather than completion order so results are stable
+        for position, (idx, dork) in enumerate(wave, start=1):
+            for item in wave_results.get(position, {}).get("data", []):
+                key = canonical_profile_url(item.get("link", ""))
+                if not key or key in seen:
+                    continue
+                seen.add(key)
+                found.append((idx, dork, item))
+
+    stats = {
+        "dorks": len(dorks),
+        "cse_calls": calls,
+        "calls_saved": len(dorks) - calls,
+        "waves": waves,
+        "unique_results": len(found),
+    }
+    logger.info("Search plan: %(cse_calls)d/%(dorks)d CSE calls, %(calls_saved)d saved", stats)
+    return {"results": found[:budget], "stats": stats}
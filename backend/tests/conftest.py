@@ -0,0 +1,30 @@
+import os
+import sys
+import shutil
+import tempfile
+
+import pytest
+
+# The backend modules are imported top-level, as app.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench.fakes import FakeUpstreams, use_sqlite_dir  # noqa: E402
+
+# SQLite paths are read at import, before any fixture runs; keep them out of the working tree
+SQLITE_DIR = tempfile.mkdtemp(prefix="meetdave-tests-")
+use_sqlite_dir(SQLITE_DIR)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(SQLITE_DIR, ignore_errors=True)
+
+
+@pytest.fixture
+def upstreams():
+    """The app wired to fakes with no latency; tests raise an upstream's latency where they need one."""
+    fakes = FakeUpstreams(llm_latency=0, cse_latency=0, gmail_latency=0, firestore_latency=0, apollo_latency=0)
+    fakes.app = fakes.install()
+    yield fakes
+    # Hand unused quota leases back while this fake Firestore still holds the user
+    fakes.app.search_quota.release_all()
+    fakes.apollo.uninstall()
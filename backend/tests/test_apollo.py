@@ -0,0 +1,47 @@
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+import apollo
+
+
+def refused():
+    return requests.exceptions.ConnectionError(
+        MaxRetryError(None, "/api/v1/people/match", NewConnectionError(None, "Connection refused")))
+
+
+@pytest.fixture
+def apollo_calls(upstreams, monkeypatch):
+    """Apollo answers with each of `responses` in turn: an exception to raise, or a status code."""
+    calls = []
+    responses = []
+
+    def request(session, method, url, *args, **kwargs):
+        calls.append(url)
+        outcome = responses.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return upstreams.apollo._response({"person": {"email": "jane@example.com"}}, status=outcome)
+
+    monkeypatch.setattr(requests.Session, "request", request)
+    return calls, responses
+
+
+def match():
+    return apollo.match_email("Jane", "Doe", "https://www.linkedin.com/in/jane-doe")
+
+
+def test_refused_connection_is_retried(apollo_calls):
+    calls, responses = apollo_calls
+    responses += [refused(), 200]
+    assert match() == "jane@example.com"
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize("outcome", [requests.exceptions.ReadTimeout("read timed out"), 502, 429])
+def test_requests_that_may_have_been_served_are_not_retried(apollo_calls, outcome):
+    calls, responses = apollo_calls
+    responses += [outcome, 200]
+    with pytest.raises((requests.exceptions.ReadTimeout, apollo.ApolloError)):
+        match()
+    assert len(calls) == 1
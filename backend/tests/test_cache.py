@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+import cache
+from cache import MemoryCache, ProcessConnection, SQLiteCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    return clock
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make(request, tmp_path):
+    def make(ttl=60, max_entries=3):
+        if request.param == "memory":
+            return MemoryCache(ttl=ttl, max_entries=max_entries)
+        return SQLiteCache(path=str(tmp_path / "cache.sqlite3"), ttl=ttl, max_entries=max_entries)
+    return make
+
+
+def test_entries_expire_after_ttl(make, clock):
+    store = make(ttl=60)
+    store.set("a", {"v": 1})
+    clock.now += 59
+    assert store.get("a") == {"v": 1}
+    clock.now += 2
+    assert store.get("a") is None
+    assert len(store) == 0
+    assert store.info()["hits"] == 1 and store.info()["misses"] == 1
+
+
+def test_least_recently_used_is_evicted(make, clock):
+    store = make(max_entries=3)
+    for key in "abc":
+        store.set(key, key)
+        clock.now += 1
+    store.get("a")
+    clock.now += 1
+    store.set("d", "d")
+
+    assert [store.get(key) for key in "abcd"] == ["a", None, "c", "d"]
+    assert store.info()["evictions"] == 1
+
+
+def test_process_connection_is_opened_lazily(tmp_path):
+    path = tmp_path / "nested" / "db.sqlite3"
+    connection = ProcessConnection(str(path), lambda conn: conn.execute("CREATE TABLE t (x)"))
+    assert not path.exists()
+    conn = connection.get()
+    assert connection.get() is conn
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="needs fork()")
+def test_process_connection_reopens_after_fork(tmp_path):
+    store = SQLiteCache(path=str(tmp_path / "cache.sqlite3"), ttl=60, max_entries=10)
+    store.set("parent", 1)
+    parent_conn = store._conn
+
+    pid = os.fork()
+    if pid == 0:
+        # Child: exit status reports what it saw; never return into pytest
+        status = 1
+        try:
+            if store._conn is not parent_conn and store.get("parent") == 1:
+                store.set("child", 2)
+                status = 0
+        finally:
+            os._exit(status)
+    _pid, status = os.waitpid(pid, 0)
+
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert store._conn is parent_conn
+    assert store.get("child") == 2
@@ -0,0 +1,138 @@
+import datetime
+import threading
+import time
+
+import pytest
+
+from credentials_cache import CredentialCache
+
+
+def utcnow():
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class Creds:
+    """Just enough of google.oauth2 Credentials: refresh() counts and can be held."""
+
+    def __init__(self, expires_in):
+        self.token = "old"
+        self.refresh_token = "refresh"
+        self.expiry = utcnow() + datetime.timedelta(seconds=expires_in)
+        self.refreshes = 0
+        self.release = threading.Event()
+        self.release.set()
+        self.fail = False
+
+    def refresh(self, request):
+        self.refreshes += 1
+        self.release.wait(5)
+        if self.fail:
+            raise RuntimeError("token endpoint down")
+        self.token = f"new{self.refreshes}"
+        self.expiry = utcnow() + datetime.timedelta(hours=1)
+
+
+class Store:
+    def __init__(self, **users):
+        self.users = users
+        self.loads = 0
+        self.saved = []
+
+    def load(self, user_id):
+        self.loads += 1
+        return self.users.get(user_id)
+
+    def save(self, user_id, creds):
+        self.saved.append((user_id, creds.token))
+
+
+def cache_for(store, **kwargs):
+    return CredentialCache(store.load, store.save, refresh_margin=300, **kwargs)
+
+
+def drain(cache):
+    # Background refreshes submit write-backs, so let them finish before shutting down
+    deadline = time.time() + 5
+    while cache._background and time.time() < deadline:
+        time.sleep(0.01)
+    cache._writer.shutdown(wait=True)
+
+
+def test_concurrent_callers_share_one_refresh():
+    creds = Creds(expires_in=-10)
+    creds.release.clear()
+    store = Store(alice=creds)
+    cache = cache_for(store)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("alice"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + 5
+    while creds.refreshes == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    creds.release.set()
+    for thread in threads:
+        thread.join(5)
+    drain(cache)
+
+    assert creds.refreshes == 1
+    assert store.loads == 1
+    assert [c.token for c in results] == ["new1"] * 8
+    assert store.saved == [("alice", "new1")]
+    # The per-user lock is dropped once nobody holds or waits for it
+    assert cache._user_locks == {}
+
+
+def test_token_close_to_expiry_refreshes_in_the_background():
+    creds = Creds(expires_in=60)
+    creds.release.clear()
+    cache = cache_for(Store(alice=creds))
+    cache._store("alice", creds)
+
+    # Served straight away while the refresh is still in flight
+    assert cache.get("alice").token == "old"
+    creds.release.set()
+    drain(cache)
+    assert creds.refreshes == 1
+    assert cache.get("alice").token == "new1"
+
+
+def test_failed_early_refresh_keeps_the_valid_token():
+    creds = Creds(expires_in=60)
+    creds.fail = True
+    store = Store(alice=creds)
+    cache = cache_for(store)
+
+    assert cache.get("alice").token == "old"
+    drain(cache)
+    assert store.saved == []
+
+
+def test_failed_refresh_of_an_expired_token_raises():
+    creds = Creds(expires_in=-10)
+    creds.fail = True
+    cache = cache_for(Store(alice=creds))
+    with pytest.raises(RuntimeError):
+        cache.get("alice")
+
+
+def test_least_recently_used_user_is_dropped():
+    store = Store(**{user: Creds(expires_in=3600) for user in "abc"})
+    cache = cache_for(store, max_size=2)
+    cache.get("a")
+    cache.get("b")
+    cache.get("a")
+    cache.get("c")
+
+    assert list(cache._entries) == ["a", "c"]
+    cache.get("b")
+    assert store.loads == 4
+
+
+def test_unknown_user_is_not_cached():
+    store = Store()
+    cache = cache_for(store)
+    assert cache.get("nobody") is None
+    assert cache.get("nobody") is None
+    assert store.loads == 2
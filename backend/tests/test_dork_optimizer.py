@@ -0,0 +1,54 @@
+import pytest
+
+from bench import fixtures
+from dork_optimizer import optimize_dorks, parse_dork, unique_dorks
+from people_search import parse_dorks
+
+
+@pytest.mark.parametrize("natural_query, output", fixtures.LLM_OUTPUTS)
+def test_unmerged_dorks_pass_through_byte_for_byte(natural_query, output):
+    dorks = parse_dorks(output)
+    optimized, stats = optimize_dorks(dorks)
+    # Anything not in the input verbatim must be the product of a merge
+    assert len([dork for dork in optimized if dork not in dorks]) <= stats["merges"]
+    if stats["merges"] == 0:
+        assert optimized == list(dict.fromkeys(dorks))
+
+
+def test_or_dork_is_not_rewritten():
+    dork = 'site:linkedin.com/in "New York" OR site:twitter.com "Product Manager"'
+    optimized, _stats = optimize_dorks([dork, 'site:github.com "Rust" "Berlin"'])
+    assert optimized[0] == dork
+
+
+def test_equivalent_dorks_keep_the_first_spelling():
+    first = 'site:linkedin.com/in "Software Engineer" Google'
+    optimized, stats = optimize_dorks([first, 'google  "software engineer" site:www.linkedin.com/in/'])
+    assert optimized == [first]
+    assert stats["duplicates_removed"] == 1
+
+
+def test_only_merged_dorks_are_rendered():
+    untouched = 'site:github.com "Rust" "Berlin"'
+    optimized, stats = optimize_dorks([
+        'site:linkedin.com/in "data scientist" "MIT"',
+        untouched,
+        'site:twitter.com "data scientist" "MIT"',
+    ])
+    assert stats["merges"] == 1
+    assert optimized[1] == untouched
+    assert parse_dork(optimized[0]) == parse_dork('(site:linkedin.com/in OR site:twitter.com) "data scientist" "mit"')
+
+
+def test_unique_dorks_drops_equivalents_as_they_arrive():
+    dorks = iter([
+        'site:linkedin.com/in "Rust" "Berlin"',
+        'site:www.linkedin.com/in/ "berlin"  "rust"',
+        'site:github.com "Rust"',
+        '(unbalanced "Rust"',
+        '(unbalanced   "rust"',
+    ])
+    unique = unique_dorks(dorks)
+    # Lazy: the first dork comes out before the rest are read
+    assert next(unique) == 'site:linkedin.com/in "Rust" "Berlin"'
+    assert list(unique) == ['site:github.com "Rust"', '(unbalanced "Rust"']
@@ -0,0 +1,84 @@
+import types
+import contextlib
+
+import pytest
+
+import people_search
+from bench import fixtures
+from people_search import IncrementalDorkParser, parse_dorks
+
+
+def feed(chunks):
+    parser = IncrementalDorkParser()
+    dorks = [dork for chunk in chunks for dork in parser.feed(chunk)]
+    return parser, dorks
+
+
+@pytest.mark.parametrize("natural_query, output", fixtures.LLM_OUTPUTS)
+@pytest.mark.parametrize("size", [1, 3, 8, 1000])
+def test_any_chunking_yields_the_full_parse(natural_query, output, size):
+    parser, dorks = feed(output[i:i + size] for i in range(0, len(output), size))
+    assert parser.finished and not parser.failed
+    assert dorks == parse_dorks(output)
+
+
+def test_escaped_quotes_and_backslashes():
+    text = '```json\n["site:linkedin.com/in \\"Jane \\\\\\"JD\\\\\\" Doe\\"", "a\\\\b"]\n```'
+    parser, dorks = feed(text[i:i + 2] for i in range(0, len(text), 2))
+    assert dorks == parse_dorks(text) == ['site:linkedin.com/in "Jane \\"JD\\" Doe"', "a\\b"]
+    assert parser.finished
+
+
+def test_each_dork_is_emitted_as_soon_as_its_string_closes():
+    parser = IncrementalDorkParser()
+    assert parser.feed('Here you go: ["first", "sec') == ["first"]
+    assert parser.feed('ond"') == ["second"]
+    assert not parser.finished
+    assert parser.feed("]") == []
+    assert parser.finished
+
+
+@pytest.mark.parametrize("text", ['[["nested"]]', '["a", 3]', '["a"; "b"]', "no array here"])
+def test_other_shapes_fail_or_never_finish(text):
+    parser, _dorks = feed([text])
+    assert parser.failed or not parser.finished
+
+
+class ScriptedClaude:
+    def __init__(self, text):
+        self.messages = types.SimpleNamespace(stream=self._stream)
+        self._text = text
+
+    @contextlib.contextmanager
+    def _stream(self, **kwargs):
+        yield types.SimpleNamespace(text_stream=iter(self._text), get_final_message=lambda: None)
+
+
+@pytest.fixture
+def claude(monkeypatch):
+    """Makes stream_translate_query stream the given text from Claude."""
+    monkeypatch.setattr(people_search, "_local_dorks", lambda query: None)
+    monkeypatch.setattr(people_search, "dork_cache", None)
+    return lambda text: monkeypatch.setattr(people_search, "get_anthropic_client", lambda: ScriptedClaude(text))
+
+
+def test_streamed_dorks_match_the_full_parse(claude):
+    text = fixtures.LLM_OUTPUTS[0][1]
+    claude(text)
+    assert list(people_search.stream_translate_query("anything")) == parse_dorks(text)
+
+
+def test_unparseable_stream_falls_back_to_the_full_response(claude, monkeypatch):
+    text = '[{"dork": "site:linkedin.com/in rust"}]'
+    claude(text)
+    calls = []
+    monkeypatch.setattr(people_search, "parse_dorks", lambda response: calls.append(response) or ["fallback"])
+    assert list(people_search.stream_translate_query("anything")) == ["fallback"]
+    assert calls == [text]
+
+
+def test_fallback_yields_only_dorks_not_streamed_yet(claude, monkeypatch):
+    # Streams "a" fine, then breaks; the full parse repeats "a" and adds "b"
+    claude('["a", oops]')
+    monkeypatch.setattr(people_search, "parse_dorks", lambda response: ["a", "b"])
+    assert list(people_search.stream_translate_query("anything")) == ["a", "b"]
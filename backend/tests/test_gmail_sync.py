@@ -0,0 +1,158 @@
+import types
+from collections import Counter
+
+import pytest
+
+import gmail_sync
+from bench import fixtures
+from bench.fakes import FakeGmail, FakeRequest, Upstream
+
+USER = "alice"
+CONTACT = "bob@example.com"
+
+
+class HistoryGone(Exception):
+    resp = types.SimpleNamespace(status=404)
+
+
+class Mailbox(FakeGmail):
+    """A Gmail mailbox that changes, with users.history recording each change."""
+
+    def __init__(self):
+        super().__init__(Upstream("gmail", 0), Counter())
+        self.mail = {}  # id -> (internal_date, contact)
+        self.history_id = 100
+        self.records = []   # (history_id, history record)
+        self.expired_before = 0
+        self.calls = Counter()
+
+    def _record(self, record):
+        self.history_id += 1
+        self.records.append((self.history_id, record))
+
+    def add(self, message_id, date, contact=CONTACT):
+        self.mail[message_id] = (date, contact)
+        self._record({"messagesAdded": [{"message": {"id": message_id, "labelIds": ["INBOX"]}}]})
+
+    def delete(self, message_id):
+        del self.mail[message_id]
+        self._record({"messagesDeleted": [{"message": {"id": message_id}}]})
+
+    def getProfile(self, userId):
+        return FakeRequest(lambda: {"historyId": str(self.history_id)})
+
+    def history(self):
+        return self
+
+    def list(self, userId, q=None, maxResults=100, pageToken=None, startHistoryId=None, **kwargs):
+        if startHistoryId is not None:
+            return FakeRequest(lambda: self._history(int(startHistoryId)))
+        self.calls["list"] += 1
+        contact = q.split("from:")[-1].strip()
+        ids = sorted((m for m, (_date, c) in self.mail.items() if c == contact),
+                     key=lambda m: self.mail[m][0], reverse=True)
+        start = int(pageToken or 0)
+        page = {"messages": [{"id": m} for m in ids[start:start + maxResults]]}
+        if start + maxResults < len(ids):
+            page["nextPageToken"] = str(start + maxResults)
+        return FakeRequest(lambda: page)
+
+    def _history(self, start):
+        self.calls["history"] += 1
+        if start < self.expired_before:
+            raise HistoryGone()
+        return {"history": [record for history_id, record in self.records if history_id > start],
+                "historyId": str(self.history_id)}
+
+    def get(self, userId, id, format="full", **kwargs):
+        self.calls[f"get.{format}"] += 1
+        date, contact = self.mail[id]
+        message = fixtures.gmail_message(id, contact)
+        message["internalDate"] = str(date)
+        if format == "metadata":
+            message["payload"] = {"headers": message["payload"]["headers"]}
+        return FakeRequest(lambda: message)
+
+
+@pytest.fixture
+def mailbox():
+    mailbox = Mailbox()
+    for i in range(5):
+        mailbox.add(f"m{i}", date=1000 + i)
+    mailbox.add("other", date=2000, contact="carol@example.com")
+    return mailbox
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = gmail_sync.ConversationStore(path=str(tmp_path / "gmail_sync.sqlite3"))
+    monkeypatch.setattr(gmail_sync, "conversation_store", store)
+    return store
+
+
+def read(mailbox, max_results=3, page_token=None, **kwargs):
+    page = gmail_sync.read_conversation(mailbox, USER, CONTACT, max_results, page_token, **kwargs)
+    return [email["subject"].split()[-1] for email in page["emails"]], page["nextPageToken"]
+
+
+def test_history_delta_adds_and_removes_messages(mailbox, store):
+    assert read(mailbox) == (["m4", "m3", "m2"], "local:3")
+    mailbox.add("m5", date=1005)
+    mailbox.add("noise", date=1006, contact="carol@example.com")
+    mailbox.delete("m3")
+    mailbox.calls.clear()
+
+    assert read(mailbox) == (["m5", "m4", "m2"], "local:3")
+    # One history call, headers for the new messages, no new listing
+    assert mailbox.calls["history"] == 1
+    assert mailbox.calls["list"] == 0
+    assert mailbox.calls["get.metadata"] == 2
+
+
+def test_expired_history_resyncs_from_scratch(mailbox, store):
+    read(mailbox)
+    mailbox.add("m5", date=1005)
+    mailbox.expired_before = mailbox.history_id + 1
+    mailbox.calls.clear()
+
+    assert read(mailbox) == (["m5", "m4", "m3"], "local:3")
+    assert mailbox.calls["history"] == 1
+    assert mailbox.calls["list"] == 1
+    assert store.cursor(USER) == str(mailbox.history_id)
+
+
+def test_later_pages_extend_the_stored_listing(mailbox, store):
+    assert read(mailbox, page_token="local:3") == (["m1", "m0"], None)
+
+
+def test_bodies_are_fetched_per_page_and_not_stored(mailbox, store, monkeypatch):
+    monkeypatch.setattr(gmail_sync, "GMAIL_SYNC_BODY_CHARS", 0)
+    page = gmail_sync.read_conversation(mailbox, USER, CONTACT, 2, body_chars=50)
+    assert all(len(email["body"]) == 50 for email in page["emails"])
+    assert all(summary["body"] == "" and not has_body
+               for _id, has_body, summary in store.messages(USER, CONTACT, 0, 10))
+
+
+def test_stored_bodies_are_reused(mailbox, store, monkeypatch):
+    monkeypatch.setattr(gmail_sync, "GMAIL_SYNC_BODY_CHARS", 100)
+    first = gmail_sync.read_conversation(mailbox, USER, CONTACT, 2, body_chars=50)
+    mailbox.calls.clear()
+    assert gmail_sync.read_conversation(mailbox, USER, CONTACT, 2, body_chars=50) == first
+    assert mailbox.calls["get.full"] == 0
+    # More than the store keeps is fetched live
+    longer = gmail_sync.read_conversation(mailbox, USER, CONTACT, 2, body_chars=200)
+    assert mailbox.calls["get.full"] == 2
+    assert all(len(email["body"]) == 200 for email in longer["emails"])
+
+
+@pytest.mark.parametrize("token", ["local:abc", "local:-5", "local:"])
+def test_malformed_local_page_token_is_rejected(mailbox, store, token):
+    with pytest.raises(gmail_sync.InvalidPageToken):
+        gmail_sync.read_conversation(mailbox, USER, CONTACT, 3, token)
+
+
+def test_read_with_answers_400_for_a_malformed_page_token(upstreams):
+    upstreams.seed_user(USER)
+    client = upstreams.app.app.test_client()
+    response = client.post("/read_with", json={"username": USER, "email": CONTACT, "pageToken": "local:abc"})
+    assert response.status_code == 400
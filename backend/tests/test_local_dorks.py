@@ -0,0 +1,27 @@
+import pytest
+
+from local_dorks import LOCAL_DORKS_MIN_CONFIDENCE, local_translation, parse_query
+
+
+@pytest.mark.parametrize("query, role", [
+    ("Find a lawyer in Chicago", "lawyer"),
+    ("Find an engineer at Google in the Bay Area", "engineer"),
+    ("Find all the founders in New York", "founder"),
+])
+def test_determiners_are_stripped(query, role):
+    entities, _confidence = parse_query(query)
+    assert entities["role"] == role
+    assert not entities["location"].lower().startswith("the ")
+
+
+@pytest.mark.parametrize("query", ["engineers in fintech", "Engineers in Fintech", "designers in boise"])
+def test_locations_that_are_not_places_go_to_the_llm(query):
+    _entities, confidence = parse_query(query)
+    assert confidence < LOCAL_DORKS_MIN_CONFIDENCE
+    assert local_translation(query) is None
+
+
+@pytest.mark.parametrize("query", ["software engineers at Microsoft in Seattle", "data scientists in Boise",
+                                   "product managers in San Francisco, CA"])
+def test_places_stay_local(query):
+    assert local_translation(query)
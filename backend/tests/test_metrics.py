@@ -0,0 +1,47 @@
+import metrics
+from metrics import Registry
+
+
+def cache_collector(name):
+    def collect():
+        yield ("cache_hits_total", "counter", "Cache hits", {"cache": name}, 1)
+        yield ("cache_size", "gauge", "Entries", {"cache": name}, 2)
+    return collect
+
+
+def test_families_from_several_collectors_are_contiguous():
+    registry = Registry()
+    registry.register_collector(cache_collector("search"))
+    registry.register_collector(cache_collector("apollo"))
+    lines = registry.render().splitlines()
+
+    assert lines == [
+        "# HELP cache_hits_total Cache hits",
+        "# TYPE cache_hits_total counter",
+        'cache_hits_total{cache="search"} 1',
+        'cache_hits_total{cache="apollo"} 1',
+        "# HELP cache_size Entries",
+        "# TYPE cache_size gauge",
+        'cache_size{cache="search"} 2',
+        'cache_size{cache="apollo"} 2',
+    ]
+
+
+def stream_seconds():
+    series = metrics.registry._histograms.get("meetdave_request_seconds", {})
+    return sum(total for labels, (_buckets, total, _count) in series.items()
+               if ("endpoint", "search_stream") in labels)
+
+
+def test_streamed_request_is_timed_until_the_body_is_sent(upstreams):
+    upstreams.seed_user("alice")
+    upstreams.cse._upstream.latency = 0.2
+    client = upstreams.app.app.test_client()
+    with client.session_transaction() as session:
+        session["user_id"] = "alice"
+
+    before = stream_seconds()
+    with client.post("/search/stream", json={"query": "software engineers in Berlin"}) as response:
+        assert response.status_code == 200
+        assert b'"type": "done"' in response.get_data()
+    assert stream_seconds() - before >= 0.2
@@ -0,0 +1,179 @@
+import time
+import types
+
+import pytest
+
+import outbox as outbox_module
+from outbox import Outbox, PermanentSendError
+
+USER = "alice"
+
+
+def never_send(*_args):
+    raise AssertionError("nothing should be sent")
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "outbox.sqlite3")
+
+
+def row(outbox, message_id):
+    return outbox._conn.execute(
+        "SELECT status, next_attempt_at FROM outbox WHERE id = ?", (message_id,)
+    ).fetchone()
+
+
+def queue(outbox, count, user_id=USER):
+    # enqueue_many starts the dispatcher; these tests drive claims by hand
+    outbox.start = lambda: None
+    return [message_id for message_id, _created in outbox.enqueue_many(
+        user_id, [(f"to{i}@example.com", "Hi", "Hello", None) for i in range(count)])]
+
+
+def test_user_rate_is_shared_across_processes(path):
+    first, second = Outbox(never_send, path=path, per_minute=6), Outbox(never_send, path=path, per_minute=6)
+    a, b = queue(first, 2)
+
+    assert first._claim(a, USER) == (True, 0.0)
+    claimed, delay = second._claim(b, USER)
+    assert not claimed
+    assert 9 < delay <= 10
+    assert row(second, b)[0] == "queued"
+
+
+def test_deferral_leaves_a_claimed_message_alone(path):
+    first, second = Outbox(never_send, path=path, per_minute=6), Outbox(never_send, path=path, per_minute=6)
+    a, b = queue(first, 2)
+    assert first._claim(a, USER)[0]
+
+    # Another worker claimed b after this one selected it
+    first._update(b, "sending")
+    before = row(second, b)
+    assert second._claim(b, USER)[0] is False
+    assert row(second, b) == before
+
+
+def test_losing_a_claim_keeps_the_slot(path):
+    outbox = Outbox(never_send, path=path, per_minute=6)
+    a, b = queue(outbox, 2)
+    outbox._update(a, "sending")
+
+    assert outbox._claim(a, USER) == (False, 0.0)
+    assert outbox._claim(b, USER) == (True, 0.0)
+
+
+def test_pause_pushes_the_slot_back_and_due_slots_are_dropped(path):
+    outbox = Outbox(never_send, path=path, per_minute=600)
+    a, b = queue(outbox, 2)
+    assert outbox._claim(a, USER)[0]
+    outbox._pause(USER, 60)
+    claimed, delay = outbox._claim(b, USER)
+    assert not claimed and delay > 59
+
+    outbox._conn.execute("UPDATE outbox_slots SET next_send_at = 0")
+    outbox._requeue_stuck()
+    assert outbox._conn.execute("SELECT COUNT(*) FROM outbox_slots").fetchone()[0] == 0
+    assert outbox._claim(b, USER) == (True, 0.0)
+
+
+class Sender:
+    """send() that plays back a script of errors and gmail ids, one entry per call."""
+
+    def __init__(self, *script):
+        self.script = list(script)
+        self.calls = []
+
+    def __call__(self, user_id, to, subject, body):
+        self.calls.append(to)
+        result = self.script.pop(0) if self.script else "gmail-id"
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def http_error(status):
+    error = Exception(f"HTTP {status}")
+    error.resp = types.SimpleNamespace(status=status)
+    return error
+
+
+def deliver(outbox, message_id):
+    """Claim and send one message the way the dispatcher does."""
+    row = outbox._conn.execute(
+        "SELECT id, user_id, to_addr, subject, body, attempts FROM outbox WHERE id = ?", (message_id,)
+    ).fetchone()
+    assert outbox._claim(row[0], row[1])[0]
+    outbox._inflight += 1
+    outbox._deliver(*row)
+    return outbox.status(message_id)
+
+
+def test_idempotency_key_is_per_user(path):
+    outbox = Outbox(never_send, path=path)
+    outbox.start = lambda: None
+    (first, created), = outbox.enqueue_many(USER, [("a@example.com", "Hi", "Hello", "key-1")])
+    assert created
+    assert outbox.enqueue(USER, "a@example.com", "Hi", "Hello", idempotency_key="key-1") == (first, False)
+    other, created = outbox.enqueue("bob", "a@example.com", "Hi", "Hello", idempotency_key="key-1")
+    assert created and other != first
+    # Without a key nothing is deduped
+    assert outbox.enqueue(USER, "a@example.com", "Hi", "Hello")[1]
+    assert outbox.counts() == {"queued": 3}
+
+
+def test_sent_message_records_the_gmail_id(path):
+    outbox = Outbox(Sender("gmail-1"), path=path, per_minute=0)
+    message_id, = queue(outbox, 1)
+    status = deliver(outbox, message_id)
+    assert (status["status"], status["attempts"], status["gmail_id"], status["error"]) == ("sent", 1, "gmail-1", None)
+
+
+@pytest.mark.parametrize("error, paused", [
+    (http_error(503), False), (http_error(429), True), (ConnectionResetError("reset"), False),
+])
+def test_transient_failure_is_queued_for_a_retry(path, error, paused):
+    outbox = Outbox(Sender(error), path=path, per_minute=0)
+    message_id, = queue(outbox, 1)
+    before = time.time()
+    status = deliver(outbox, message_id)
+
+    assert (status["status"], status["attempts"], status["error"]) == ("queued", 1, str(error))
+    assert row(outbox, message_id)[1] > before
+    # Only a 429 holds back the user's other messages too
+    assert outbox._conn.execute("SELECT COUNT(*) FROM outbox_slots").fetchone()[0] == paused
+
+
+@pytest.mark.parametrize("error", [PermanentSendError("bad address"), http_error(400)])
+def test_permanent_failure_is_not_retried(path, error):
+    outbox = Outbox(Sender(error), path=path, per_minute=0)
+    message_id, = queue(outbox, 1)
+    status = deliver(outbox, message_id)
+    assert (status["status"], status["attempts"], status["error"]) == ("failed", 1, str(error))
+
+
+def test_gives_up_after_max_attempts(path):
+    outbox = Outbox(Sender(*[http_error(503)] * 3), path=path, per_minute=0, max_attempts=2)
+    message_id, = queue(outbox, 1)
+    assert deliver(outbox, message_id)["status"] == "queued"
+    outbox._update(message_id, "queued", next_attempt_at=0)
+    status = deliver(outbox, message_id)
+    assert (status["status"], status["attempts"]) == ("failed", 2)
+
+
+def test_dispatcher_retries_until_sent(path, monkeypatch):
+    monkeypatch.setattr(outbox_module, "OUTBOX_BACKOFF_BASE", 0.01)
+    send = Sender(http_error(503))
+    outbox = Outbox(send, path=path, per_minute=0)
+    message_id, _created = outbox.enqueue(USER, "a@example.com", "Hi", "Hello")
+    try:
+        deadline = time.time() + 5
+        while outbox.status(message_id)["status"] != "sent" and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        outbox.stop()
+
+    status = outbox.status(message_id)
+    assert (status["status"], status["attempts"]) == ("sent", 2)
+    assert send.calls == ["a@example.com"] * 2
+    assert outbox._inflight == 0
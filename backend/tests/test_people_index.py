@@ -0,0 +1,43 @@
+import pytest
+
+from people_index import PeopleIndex
+from search_planner import is_profile_url
+
+
+@pytest.mark.parametrize("link", [
+    "https://www.linkedin.com/in/jane-doe/",
+    "https://uk.linkedin.com/in/jane",
+    "https://x.com/janedoe",
+    "https://twitter.com/jane_doe",
+    "https://www.instagram.com/jane.doe/",
+])
+def test_profile_pages(link):
+    assert is_profile_url(link)
+
+
+@pytest.mark.parametrize("link", [
+    "https://www.linkedin.com/posts/jane-doe_hiring-activity-1",
+    "https://www.linkedin.com/pulse/how-we-scaled-jane-doe",
+    "https://www.linkedin.com/in/jane-doe/details/experience",
+    "https://x.com/janedoe/status/123",
+    "https://twitter.com/search",
+    "https://www.instagram.com/p/Cabc123/",
+    "https://github.com/janedoe",
+    "https://x.com/",
+])
+def test_other_pages(link):
+    assert not is_profile_url(link)
+
+
+def test_only_profile_pages_are_indexed(tmp_path):
+    index = PeopleIndex(path=str(tmp_path / "people_index.sqlite3"))
+    written = index.add([
+        {"title": "Jane Doe - Staff Engineer - Acme | LinkedIn", "link": "https://www.linkedin.com/in/jane-doe",
+         "snippet": "Location: Berlin"},
+        {"title": "Jane Doe on LinkedIn: Acme is hiring engineers in Berlin",
+         "link": "https://www.linkedin.com/posts/jane-doe_acme-activity-1", "snippet": "Acme engineers Berlin"},
+    ])
+
+    assert written == 1
+    assert [item["link"] for item in index.search("engineers at Acme in Berlin")] == [
+        "https://www.linkedin.com/in/jane-doe"]
@@ -0,0 +1,118 @@
+import time
+import types
+import asyncio
+import threading
+import contextlib
+
+import pytest
+
+import people_search
+
+
+class RecordingCache:
+    """Answers every get with `value` and records which thread asked."""
+
+    def __init__(self, value):
+        self.value = value
+        self.threads = []
+
+    def get(self, key):
+        self.threads.append(threading.current_thread())
+        return self.value
+
+    def set(self, key, value):
+        self.threads.append(threading.current_thread())
+
+
+def test_async_path_reads_caches_off_the_event_loop(monkeypatch):
+    search_cache = RecordingCache({"data": [], "total_results": 0})
+    dork_cache = RecordingCache(["site:linkedin.com/in \"rust\" \"zurich\""])
+    monkeypatch.setattr(people_search, "search_cache", search_cache)
+    monkeypatch.setattr(people_search, "dork_cache", dork_cache)
+    monkeypatch.setattr(people_search, "_local_dorks", lambda query: None)
+
+    async def run():
+        loop_thread = threading.current_thread()
+        dorks = await people_search.translate_query_async("rust engineers in zurich")
+        results = await people_search.search_with_google_api_async(dorks[0])
+        return loop_thread, dorks, results
+
+    loop_thread, dorks, results = asyncio.run(run())
+    assert dorks == dork_cache.value
+    assert results == search_cache.value
+    assert search_cache.threads and dork_cache.threads
+    assert loop_thread not in search_cache.threads + dork_cache.threads
+
+
+class EndlessClaude:
+    """Streams a dork array that never ends, a character per chunk, until the stream is closed."""
+
+    def __init__(self):
+        self.chunks = 0
+        self.closed = threading.Event()
+        self.messages = types.SimpleNamespace(stream=self._stream)
+
+    @contextlib.contextmanager
+    def _stream(self, **kwargs):
+        def text_stream():
+            yield "["
+            while True:
+                for char in f'"site:linkedin.com/in engineer {"x" * 100}", ':
+                    self.chunks += 1
+                    time.sleep(0.001)
+                    yield char
+        try:
+            yield types.SimpleNamespace(text_stream=text_stream(), get_final_message=lambda: None)
+        finally:
+            self.closed.set()
+
+
+def test_closing_the_stream_closes_the_claude_stream(upstreams, monkeypatch):
+    claude = EndlessClaude()
+    monkeypatch.setattr(people_search, "get_anthropic_client", lambda: claude)
+    monkeypatch.setattr(people_search, "_local_dorks", lambda query: None)
+
+    results = people_search.stream_google_dorks("engineers")
+    next(results)
+    results.close()
+    chunks = claude.chunks
+
+    # Stopped within a chunk, not at the end of the next dork
+    assert claude.closed.wait(2)
+    assert claude.chunks - chunks <= 2
+
+
+def test_dorks_submitted_before_a_source_failure_still_report(upstreams):
+    def dorks():
+        yield 'site:linkedin.com/in "rust"'
+        yield 'site:linkedin.com/in "go"'
+        raise ValueError("unparseable response")
+
+    received = []
+    with pytest.raises(ValueError, match="unparseable"):
+        for idx, dork, _results in people_search.iter_dork_searches(dorks()):
+            received.append((idx, dork))
+    assert sorted(received) == [(1, 'site:linkedin.com/in "rust"'), (2, 'site:linkedin.com/in "go"')]
+
+
+def test_stream_serves_the_index_first_and_skips_dorks_when_it_is_enough(upstreams, tmp_path, monkeypatch):
+    from people_index import PeopleIndex
+    index = PeopleIndex(path=str(tmp_path / "people_index.sqlite3"))
+    index.add([{"title": f"Jane Doe {i} - Rust Engineer - Acme | LinkedIn",
+                "link": f"https://www.linkedin.com/in/jane-doe-{i}", "snippet": "Location: Zurich"}
+               for i in range(3)])
+    monkeypatch.setattr(people_search, "people_index", index)
+
+    results = list(people_search.stream_search_people("rust engineers in zurich", budget=3))
+    assert [(idx, dork) for idx, dork, _results in results] == [(1, None), (2, None), (3, None)]
+    assert upstreams.counters["anthropic"] == upstreams.counters["cse"] == 0
+
+
+def test_stream_searches_each_distinct_dork_once(upstreams, monkeypatch):
+    dorks = ['site:linkedin.com/in "Rust" "Zurich"', 'site:linkedin.com/in "rust"  "zurich"',
+             'site:github.com "Rust" "Zurich"']
+    monkeypatch.setattr(people_search, "stream_translate_query", lambda query, stop: iter(dorks))
+
+    searched = sorted(dork for _idx, dork, _results in people_search.stream_search_people("rust in zurich"))
+    assert searched == sorted([dorks[0], dorks[2]])
+    assert upstreams.counters["cse"] == 2
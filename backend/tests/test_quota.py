@@ -0,0 +1,85 @@
+import random
+from collections import Counter
+
+import pytest
+
+from bench.fakes import FakeFirestore, Upstream
+from quota import SearchQuota
+
+USER = "alice"
+
+
+@pytest.fixture
+def db():
+    return FakeFirestore(Upstream("firestore", 0), Counter())
+
+
+def workers(db, count, **kwargs):
+    """`count` independent SearchQuota instances sharing one Firestore, like gunicorn workers."""
+    instances = []
+    for _ in range(count):
+        quota = SearchQuota(lambda: db, workers=count, **kwargs)
+        quota._transact = lambda _db, ref, decide: db.run_transaction(ref, decide)
+        instances.append(quota)
+    return instances
+
+
+def searches(db):
+    return db.docs.get(f"users/{USER}", {}).get("searches", 0)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_small_limit_has_no_false_denials(db, seed):
+    rng = random.Random(seed)
+    quotas = workers(db, 4, limit=5, lease_size=2)
+    allowed = [rng.choice(quotas).reserve(USER) for _ in range(5)]
+    assert allowed == [True] * 5
+    assert searches(db) == 5
+    assert not any(quota.reserve(USER) for quota in quotas)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_lifetime_accounting_across_workers(db, seed):
+    rng = random.Random(seed)
+    limit = 40
+    quotas = workers(db, 4, limit=limit, lease_size=3)
+    used = 0
+    for _ in range(200):
+        quota = rng.choice(quotas)
+        if quota.reserve(USER):
+            used += 1
+            if rng.random() < 0.2:
+                quota.refund(USER)
+                used -= 1
+        assert used <= limit
+        assert searches(db) <= limit
+
+    for quota in quotas:
+        quota.release_all()
+    # Firestore counts exactly the searches that were used, so the rest can still be claimed
+    assert searches(db) == used
+    extra = sum(quota.reserve(USER) for quota in quotas for _ in range(limit))
+    assert used + extra == limit
+    for quota in quotas:
+        quota.release_all()
+    assert searches(db) == limit
+
+
+def test_denial_not_remembered_while_another_worker_holds_a_lease(db):
+    first, second = workers(db, 2, limit=20, lease_size=4)
+    assert first.reserve(USER)  # parks 3 searches in `first`
+    while second.reserve(USER):
+        pass
+    assert searches(db) == 20
+
+    first.release_all()
+    assert second.reserve(USER)
+
+
+def test_denial_is_remembered_once_no_lease_is_outstanding(db):
+    quota, = workers(db, 1, limit=2, lease_size=1)
+    assert quota.reserve(USER) and quota.reserve(USER)
+    assert not quota.reserve(USER)
+    transactions = db.counters["firestore"]
+    assert not quota.reserve(USER)
+    assert db.counters["firestore"] == transactions
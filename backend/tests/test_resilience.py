@@ -0,0 +1,124 @@
+import time
+import uuid
+
+import pytest
+
+import resilience
+from resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Unavailable(Exception):
+    status_code = 503
+
+
+class NotFound(Exception):
+    status_code = 404
+
+
+@pytest.fixture
+def name():
+    name = f"test-{uuid.uuid4().hex[:8]}"
+    yield name
+    with resilience._upstreams_lock:
+        resilience._upstreams.pop(name, None)
+
+
+def fail(breaker, count, error=Unavailable):
+    for _ in range(count):
+        breaker.before_call()
+        breaker.record(error())
+
+
+def test_opens_after_consecutive_transient_failures():
+    breaker = CircuitBreaker("svc", failures=3, cooldown=60)
+    fail(breaker, 2)
+    # Client errors mean the upstream is answering, so they reset the count
+    fail(breaker, 1, NotFound)
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.before_call()
+    assert 59 < raised.value.retry_after <= 60
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = CircuitBreaker("svc", failures=1, cooldown=0.05)
+    fail(breaker, 1)
+    time.sleep(0.06)
+
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record()
+    assert breaker.info() == {"state": CLOSED, "consecutive_failures": 0}
+    breaker.before_call()
+
+
+def test_failed_trial_reopens_for_a_full_cooldown():
+    breaker = CircuitBreaker("svc", failures=5, cooldown=0.05)
+    fail(breaker, 5)
+    time.sleep(0.06)
+
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_abandoned_trial_frees_the_slot():
+    breaker = CircuitBreaker("svc", failures=1, cooldown=0)
+    fail(breaker, 1)
+    breaker.before_call()
+    breaker.release()
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+
+def test_open_breaker_skips_the_call(name, monkeypatch):
+    monkeypatch.setattr(resilience, "UPSTREAM_RETRIES", 0)
+    resilience.upstream(name).breaker.failures = 1
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        raise Unavailable()
+
+    with pytest.raises(Unavailable):
+        resilience.call(name, flaky, idempotent=True)
+    with pytest.raises(CircuitOpenError):
+        resilience.call(name, flaky, idempotent=True)
+    assert calls == [1]
+
+
+def test_hedges_are_capped_at_the_max_ratio(name, monkeypatch):
+    monkeypatch.setattr(resilience, "HEDGE_MIN_DELAY", 0.001)
+    monkeypatch.setattr(resilience, "HEDGE_MAX_RATIO", 0.1)
+
+    # Every call is slower than the hedge delay; fewer than 20 so the percentile never kicks in
+    for _ in range(19):
+        assert resilience.call(name, lambda: time.sleep(0.01) or "ok", hedge=True) == "ok"
+
+    state = resilience.upstream(name)
+    assert state.hedged_calls == 19
+    # The first slow call may hedge, then one more per ten calls
+    assert state.hedges == 2
+    assert state.hedges <= 1 + resilience.HEDGE_MAX_RATIO * state.hedged_calls
+
+
+def test_hedge_answers_when_the_primary_hangs(name, monkeypatch):
+    monkeypatch.setattr(resilience, "HEDGE_MIN_DELAY", 0.01)
+    attempts = []
+
+    def first_attempt_hangs():
+        attempts.append(1)
+        if len(attempts) == 1:
+            time.sleep(0.5)
+            return "primary"
+        return "hedge"
+
+    assert resilience.call(name, first_attempt_hangs, hedge=True) == "hedge"
+    assert resilience.upstream(name).hedge_wins == 1
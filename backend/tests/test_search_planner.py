@@ -0,0 +1,66 @@
+from search_planner import canonical_profile_url, plan_search, rank_dorks
+
+SPECIFIC = 'site:linkedin.com/in "rust" "berlin"'
+BROAD = "rust berlin"
+POSTS = "site:twitter.com inurl:/status rust"
+
+
+def profile(name, site="linkedin.com/in"):
+    return {"link": f"https://www.{site}/{name}", "title": name}
+
+
+class Waves:
+    """A run_wave that serves canned results per dork and records every wave."""
+
+    def __init__(self, results):
+        self.results = results
+        self.waves = []
+
+    def __call__(self, dorks):
+        self.waves.append(list(dorks))
+        # Complete in reverse to check the merge doesn't depend on completion order
+        for position, dork in reversed(list(enumerate(dorks, start=1))):
+            yield position, dork, {"data": self.results.get(dork, [])}
+
+
+def test_specific_profile_dorks_rank_first():
+    assert [dork for _idx, dork in rank_dorks([POSTS, BROAD, SPECIFIC])] == [SPECIFIC, BROAD, POSTS]
+    # Ties keep the original order and positions are 1-based
+    assert rank_dorks(["a", "b"]) == [(1, "a"), (2, "b")]
+
+
+def test_stops_once_the_budget_is_met():
+    run_wave = Waves({SPECIFIC: [profile("a"), profile("b")], BROAD: [profile("c")],
+                      POSTS: [profile("d")]})
+    plan = plan_search([POSTS, BROAD, SPECIFIC], run_wave, budget=3, wave_size=2)
+
+    assert run_wave.waves == [[SPECIFIC, BROAD]]
+    assert [item["title"] for _idx, _dork, item in plan["results"]] == ["a", "b", "c"]
+    assert plan["stats"] == {"dorks": 3, "cse_calls": 2, "calls_saved": 1, "waves": 1, "unique_results": 3}
+
+
+def test_runs_every_wave_when_short_of_the_budget():
+    run_wave = Waves({SPECIFIC: [profile("a")]})
+    plan = plan_search([POSTS, BROAD, SPECIFIC], run_wave, budget=5, wave_size=2)
+    assert run_wave.waves == [[SPECIFIC, BROAD], [POSTS]]
+    assert plan["stats"]["calls_saved"] == 0
+
+
+def test_same_profile_from_two_dorks_is_kept_once():
+    run_wave = Waves({
+        SPECIFIC: [profile("jane-doe")],
+        BROAD: [{"link": "https://uk.linkedin.com/in/Jane-Doe/", "title": "dupe"}, profile("john")],
+    })
+    plan = plan_search([BROAD, SPECIFIC], run_wave, budget=2, wave_size=2)
+
+    # The first copy wins, credited to the higher priority dork
+    assert [(idx, item["title"]) for idx, _dork, item in plan["results"]] == [(2, "jane-doe"), (1, "john")]
+
+
+def test_excluded_profiles_do_not_count_towards_the_budget():
+    run_wave = Waves({SPECIFIC: [profile("a"), profile("b")], BROAD: [profile("c")]})
+    exclude = {canonical_profile_url(profile("a")["link"])}
+    plan = plan_search([SPECIFIC, BROAD], run_wave, budget=2, wave_size=1, exclude=exclude)
+
+    assert [item["title"] for _idx, _dork, item in plan["results"]] == ["b", "c"]
+    assert plan["stats"]["waves"] == 2
@@ -0,0 +1,114 @@
+# users/{id} holds only what request paths read: tokens, counters and flags.
+# Large free text (the extracted resume, additional details) lives in
+# users/{id}/profile/resume, which nothing on a hot path touches.
+# emails/{email} maps each registered address to its user id, so login is one get.
+
+import os
+
+import clients
+import resilience
+
+# Look up users missing from the email index with a query on users.email (and index them).
+# Turn off once migrate_email_index.py has backfilled every user.
+EMAIL_INDEX_FALLBACK = os.environ.get("EMAIL_INDEX_FALLBACK", "true").lower() == "true"
+
+EMAIL_INDEX_COLLECTION = "emails"
+PROFILE_COLLECTION = "profile"
+PROFILE_DOCUMENT = "resume"
+# Fields that go to the profile document instead of the user document
+PROFILE_FIELDS = ("resume_text", "additional_details")
+
+# Field masks for projected reads of users/{id}
+CREDENTIAL_FIELDS = ["access_token", "refresh_token", "token_expiry"]
+SESSION_FIELDS = ["profile_completed", "joined_waitlist"]
+QUOTA_FIELDS = ["searches", "searches_leased_until"]
+RESUME_JOB_FIELDS = ["resume_job_id", "resume_status"]
+
+
+class SignupConflict(Exception):
+    """The email is already registered, or the username is taken."""
+
+    def __init__(self, field: str):
+        super().__init__(f"{field} already registered")
+        self.field = field
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
+
+
+def user_ref(db, user_id: str):
+    return db.collection("users").document(user_id)
+
+
+def email_ref(db, email: str):
+    # Document ids can't contain "/"; addresses practically never do, but keep them distinct if one does
+    return db.collection(EMAIL_INDEX_COLLECTION).document(normalize_email(email).replace("/", "%2F"))
+
+
+def profile_ref(db, user_id: str):
+    return user_ref(db, user_id).collection(PROFILE_COLLECTION).document(PROFILE_DOCUMENT)
+
+
+def split_profile(fields: dict) -> tuple:
+    """(user document fields, profile document fields)."""
+    user_fields = {k: v for k, v in fields.items() if k not in PROFILE_FIELDS}
+    profile_fields = {k: v for k, v in fields.items() if k in PROFILE_FIELDS}
+    return user_fields, profile_fields
+
+
+def save_profile(db, user_id: str, fields: dict):
+    """Merge profile fields into the user and profile documents in one batch (no read first)."""
+    user_fields, profile_fields = split_profile(fields)
+    batch = db.batch()
+    if user_fields:
+        batch.set(user_ref(db, user_id), user_fields, merge=True)
+    if profile_fields:
+        batch.set(profile_ref(db, user_id), profile_fields, merge=True)
+    resilience.call("firestore", lambda: batch.commit(timeout=clients.FIRESTORE_TIMEOUT), idempotent=True)
+
+
+def find_user_id(db, email: str, fallback_query: bool = None):
+    """The user id registered for an email: one get on the index, or None.
+
+    Users created before the index existed are found with a query on users.email
+    and added to the index on the way, unless fallback_query is off.
+    """
+    snapshot = resilience.call("firestore", lambda: email_ref(db, email).get(timeout=clients.FIRESTORE_TIMEOUT),
+                               idempotent=True)
+    if snapshot.exists:
+        return snapshot.get("user_id")
+    if not (EMAIL_INDEX_FALLBACK if fallback_query is None else fallback_query):
+        return None
+    normalized = normalize_email(email)
+    # Older login code looked emails up as Gmail returned them, so try that spelling too
+    for candidate in dict.fromkeys((normalized, email)):
+        query = db.collection("users").where("email", "==", candidate).select(["email"]).limit(1)
+        docs = resilience.call("firestore", lambda: list(query.stream(timeout=clients.FIRESTORE_TIMEOUT)),
+                               idempotent=True)
+        if docs:
+            resilience.call("firestore", lambda: email_ref(db, email).set(
+                {"user_id": docs[0].id}, timeout=clients.FIRESTORE_TIMEOUT), idempotent=True)
+            return docs[0].id
+    return None
+
+
+def create_user(db, user_id: str, email: str, fields: dict):
+    """Create users/{user_id} and its emails/{email} entry atomically. Raises SignupConflict."""
+    from google.cloud import firestore
+
+    index = email_ref(db, email)
+    user = user_ref(db, user_id)
+
+    @firestore.transactional
+    def create(transaction):
+        if index.get(transaction=transaction, timeout=clients.FIRESTORE_TIMEOUT).exists:
+            raise SignupConflict("email")
+        if user.get(field_paths=["email"], transaction=transaction, timeout=clients.FIRESTORE_TIMEOUT).exists:
+            raise SignupConflict("username")
+        transaction.set(index, {"user_id": user_id})
+        transaction.set(user, {**fields, "email": normalize_email(email)})
+
+    # Begin and commit take no deadline, so bound the whole transaction. Not retried: a
+    # timed-out attempt may have committed, and a retry would report the email as taken
+    resilience.call("firestore", lambda: create(db.transaction()), timeout=clients.FIRESTORE_TIMEOUT)
@@ -16,6 +16,9 @@ const Login = () => {
     if (err === 'email_already_registered') {
       setUrlError('This email is already registered. Please log in.');
     }
+    if (err === 'username_taken') {
+      setUrlError('That name is already taken. Please try a different one.');
+    }
     if (params.get('flow') === 'signup') {
       setUrlError('No account found. Please sign up first!');
     }